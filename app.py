@@ -2,16 +2,17 @@
 # Thermoteq Management System (TMS)
 # Main Entry Point: app.py
 # Modified to load users from PostgreSQL via Supabase
-# Uses bcrypt to hash plain-text passwords
+# (pooled connections, see tms/db.py)
+# Plain-text passwords are bcrypt-hashed once and persisted
 # Author: Thermoteq Technologies
 # ==========================================================
 
-import os
 import streamlit as st
 import streamlit_authenticator as stauth
-import psycopg2
-import psycopg2.extras
-import bcrypt
+
+from tms import auth, config, metrics, sessions, users
+
+metrics.install()  # already done by server.py; covers `streamlit run app.py`
 
 # ==========================================================
 # --- PAGE CONFIGURATION ---
@@ -22,87 +23,50 @@ st.set_page_config(
     layout="wide"
 )
 
+# Signed in (from the login cookie) and back where the user was, also
+# after reconnecting to another server process; see tms/sessions.py
+sessions.sync()
+
 # ==========================================================
 # --- LOAD USERS FROM DATABASE ---
+# Cached across sessions (see tms/users.py); plain-text passwords
+# are hashed and written back once, not on every rerun.
 # ==========================================================
-def load_users_from_db():
-    try:
-        # Read the full connection string from environment variable
-        DATABASE_URL = os.getenv("DATABASE_URL")
-        if not DATABASE_URL:
-            st.error("⚠️ DATABASE_URL environment variable not set.")
-            st.stop()
-
-        conn = psycopg2.connect(DATABASE_URL)
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-
-        # Only select columns that exist
-        cur.execute("""
-            SELECT
-                username,
-                password_hash,
-                role
-            FROM users;
-        """)
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
-        return rows
-    except Exception as e:
-        st.error(f"⚠️ Could not connect to PostgreSQL: {e}")
-        st.stop()
-
-db_users = load_users_from_db()
-
-# ==========================================================
-# --- CONVERT DB DATA TO STREAMLIT-AUTHENTICATOR FORMAT ---
-# ==========================================================
-credentials = {"usernames": {}}
-plain_users = []
-
-for row in db_users:
-    username = row["username"]
-    password = row["password_hash"] or ""
-    role = row["role"] or "user"
-    name = username  # fallback, since your table has no separate name column
-
-    if username:
-        if password.startswith("$2"):  # already hashed
-            credentials["usernames"][username] = {
-                "name": name,
-                "password": password,
-                "role": role,
-            }
-        else:
-            # collect plain-text passwords to hash individually
-            plain_users.append((username, name, role, password))
-
-# Hash plain-text passwords individually using bcrypt
-for username, name, role, plain_password in plain_users:
-    hashed = bcrypt.hashpw(plain_password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
-    credentials["usernames"][username] = {
-        "name": name,
-        "password": hashed,
-        "role": role,
-    }
+try:
+    credentials = users.load_credentials()
+except Exception as e:
+    st.error(f"⚠️ Could not connect to PostgreSQL: {e}")
+    st.stop()
 
 # ==========================================================
 # --- AUTHENTICATION SETUP ---
 # ==========================================================
+# login_sleep_time: the authenticator otherwise sleeps 0.7 s on every
+# signed-out run, waiting for a browser-side cookie component; the
+# cookie it restores from is read server-side from the request.
+# cookie_key signs the cookie; tms/web.py and tms/sessions.py check it
+# with the same TMS_COOKIE_KEY in every server process.
 authenticator = stauth.Authenticate(
     credentials,
-    cookie_name="tms_cookie",
-    key=os.environ.get("TMS_COOKIE_KEY", "abcdef"),
-    cookie_expiry_days=30
+    cookie_name=config.COOKIE_NAME,
+    cookie_key=config.COOKIE_KEY,
+    cookie_expiry_days=config.COOKIE_EXPIRY_DAYS,
+    login_sleep_time=0,
 )
 
 # ==========================================================
 # --- LOGIN FORM & AUTH STATUS ---
+# The authenticator only restores sessions from its cookie; the
+# password itself is checked by tms/auth.py (bounded bcrypt pool,
+# rate limits, hash upgrades) instead of on this script thread.
 # ==========================================================
 if "authentication_status" not in st.session_state:
     st.session_state["authentication_status"] = None
 
-if st.session_state["authentication_status"] in [None, False]:
+if not st.session_state["authentication_status"]:
+    authenticator.login(location="unrendered")
+
+if not st.session_state["authentication_status"]:
     st.markdown("""
         <style>
         .css-18e3th9 {padding-top: 2rem;}
@@ -112,9 +76,26 @@ if st.session_state["authentication_status"] in [None, False]:
     st.title("🔐 Thermoteq Management System Login")
     st.markdown("Please enter your username and password below to access the system.")
     st.markdown("---")
-    authenticator.login(location="main")
-else:
-    authenticator.login(location="main")
+    with st.form("Login"):
+        st.subheader("Login")
+        login_username = st.text_input("Username", autocomplete="off")
+        login_password = st.text_input("Password", type="password", autocomplete="off")
+        login_submitted = st.form_submit_button("Login")
+    if login_submitted and login_username:
+        try:
+            user = auth.login(login_username, login_password, auth.client_ip())
+        except auth.RateLimited as e:
+            st.error(f"⏳ Too many login attempts. Please try again in {e.retry_after} seconds.")
+        except auth.Busy:
+            st.error("⏳ The server is busy. Please try again in a moment.")
+        else:
+            if user:
+                st.session_state["name"] = user["name"]
+                st.session_state["username"] = user["name"]  # as stored, whatever case was typed
+                st.session_state["authentication_status"] = True
+                authenticator.cookie_controller.set_cookie()
+            else:
+                st.session_state["authentication_status"] = False
 
 # Extract login state
 name = st.session_state.get("name")
@@ -123,7 +104,7 @@ username = st.session_state.get("username")
 
 # Set user role if authenticated
 if authentication_status:
-    user_role = credentials["usernames"].get(username, {}).get("role", "user")
+    user_role = (users.find_user(username) or {}).get("role", "user")
     st.session_state["user_role"] = user_role
 else:
     st.session_state["user_role"] = None
@@ -161,6 +142,7 @@ else:
         st.page_link("pages/Images_Posters.py", label="🖼️ Images & Posters")
         st.page_link("pages/Admin_Panel.py", label="⚙️ Admin Panel")
         st.page_link("pages/Projects.py", label="🧩 My Projects")
+        st.page_link("pages/Document_Search.py", label="🔎 Document Search")
 
 # ==========================================================
 # --- DASHBOARD CONTENT ---
@@ -0,0 +1 @@
+# Benchmark suite for TMS; run ``python -m bench --help``.
@@ -0,0 +1,501 @@
+# ==========================================================
+# Thermoteq Management System (TMS)
+# Benchmark suite: synthetic data + headless page renders
+#
+# Usage (from the repository root):
+#   python -m bench run --database-url postgresql://.../tms_bench [--scale small,medium]
+#   python -m bench run --pgserver /tmp/tms-bench-pg   (throwaway server; pip install pgserver)
+#   python -m bench compare bench/results/A.json bench/results/B.json
+#   python -m bench load --pgserver /tmp/tms-bench-pg --sessions 1,10,25 --duration 60
+#   python -m bench startup --pgserver /tmp/tms-bench-pg --repeat 5
+#   python -m bench cluster --pgserver /tmp/tms-bench-pg --processes 3 --sessions 10,25 --restart-after 20
+#
+# "run" EMPTIES the database it is given (see bench/datagen.py), so
+# it only takes an explicit --database-url / TMS_BENCH_DATABASE_URL,
+# never DATABASE_URL. Results are written to bench/results/ as JSON,
+# named after the commit, for "compare".
+#
+# "load" seeds the same data, starts `streamlit run server.py` on a
+# free local port and drives it with simulated browser sessions
+# (bench/load.py) at each concurrency level; --url targets a server
+# that is already running instead (seeded with the same scale).
+#
+# "startup" starts a fresh server --repeat times and measures how long
+# until it listens and until one user has seen the login page, signed
+# in and opened the File Manager, Projects and Admin Panel pages.
+#
+# "cluster" runs the load test against --processes server processes
+# behind the local load balancer of bench/proxy.py, all sharing one
+# database and data directory; --restart-after restarts the first
+# process that many seconds into each level, so its sessions have to
+# carry on in the others.
+# ==========================================================
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import resource
+import secrets
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "bench" / "results"
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _configure(database_url, data_dir):
+    # tms/config.py reads the environment once, at import
+    data_dir = Path(data_dir).resolve()
+    os.environ.update({
+        "DATABASE_URL": database_url,
+        "TMS_UPLOAD_DIR": str(data_dir / "uploads"),
+        "TMS_PROJECTS_DIR": str(data_dir / "projects"),
+        "TMS_BLOB_DIR": str(data_dir / "blobs"),
+        "TMS_TRASH_DIR": str(data_dir / "trash"),
+        "TMS_PREVIEW_CACHE_DIR": str(data_dir / "cache" / "pdf_pages"),
+        "TMS_METRICS": "1",
+        # The load test's sessions send their own X-Forwarded-For, directly
+        # or through bench/proxy.py, both from this machine
+        "TMS_TRUSTED_PROXIES": "127.0.0.1,::1",
+    })
+    os.chdir(ROOT)  # pages open assets/ and each other by relative path
+    sys.path.insert(0, str(ROOT))
+
+
+def _database_url(args):
+    if args.pgserver:
+        try:
+            import pgserver
+        except ImportError:
+            sys.exit("--pgserver needs the pgserver package (pip install pgserver).")
+        return pgserver.get_server(args.pgserver).get_uri()
+    url = args.database_url or os.environ.get("TMS_BENCH_DATABASE_URL")
+    if not url:
+        sys.exit("Give the benchmark its own database: --database-url, TMS_BENCH_DATABASE_URL or --pgserver.")
+    return url
+
+
+def _describe():
+    import streamlit
+
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "streamlit": streamlit.__version__,
+        "cpus": os.cpu_count(),
+    }
+
+
+def _write(result, output, prefix=""):
+    output = Path(output) if output else (
+        RESULTS_DIR / f"{prefix}{datetime.now():%Y%m%d-%H%M%S}-{(result['commit'] or 'nogit')[:8]}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2) + "\n", encoding="utf-8")
+    print(f"Results written to {output}")
+
+
+def run(args):
+    _configure(_database_url(args), args.data_dir)
+
+    from tms import db, metrics
+    from bench import datagen, scenarios
+
+    metrics.install()
+    wanted = args.scenarios.split(",") if args.scenarios else None
+    chosen = [s for s in scenarios.SCENARIOS if wanted is None or s.name in wanted]
+    with db.get_cursor() as cur:
+        cur.execute("SHOW server_version;")
+        server_version = cur.fetchone()[0]
+
+    result = {
+        **_describe(),
+        "postgres": server_version,
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "scales": {},
+    }
+    for scale in args.scale.split(","):
+        start = time.perf_counter()
+        counts = datagen.generate(scale, seed=args.seed)
+        generated = time.perf_counter() - start
+        print(f"{scale}: {counts} in {generated:.1f}s")
+        with db.get_cursor() as cur:
+            cur.execute("SELECT user_id FROM users WHERE username = %s;", (datagen.ADMIN_USERNAME,))
+            admin_id = cur.fetchone()[0]
+
+        measured = {}
+        for scenario in chosen:
+            stats = scenarios.run(scenario, admin_id, repeat=args.repeat, memory=not args.no_memory)
+            measured[scenario.name] = stats
+            warm = stats["warm_ms"] or {}
+            print(f"  {scenario.name:<22} cold {stats['cold_ms']:>9.1f} ms   "
+                  f"warm p50 {warm.get('p50', 0):>8.1f} ms   {stats['queries']:>3} queries"
+                  + (f"   {len(stats['errors'])} error(s)" if stats["errors"] else ""))
+        result["scales"][scale] = {
+            "params": datagen.SCALES[scale],
+            "rows": counts,
+            "generate_seconds": round(generated, 2),
+            "scenarios": measured,
+        }
+    # ru_maxrss is in KB on Linux: the whole run's peak, all scales
+    result["peak_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    _write(result, args.output)
+    if args.pgserver:
+        # The throwaway server stops at exit, under the LISTEN connection
+        logging.getLogger("tms.querycache").setLevel(logging.CRITICAL)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_healthy(process, url, log_path, timeout, poll):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url + "_stcore/health", timeout=5):
+                return
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                sys.exit(f"The server did not start; see {log_path}")
+            time.sleep(poll)
+
+
+def _start_server(log_path, timeout=120, poll=0.5, port=None):
+    """`streamlit run server.py` on ``port`` or a free local one; returns (process, url)."""
+    log_file = open(log_path, "a" if port else "w")  # a restart keeps the log
+    port = port or _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", "server.py", "--server.port", str(port),
+         "--server.address", "127.0.0.1", "--server.headless", "true",
+         "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false"],
+        cwd=ROOT, stdout=log_file, stderr=subprocess.STDOUT,
+    )
+    log_file.close()
+    url = f"http://127.0.0.1:{port}/"
+    _wait_healthy(server, url, log_path, timeout, poll)
+    return server, url
+
+
+def _stop_server(server):
+    server.terminate()
+    try:
+        server.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def _print_level(summary):
+    runs = summary["latency_ms"]["all_runs"] or {}
+    rss = summary["server_rss_mb"] or {}
+    print(f"  {summary['sessions']:>4} sessions  {summary['journeys_per_s']:>6.2f} journeys/s  "
+          f"{summary['runs_per_s']:>6.2f} runs/s  p50 {runs.get('p50', 0):>7.0f}  "
+          f"p95 {runs.get('p95', 0):>7.0f}  p99 {runs.get('p99', 0):>7.0f} ms  "
+          f"{sum(summary['errors'].values()):>3} errors  RSS peak {rss.get('peak', 0):>6.0f} MB")
+
+
+def load(args):
+    server = None
+    if args.url:
+        url, server_pid = args.url, args.server_pid
+    else:
+        _configure(_database_url(args), args.data_dir)
+    from bench import datagen, load as load_test
+
+    if not args.url:
+        if not args.keep_data:
+            print(f"{args.scale}: {datagen.generate(args.scale, seed=args.seed)}")
+        log_path = Path(args.data_dir) / "server.log"
+        server, url = _start_server(log_path)
+        server_pid = server.pid
+        print(f"Server running at {url} (log: {log_path})")
+
+    journeys = args.journeys.split(",") if args.journeys else list(load_test.JOURNEYS)
+    result = {
+        **_describe(),
+        "scale": args.scale,
+        "params": datagen.SCALES[args.scale],
+        "duration": args.duration,
+        "ramp": args.ramp,
+        "think": args.think,
+        "journeys": journeys,
+        "levels": [],
+    }
+    try:
+        for sessions in (int(n) for n in args.sessions.split(",")):
+            summary = asyncio.run(load_test.run_level(
+                url, sessions, args.duration, datagen.usernames(args.scale), journeys,
+                think=args.think, ramp=args.ramp, server_pids=[server_pid] if server_pid else [], seed=args.seed,
+            ))
+            result["levels"].append(summary)
+            _print_level(summary)
+    finally:
+        if server is not None:
+            _stop_server(server)
+    _write(result, args.output, prefix="load-")
+    if args.pgserver:
+        logging.getLogger("tms.querycache").setLevel(logging.CRITICAL)
+
+
+def _script_runs_per_process():
+    from tms import instances
+
+    return {
+        row["instance_id"]: sum(h[3] for h in row["metrics"].get("histograms", []) if h[0] == "tms_script_run_seconds")
+        for row in instances.live()
+    }
+
+
+def cluster(args):
+    _configure(_database_url(args), args.data_dir)
+    # What every server process must share (see server.py); the
+    # heartbeat is shortened so the per-process figures are current
+    os.environ.setdefault("TMS_COOKIE_KEY", secrets.token_hex(32))
+    os.environ.setdefault("STREAMLIT_SERVER_COOKIE_SECRET", secrets.token_hex(32))
+    os.environ["TMS_INSTANCE_HEARTBEAT_INTERVAL"] = "2"
+    from bench import datagen, load as load_test
+
+    if not args.keep_data:
+        print(f"{args.scale}: {datagen.generate(args.scale, seed=args.seed)}")
+    data_dir = Path(args.data_dir)
+    servers, ports = [], []
+    proxy = None
+    try:
+        for n in range(args.processes):
+            server, url = _start_server(data_dir / f"server-{n + 1}.log")
+            servers.append(server)
+            ports.append(int(url.rstrip("/").rsplit(":", 1)[1]))
+        proxy_port = _free_port()
+        with open(data_dir / "proxy.log", "w") as log_file:
+            proxy = subprocess.Popen(
+                [sys.executable, "-m", "bench.proxy", "--port", str(proxy_port),
+                 *(f"127.0.0.1:{port}" for port in ports)],
+                cwd=ROOT, stdout=log_file, stderr=subprocess.STDOUT,
+            )
+        url = f"http://127.0.0.1:{proxy_port}/"
+        _wait_healthy(proxy, url, data_dir / "proxy.log", timeout=30, poll=0.1)
+        print(f"{args.processes} server processes on ports {', '.join(map(str, ports))} behind {url}")
+
+        result = {
+            **_describe(),
+            "scale": args.scale,
+            "params": datagen.SCALES[args.scale],
+            "processes": args.processes,
+            "duration": args.duration,
+            "restart_after": args.restart_after,
+            "levels": [],
+        }
+        pids = [server.pid for server in servers]
+
+        async def restart_first():
+            await asyncio.sleep(args.ramp + args.restart_after)
+            print(f"  restarting the server on port {ports[0]} ...")
+            await asyncio.to_thread(_stop_server, servers[0])
+            servers[0], _ = await asyncio.to_thread(_start_server, data_dir / "server-1.log", port=ports[0])
+            pids[0] = servers[0].pid
+
+        async def level(sessions):
+            restart = asyncio.create_task(restart_first()) if args.restart_after is not None else None
+            summary = await load_test.run_level(
+                url, sessions, args.duration, datagen.usernames(args.scale), think=args.think, ramp=args.ramp,
+                server_pids=pids, seed=args.seed,
+            )
+            if restart is not None:
+                await restart
+            return summary
+
+        for sessions in (int(n) for n in args.sessions.split(",")):
+            summary = asyncio.run(level(sessions))
+            time.sleep(3)  # a heartbeat from every process
+            summary["script_runs_per_process"] = _script_runs_per_process()
+            result["levels"].append(summary)
+            _print_level(summary)
+            print(f"        {summary['reconnects']} reconnects; script runs per process since start: "
+                  + ", ".join(f"{name} {runs}" for name, runs in summary["script_runs_per_process"].items()))
+    finally:
+        if proxy is not None:
+            proxy.terminate()
+            proxy.wait()
+        for server in servers:
+            _stop_server(server)
+    _write(result, args.output, prefix="cluster-")
+    if args.pgserver:
+        logging.getLogger("tms.querycache").setLevel(logging.CRITICAL)
+
+
+def startup(args):
+    _configure(_database_url(args), args.data_dir)
+    from bench import datagen, load as load_test
+
+    if not args.keep_data:
+        print(f"{args.scale}: {datagen.generate(args.scale, seed=args.seed)}")
+    log_path = Path(args.data_dir) / "server.log"
+    starts = []
+    for n in range(args.repeat):
+        start = time.perf_counter()
+        server, url = _start_server(log_path, poll=0.02)
+        listening = time.perf_counter() - start
+        try:
+            steps = asyncio.run(load_test.first_visit(url, datagen.ADMIN_USERNAME, datagen.PASSWORD))
+        finally:
+            _stop_server(server)
+        # From starting the process until the login page is on screen
+        first_render = listening + steps["connect"] + steps["login.page"]
+        starts.append({"listening": listening, "first_render": first_render, **steps})
+        print(f"  start {n + 1}: listening {listening * 1000:>6.0f} ms   first render {first_render * 1000:>6.0f} ms   "
+              + "   ".join(f"{name} {seconds * 1000:.0f}" for name, seconds in steps.items()
+                         if name not in ("connect", "login.page")))
+
+    median_ms = {name: round(statistics.median(s[name] for s in starts) * 1000, 1) for name in starts[0]}
+    print("  median: " + "   ".join(f"{name} {ms:.0f} ms" for name, ms in median_ms.items()))
+    result = {
+        **_describe(),
+        "scale": args.scale,
+        "params": datagen.SCALES[args.scale],
+        "median_ms": median_ms,
+        "starts_ms": [{name: round(seconds * 1000, 1) for name, seconds in s.items()} for s in starts],
+    }
+    _write(result, args.output, prefix="startup-")
+    if args.pgserver:
+        logging.getLogger("tms.querycache").setLevel(logging.CRITICAL)
+
+
+def _change(old, new):
+    if old is None or new is None:
+        return ""
+    if not old:
+        return "" if not new else "   new"
+    return f"{(new - old) / old * 100:+7.1f}%"
+
+
+def _fmt(value):
+    return "-" if value is None else f"{value:.1f}"
+
+
+def compare(args):
+    before = json.loads(Path(args.before).read_text(encoding="utf-8"))
+    after = json.loads(Path(args.after).read_text(encoding="utf-8"))
+    print(f"before: {(before['commit'] or '?')[:8]}{' (dirty)' if before['dirty'] else ''}  {before['created_at']}")
+    print(f"after:  {(after['commit'] or '?')[:8]}{' (dirty)' if after['dirty'] else ''}  {after['created_at']}")
+    for scale, results in after["scales"].items():
+        old_results = before["scales"].get(scale)
+        if old_results is None:
+            continue
+        print(f"\n[{scale}]")
+        print(f"  {'scenario':<22} {'metric':<14} {'before':>12} {'after':>12} {'change':>9}")
+        for name, stats in results["scenarios"].items():
+            old = old_results["scenarios"].get(name)
+            if old is None:
+                continue
+            for label, getter in (
+                ("cold ms", lambda s: s["cold_ms"]),
+                ("warm p50 ms", lambda s: (s["warm_ms"] or {}).get("p50")),
+                ("queries", lambda s: s["queries"]),
+                ("peak KB", lambda s: s["peak_traced_bytes"] and s["peak_traced_bytes"] / 1024),
+            ):
+                a, b = getter(old), getter(stats)
+                print(f"  {name:<22} {label:<14} {_fmt(a):>12} {_fmt(b):>12} {_change(a, b):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench", description="TMS benchmark suite.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="generate data and measure every scenario")
+    run_parser.add_argument("--scale", default="small",
+                            help="comma-separated: small, medium, large (default: small)")
+    run_parser.add_argument("--database-url", help="a database the benchmark may empty")
+    run_parser.add_argument("--pgserver", metavar="DIR", help="start a throwaway PostgreSQL in DIR instead")
+    run_parser.add_argument("--data-dir", default=str(ROOT / "bench" / "data"),
+                            help="where uploads/, projects/ and blobs/ are generated")
+    run_parser.add_argument("--scenarios", help="comma-separated subset of the scenarios")
+    run_parser.add_argument("--repeat", type=int, default=5, help="warm runs per scenario (default: 5)")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    run_parser.add_argument("--output", help="result file (default: bench/results/<time>-<commit>.json)")
+    run_parser.set_defaults(func=run)
+
+    load_parser = commands.add_parser("load", help="simulated browser sessions against a local server")
+    load_parser.add_argument("--scale", default="small", choices=["small", "medium", "large"])
+    load_parser.add_argument("--database-url", help="a database the benchmark may empty")
+    load_parser.add_argument("--pgserver", metavar="DIR", help="start a throwaway PostgreSQL in DIR instead")
+    load_parser.add_argument("--data-dir", default=str(ROOT / "bench" / "data"),
+                             help="where uploads/, projects/ and blobs/ are generated")
+    load_parser.add_argument("--keep-data", action="store_true", help="reuse the data already generated")
+    load_parser.add_argument("--url", help="test this running server instead of starting one")
+    load_parser.add_argument("--server-pid", type=int, help="with --url: process whose RSS to sample")
+    load_parser.add_argument("--sessions", default="1,5,10,25",
+                             help="comma-separated concurrency levels (default: 1,5,10,25)")
+    load_parser.add_argument("--duration", type=float, default=60, help="seconds per level after ramp-up")
+    load_parser.add_argument("--ramp", type=float, default=5, help="seconds over which sessions start")
+    load_parser.add_argument("--think", type=float, default=1.0, help="mean pause between journeys, seconds")
+    load_parser.add_argument("--journeys", help="comma-separated subset of the journeys")
+    load_parser.add_argument("--seed", type=int, default=0)
+    load_parser.add_argument("--output", help="result file (default: bench/results/load-<time>-<commit>.json)")
+    load_parser.set_defaults(func=load)
+
+    startup_parser = commands.add_parser("startup", help="time a fresh server's first page loads")
+    startup_parser.add_argument("--scale", default="small", choices=["small", "medium", "large"])
+    startup_parser.add_argument("--database-url", help="a database the benchmark may empty")
+    startup_parser.add_argument("--pgserver", metavar="DIR", help="start a throwaway PostgreSQL in DIR instead")
+    startup_parser.add_argument("--data-dir", default=str(ROOT / "bench" / "data"),
+                                help="where uploads/, projects/ and blobs/ are generated")
+    startup_parser.add_argument("--keep-data", action="store_true", help="reuse the data already generated")
+    startup_parser.add_argument("--repeat", type=int, default=5, help="server starts to measure (default: 5)")
+    startup_parser.add_argument("--seed", type=int, default=0)
+    startup_parser.add_argument("--output", help="result file (default: bench/results/startup-<time>-<commit>.json)")
+    startup_parser.set_defaults(func=startup)
+
+    cluster_parser = commands.add_parser("cluster", help="load test several server processes behind a local proxy")
+    cluster_parser.add_argument("--scale", default="small", choices=["small", "medium", "large"])
+    cluster_parser.add_argument("--database-url", help="a database the benchmark may empty")
+    cluster_parser.add_argument("--pgserver", metavar="DIR", help="start a throwaway PostgreSQL in DIR instead")
+    cluster_parser.add_argument("--data-dir", default=str(ROOT / "bench" / "data"),
+                                help="where uploads/, projects/ and blobs/ are generated")
+    cluster_parser.add_argument("--keep-data", action="store_true", help="reuse the data already generated")
+    cluster_parser.add_argument("--processes", type=int, default=3, help="server processes (default: 3)")
+    cluster_parser.add_argument("--sessions", default="10,25",
+                                help="comma-separated concurrency levels (default: 10,25)")
+    cluster_parser.add_argument("--duration", type=float, default=60, help="seconds per level after ramp-up")
+    cluster_parser.add_argument("--ramp", type=float, default=5, help="seconds over which sessions start")
+    cluster_parser.add_argument("--think", type=float, default=1.0, help="mean pause between journeys, seconds")
+    cluster_parser.add_argument("--restart-after", type=float, metavar="SECONDS",
+                                help="restart the first server process this long into each level")
+    cluster_parser.add_argument("--seed", type=int, default=0)
+    cluster_parser.add_argument("--output", help="result file (default: bench/results/cluster-<time>-<commit>.json)")
+    cluster_parser.set_defaults(func=cluster)
+
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+# ==========================================================
+# --- SYNTHETIC DATA ---
+# Fills an empty database and data directory with a deterministic
+# dataset of a given scale (same scale + seed = same rows and bytes):
+#
+#   users      one admin ("bench_admin") plus ordinary accounts
+#   files      company files in uploads/, uploaded over two years
+#   projects   projects/<name>/<folder>/ with the four standard folders
+#   blobs      a fixed pool of contents that every file links to, so
+#              the dataset dedupes the way real uploads do and the
+#              bytes on disk stay bounded at every scale; .pdf files
+#              are real PDFs, so previews render
+#
+# Rows are written in batches straight into the tables (the storage
+# usage triggers still run); the project index is then brought in line
+# by catalog.reconcile(), as the watcher would after a deploy.
+# ==========================================================
+
+import hashlib
+import os
+import random
+import shutil
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import bcrypt
+from psycopg2.extras import execute_values
+
+from tms import catalog, config, db, migrations, storage
+
+SCHEMA = Path(__file__).with_name("schema.sql")
+ADMIN_USERNAME = "bench_admin"
+PASSWORD = "bench-password"
+
+SCALES = {
+    "small": {"users": 25, "files": 1_000, "projects": 20, "files_per_folder": 5, "blobs": 300},
+    "medium": {"users": 250, "files": 10_000, "projects": 200, "files_per_folder": 10, "blobs": 2_000},
+    "large": {"users": 1_000, "files": 100_000, "projects": 1_000, "files_per_folder": 10, "blobs": 5_000},
+}
+
+TABLES = [
+    "files", "users", "projects", "project_files", "project_folders", "blobs", "document_text",
+    "storage_orphans", "storage_usage", "project_usage", "storage_usage_daily", "jobs",
+]
+EXTENSIONS = [".pdf", ".pdf", ".pdf", ".docx", ".xlsx", ".jpg", ".png", ".dwg"]
+WORDS = [
+    "quote", "invoice", "drawing", "site", "report", "panel", "roof", "floor", "office", "mine",
+    "camp", "kitchen", "ablution", "container", "prefab", "layout", "revision", "survey", "order", "spec",
+]
+START = datetime(2024, 1, 1)
+SPAN_SECONDS = 2 * 365 * 24 * 3600
+BATCH = 1000
+
+
+def usernames(scale):
+    """The accounts generate() creates for ``scale`` (all with PASSWORD)."""
+    return [ADMIN_USERNAME] + [f"user{n:04d}" for n in range(1, SCALES[scale]["users"])]
+
+
+class NotABenchDatabase(RuntimeError):
+    """Raised instead of emptying a database that holds someone's data."""
+
+
+def _prepare_database(cur):
+    cur.execute(SCHEMA.read_text(encoding="utf-8"))
+    cur.execute("SELECT EXISTS (SELECT 1 FROM tms_bench), EXISTS (SELECT 1 FROM users);")
+    marked, has_users = cur.fetchone()
+    if has_users and not marked:
+        raise NotABenchDatabase(
+            "This database already has users and was not created by the benchmark; "
+            "point --database-url at an empty database."
+        )
+
+
+def _reset_data_dirs():
+    for directory in (config.UPLOAD_DIR, config.PROJECTS_DIR, config.BLOB_DIR, config.TRASH_DIR,
+                      config.PREVIEW_CACHE_DIR):
+        shutil.rmtree(directory, ignore_errors=True)
+        directory.mkdir(parents=True)
+
+
+def _file_name(rng, n):
+    return f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{n:06d}{rng.choice(EXTENSIONS)}"
+
+
+def pdf_bytes(title, pages=1):
+    """A small valid PDF with one line of text per page, byte-for-byte reproducible."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    text = title.replace("\\", "").replace("(", "").replace(")", "")
+    for page in range(1, pages + 1):
+        stream = f"BT /F1 24 Tf 72 770 Td ({text} - page {page}) Tj ET".encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), pages)
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def _store_blob(content):
+    sha256 = hashlib.sha256(content).hexdigest()
+    path = storage.blob_path(sha256)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return sha256, len(content)
+
+
+def _make_blobs(rng, count):
+    """Write ``count`` distinct contents to the blob store.
+
+    Returns {"pdf": [(sha256, size)], "other": [...]}: real PDFs of one
+    to twelve pages (so previews render), and for everything else
+    random bytes, log-normal around 8 KB with a 1 MB cap.
+    """
+    pools = {"pdf": [], "other": []}
+    for n in range(count):
+        if n % 8 < 3:
+            pools["pdf"].append(_store_blob(pdf_bytes(f"TMS bench document {n}", rng.randint(1, 12))))
+        else:
+            size = min(int(rng.lognormvariate(9, 1.2)), 1024 * 1024)
+            pools["other"].append(_store_blob(f"tms bench blob {n}\n".encode() + rng.randbytes(size)))
+    return pools
+
+
+def _pick(rng, pools, file_name):
+    pool = pools["pdf"] if file_name.endswith(".pdf") else pools["other"]
+    # A few contents are attached over and over (letterheads, catalogues)
+    return pool[min(int(rng.paretovariate(1.2)) - 1, len(pool) - 1)] if rng.random() < 0.3 else rng.choice(pool)
+
+
+def _insert_users(cur, names):
+    # One cheap hash for everyone: login cost is not what is measured here
+    password_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(rounds=4)).decode()
+    rows = [(name, password_hash, "admin" if n % 50 == 0 else "user") for n, name in enumerate(names)]
+    execute_values(cur, "INSERT INTO users (username, password_hash, role) VALUES %s;", rows, page_size=BATCH)
+    cur.execute("SELECT user_id FROM users ORDER BY user_id;")
+    return [row[0] for row in cur.fetchall()]
+
+
+def _insert_files(cur, rng, count, user_ids, pools):
+    rows = []
+    for n in range(count):
+        name = _file_name(rng, n)
+        uploaded_at = START + timedelta(seconds=rng.randrange(SPAN_SECONDS))
+        sha256, size = _pick(rng, pools, name)
+        path = config.UPLOAD_DIR / f"{uploaded_at:%Y%m%d%H%M%S}_{name}"
+        os.link(storage.blob_path(sha256), path)
+        rows.append((name, str(path), rng.choice(user_ids), uploaded_at, sha256, size))
+        if len(rows) == BATCH or n == count - 1:
+            execute_values(cur, """
+                INSERT INTO files (file_name, file_path, uploaded_by, uploaded_at, sha256, size_bytes) VALUES %s;
+            """, rows, page_size=BATCH)
+            rows = []
+
+
+def _insert_projects(cur, rng, count, files_per_folder, uploaders, pools):
+    clients = ["Barrick", "Geita", "Kibo", "Songwe", "Tanga", "Mwadui", "Dodoma", "Arusha"]
+    execute_values(cur, "INSERT INTO projects (name) VALUES %s;",
+                   [(f"P{n:04d} {rng.choice(clients)} {rng.choice(WORDS).title()}",) for n in range(count)],
+                   page_size=BATCH)
+    cur.execute("SELECT project_id, name FROM projects ORDER BY project_id;")
+    rows = []
+    for project_id, project_name in cur.fetchall():
+        for folder in config.PROJECT_FOLDERS:
+            folder_path = catalog.project_path(project_name) / folder
+            folder_path.mkdir(parents=True)
+            # Between 0 and twice the average per folder
+            for n in range(rng.randrange(2 * files_per_folder + 1)):
+                name = _file_name(rng, n)
+                sha256, size = _pick(rng, pools, name)
+                path = folder_path / name
+                os.link(storage.blob_path(sha256), path)
+                rows.append((project_id, folder, name, size, path.stat().st_mtime_ns, sha256,
+                             rng.choice(uploaders)))
+        if len(rows) >= BATCH:
+            _insert_project_files(cur, rows)
+            rows = []
+    _insert_project_files(cur, rows)
+
+
+def _insert_project_files(cur, rows):
+    if rows:
+        execute_values(cur, """
+            INSERT INTO project_files (project_id, folder, file_name, size_bytes, mtime_ns, sha256, uploaded_by)
+            VALUES %s ON CONFLICT DO NOTHING;
+        """, rows, page_size=BATCH)
+
+
+def generate(scale, seed=0, log=print):
+    """Replace the benchmark database and data directory with a fresh dataset.
+
+    Returns the number of rows written per table.
+    """
+    params = SCALES[scale]
+    rng = random.Random(f"{scale}:{seed}")
+    with db.get_cursor() as cur:
+        _prepare_database(cur)
+    migrations.apply_pending(log=log)
+
+    log(f"Generating the {scale} dataset ...")
+    _reset_data_dirs()
+    with db.get_cursor() as cur:
+        cur.execute(f"TRUNCATE {', '.join(TABLES)}, tms_bench RESTART IDENTITY CASCADE;")
+        pools = _make_blobs(rng, params["blobs"])
+        execute_values(cur, "INSERT INTO blobs (sha256, size_bytes) VALUES %s ON CONFLICT DO NOTHING;",
+                       pools["pdf"] + pools["other"], page_size=BATCH)
+        user_ids = _insert_users(cur, usernames(scale))
+        _insert_files(cur, rng, params["files"], user_ids, pools)
+        cur.execute("SELECT username FROM users ORDER BY user_id;")
+        names = [row[0] for row in cur.fetchall()]
+        _insert_projects(cur, rng, params["projects"], params["files_per_folder"], names, pools)
+        cur.execute("INSERT INTO tms_bench (scale, seed) VALUES (%s, %s);", (scale, seed))
+    # Records every folder's mtime, so the first page load finds nothing to rescan
+    catalog.reconcile()
+    with db.get_cursor() as cur:
+        cur.execute("ANALYZE;")
+        counts = {}
+        for table in ("users", "files", "projects", "project_files", "blobs"):
+            cur.execute(f"SELECT COUNT(*) FROM {table};")
+            counts[table] = cur.fetchone()[0]
+    return counts
@@ -0,0 +1,535 @@
+# ==========================================================
+# --- LOAD TEST ---
+# Simulated browsers for a running TMS server. Each session speaks
+# Streamlit's websocket protocol (/_stcore/stream, protobuf BackMsg /
+# ForwardMsg) the way the frontend does: it re-sends its widget
+# values with every rerun, uploads files over HTTP to the URLs the
+# server hands out, and fetches the images a page shows. Like a
+# browser it keeps the cookies it is given (by Set-Cookie or by the
+# login's cookie component), and when the server closes the websocket
+# it reconnects and repeats the run, so sessions survive a server
+# process going away behind a load balancer (see "cluster" in
+# bench/__main__.py).
+#
+# A session logs in through the login form as one of the seeded users
+# (bench/datagen.py), from an address of its own (X-Forwarded-For, so
+# the per-address login limit of tms/auth.py applies per session),
+# then replays journeys until the time is up:
+#
+#   browse_projects  Projects page, search, open one project
+#   browse_files     File Manager, next page
+#   preview_pdf      filter PDFs, open one, page through the preview
+#   upload           upload a small PDF from the File Manager
+#   delete           delete one of the session's own uploads
+#
+# Every script run is a step; run_level() reports throughput, latency
+# percentiles per step and the server's RSS for one concurrency level.
+# first_visit() times a single user's first page loads instead, for
+# measuring a freshly started server.
+# ==========================================================
+
+import asyncio
+import json
+import random
+import re
+import statistics
+import time
+import urllib.request
+import uuid
+from collections import Counter, defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urljoin
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+from bench import datagen
+
+EARLY_FOR_RERUN = ForwardMsg.ScriptFinishedStatus.Value("FINISHED_EARLY_FOR_RERUN")
+XSRF_COOKIE = "_streamlit_xsrf"
+IMG_SRC = re.compile(r'<img src="([^"]+)"')
+
+
+class ScriptError(Exception):
+    """A step whose page raised, or did not show what the journey needs."""
+
+
+class LoginFailed(ScriptError):
+    pass
+
+
+# ==========================================================
+# --- RESULTS ---
+# ==========================================================
+class Recorder:
+    """Step latencies, completed journeys and errors of one level."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)  # step -> [seconds]
+        self.journeys = Counter()
+        self.errors = Counter()
+        self.error_samples = {}
+        self.bytes_received = 0
+        self.reconnects = 0
+
+    def step(self, name, seconds):
+        self.latencies[name].append(seconds)
+
+    def error(self, name, exc):
+        self.errors[name] += 1
+        self.error_samples.setdefault(name, f"{type(exc).__name__}: {exc}"[:300])
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+
+def _latency_summary(seconds):
+    ordered = sorted(seconds)
+    return {
+        "count": len(ordered),
+        "p50": round(_percentile(ordered, 0.50) * 1000, 1),
+        "p95": round(_percentile(ordered, 0.95) * 1000, 1),
+        "p99": round(_percentile(ordered, 0.99) * 1000, 1),
+        "max": round(ordered[-1] * 1000, 1),
+    }
+
+
+# ==========================================================
+# --- BROWSER SESSION ---
+# ==========================================================
+class Session:
+    """One simulated browser tab connected to the server."""
+
+    def __init__(self, base_url, client_ip, recorder, timeout=120):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.client_ip = client_ip
+        self.recorder = recorder
+        self.timeout = timeout
+        self.pages = {}  # page name -> script hash
+        self.page_hash = ""
+        self.session_id = None
+        self.elements = []  # (kind, proto) shown by the last run
+        self.uploaded = []  # file names this session uploaded and has not deleted
+        self._widgets = {}  # widget id -> WidgetState sent with every rerun
+        self.cookies = {}
+        self._ws = None
+
+    # --- transport ---
+    def _keep_cookies(self, set_cookie_headers):
+        for header in set_cookie_headers:
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+
+    def _cookie_header(self):
+        return "; ".join(f"{name}={value}" for name, value in self.cookies.items())
+
+    def _http(self, method, path, body=None, headers=None):
+        request = urllib.request.Request(urljoin(self.base_url, path.lstrip("/")), data=body, method=method)
+        request.add_header("X-Forwarded-For", self.client_ip)
+        if self.cookies:
+            request.add_header("Cookie", self._cookie_header())
+        if XSRF_COOKIE in self.cookies:
+            request.add_header("X-Xsrftoken", self.cookies[XSRF_COOKIE])
+        for name, value in (headers or {}).items():
+            request.add_header(name, value)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            self._keep_cookies(response.headers.get_all("Set-Cookie") or [])
+            return response.read()
+
+    async def fetch(self, path):
+        data = await asyncio.to_thread(self._http, "GET", path)
+        self.recorder.bytes_received += len(data)
+        return data
+
+    async def open(self):
+        await self.fetch("_stcore/health")  # sets the XSRF cookie, as loading the page does
+        ws_url = "ws" + self.base_url[len("http"):] + "_stcore/stream"
+        self._ws = await websockets.connect(
+            ws_url, subprotocols=["streamlit"], max_size=None, open_timeout=self.timeout,
+            additional_headers={"X-Forwarded-For": self.client_ip, "Cookie": self._cookie_header()},
+        )
+        self._keep_cookies(self._ws.response.headers.get_all("Set-Cookie"))
+
+    async def reconnect(self, attempts=10):
+        """Open a new websocket after the server closed ours, as the frontend does."""
+        await self.close()
+        self.recorder.reconnects += 1
+        for attempt in range(attempts):
+            try:
+                await self.open()
+                return
+            except (OSError, websockets.WebSocketException):
+                if attempt == attempts - 1:
+                    raise
+                await asyncio.sleep(min(0.5 * 2 ** attempt, 5))
+
+    async def close(self):
+        if self._ws is not None:
+            await self._ws.close()
+
+    async def _receive(self):
+        data = await self._ws.recv()
+        self.recorder.bytes_received += len(data)
+        msg = ForwardMsg()
+        msg.ParseFromString(data)
+        return msg
+
+    # --- script runs ---
+    async def run(self, page=None):
+        """Rerun the current page, or switch to ``page``; returns seconds until it finished."""
+        if page is not None and self.pages.get(page) != self.page_hash:
+            if page not in self.pages:
+                raise ScriptError(f"no page named {page!r}")
+            self.page_hash = self.pages[page]
+            self._widgets.clear()
+        back_msg = BackMsg()
+        back_msg.rerun_script.query_string = ""
+        back_msg.rerun_script.page_script_hash = self.page_hash
+        back_msg.rerun_script.widget_states.widgets.extend(self._widgets.values())
+        # A click is sent once, like the frontend does
+        self._widgets = {
+            widget_id: state for widget_id, state in self._widgets.items()
+            if state.WhichOneof("value") != "trigger_value"
+        }
+        start = time.perf_counter()
+        try:
+            await self._ws.send(back_msg.SerializeToString())
+            errors = await asyncio.wait_for(self._read_run(), self.timeout)
+        except websockets.ConnectionClosed:
+            # The server process went away: the new one starts a fresh
+            # session, restored from the login cookie (tms/sessions.py)
+            await self.reconnect()
+            await self._ws.send(back_msg.SerializeToString())
+            errors = await asyncio.wait_for(self._read_run(), self.timeout)
+        elapsed = time.perf_counter() - start
+        if errors:
+            raise ScriptError(errors[0])
+        return elapsed
+
+    async def _read_run(self):
+        errors = []
+        while True:
+            msg = await self._receive()
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                # Every (re)run starts with one; the page is rebuilt from scratch
+                self.session_id = msg.new_session.initialize.session_id or self.session_id
+                self.page_hash = msg.new_session.page_script_hash or self.page_hash
+                self.elements, errors = [], []
+            elif kind == "navigation":
+                self.pages = {page.page_name: page.page_script_hash for page in msg.navigation.app_pages}
+            elif kind == "delta":
+                delta = msg.delta
+                if delta.WhichOneof("type") == "new_element":
+                    element_kind = delta.new_element.WhichOneof("type")
+                    element = getattr(delta.new_element, element_kind)
+                    self.elements.append((element_kind, element))
+                    if element_kind == "exception":
+                        errors.append(f"{element.type}: {element.message}")
+                    elif element_kind == "component_instance":
+                        self._run_cookie_component(element)
+                elif delta.WhichOneof("type") == "add_block" and delta.add_block.WhichOneof("type") == "expandable":
+                    self.elements.append(("expandable", delta.add_block))
+            elif kind == "script_finished" and msg.script_finished != EARLY_FOR_RERUN:
+                return errors
+
+    def _run_cookie_component(self, element):
+        # What the login's cookie manager component does in a browser
+        args = json.loads(element.json_args or "{}")
+        if args.get("method") == "set" and args.get("cookie"):
+            self.cookies[args["cookie"]] = str(args.get("value"))
+        elif args.get("method") == "delete" and args.get("cookie"):
+            self.cookies.pop(args["cookie"], None)
+
+    async def step(self, name, page=None):
+        self.recorder.step(name, await self.run(page))
+
+    # --- what the page shows ---
+    def find_all(self, kind, key_prefix=None, label=None):
+        found = []
+        for element_kind, element in self.elements:
+            if element_kind != kind:
+                continue
+            if key_prefix is not None and f"-{key_prefix}" not in getattr(element, "id", ""):
+                continue
+            if label is not None and getattr(element, "label", None) != label:
+                continue
+            found.append(element)
+        return found
+
+    def find(self, kind, key=None, label=None):
+        found = self.find_all(kind, key, label)
+        if not found:
+            raise ScriptError(f"page shows no {kind} {key or label or ''}".rstrip())
+        return found[0]
+
+    def alerts(self):
+        return [element.body for kind, element in self.elements if kind == "alert"]
+
+    # --- user input ---
+    def set_value(self, widget_id, field, value):
+        state = WidgetState(id=widget_id)
+        setattr(state, field, value)
+        self._widgets[widget_id] = state
+
+    def set_text(self, element, value):
+        self.set_value(element.id, "string_value", value)
+
+    def click(self, element):
+        self.set_value(element.id, "trigger_value", True)
+
+    def forget(self, element):
+        self._widgets.pop(element.id, None)
+
+    async def upload(self, uploader, file_name, content):
+        """Upload ``content`` through ``uploader`` (sent with the next run)."""
+        request_id = uuid.uuid4().hex
+        back_msg = BackMsg()
+        back_msg.file_urls_request.request_id = request_id
+        back_msg.file_urls_request.session_id = self.session_id
+        back_msg.file_urls_request.file_names.append(file_name)
+        start = time.perf_counter()
+        await self._ws.send(back_msg.SerializeToString())
+        while True:
+            msg = await asyncio.wait_for(self._receive(), self.timeout)
+            if msg.WhichOneof("type") == "file_urls_response" and msg.file_urls_response.response_id == request_id:
+                break
+        response = msg.file_urls_response
+        if response.error_msg:
+            raise ScriptError(response.error_msg)
+        urls = response.file_urls[0]
+
+        boundary = uuid.uuid4().hex
+        body = (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{file_name}"\r\n'
+            f"Content-Type: application/pdf\r\n\r\n"
+        ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+        await asyncio.to_thread(
+            self._http, "PUT", urls.upload_url, body, {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        )
+        self.recorder.step("upload.transfer", time.perf_counter() - start)
+
+        state = WidgetState(id=uploader.id)
+        info = state.file_uploader_state_value.uploaded_file_info.add()
+        info.file_id = urls.file_id
+        info.name = file_name
+        info.size = len(content)
+        info.file_urls.CopyFrom(urls)
+        self._widgets[uploader.id] = state
+
+
+# ==========================================================
+# --- JOURNEYS ---
+# ==========================================================
+async def login(session, username, password, attempts=5):
+    """Sign in through the form; retried with back-off while the server is busy."""
+    for attempt in range(attempts):
+        await session.step("login.page")
+        session.set_text(session.find("text_input", label="Username"), username)
+        session.set_text(session.find("text_input", label="Password"), password)
+        session.click(session.find("button", label="Login"))
+        await session.step("login")
+        if session.find_all("button", label="Logout"):
+            return
+        problem = " ".join(session.alerts()) or "login form shown again"
+        if "busy" not in problem and "Too many" not in problem:
+            break
+        await asyncio.sleep(min(2 ** attempt, 10))
+    raise LoginFailed(problem)
+
+
+async def browse_projects(session, rng):
+    await session.step("projects", page="Projects")
+    session.set_text(session.find("text_input", label="Search projects by name"),
+                     rng.choice(["", "", "p00", "geita", "roof", "site"]))
+    await session.step("projects.search")
+    expanders = session.find_all("expandable")
+    if expanders:
+        block = rng.choice(expanders)
+        session.set_value(block.expandable.id or block.id, "bool_value", True)
+        await session.step("projects.open")
+
+
+async def browse_files(session, rng):
+    await session.step("files", page="File Manager")
+    for _ in range(rng.randint(1, 3)):
+        session.click(session.find("button", key="files_next_page"))
+        await session.step("files.next_page")
+
+
+async def _fetch_images(session):
+    # The browser loads each st.image from the media endpoint, and each
+    # <img> in markdown (preview pages served by tms/web.py) from its URL
+    urls = [image.url for images in session.find_all("imgs") for image in images.imgs]
+    urls += [url for markdown in session.find_all("markdown") for url in IMG_SRC.findall(markdown.body)]
+    for url in urls:
+        start = time.perf_counter()
+        await session.fetch(url)
+        session.recorder.step("preview.image", time.perf_counter() - start)
+
+
+async def preview_pdf(session, rng):
+    await session.step("files", page="File Manager")
+    session.set_text(session.find("text_input", key="files_name_filter"), ".pdf")
+    await session.step("files.search")
+    views = session.find_all("button", key_prefix="view_")
+    if not views:
+        raise ScriptError("no PDFs listed")
+    session.click(rng.choice(views))
+    await session.step("preview")
+    await _fetch_images(session)
+    page_input = session.find("number_input", key="pdf_")
+    for page in range(2, min(int(page_input.max), 3) + 1):
+        session.set_value(page_input.id, "double_value", page)
+        await session.step("preview.page")
+        await _fetch_images(session)
+    session.click(session.find("button", label="⬅️ Back to File List"))
+    await session.step("preview.back")
+
+
+async def upload(session, rng):
+    await session.step("files", page="File Manager")
+    file_name = f"load_{uuid.uuid4().hex[:12]}.pdf"
+    uploader = session.find("file_uploader", key="upload")
+    await session.upload(uploader, file_name, datagen.pdf_bytes(file_name, rng.randint(1, 3)))
+    await session.step("upload")
+    session.forget(uploader)  # like removing it from the drop zone
+    if not any("uploaded successfully" in alert for alert in session.alerts()):
+        raise ScriptError(" ".join(session.alerts()) or "no upload report")
+    session.uploaded.append(file_name)
+
+
+async def delete(session, rng):
+    if not session.uploaded:
+        await upload(session, rng)
+    file_name = session.uploaded.pop(rng.randrange(len(session.uploaded)))
+    await session.step("files", page="File Manager")
+    session.set_text(session.find("text_input", key="files_name_filter"), file_name)
+    await session.step("files.search")
+    session.click(session.find("button", key="delete_"))
+    await session.step("delete")
+
+
+JOURNEYS = {
+    "browse_projects": browse_projects,
+    "browse_files": browse_files,
+    "preview_pdf": preview_pdf,
+    "upload": upload,
+    "delete": delete,
+}
+
+
+async def first_visit(base_url, username, password, pages=("File Manager", "Projects", "Admin Panel")):
+    """One user's first look at a server: the login page, signing in, then ``pages``.
+
+    Returns {step: seconds}; meant for a server nobody has used yet.
+    """
+    recorder = Recorder()
+    session = Session(base_url, "10.78.0.1", recorder)
+    try:
+        start = time.perf_counter()
+        await session.open()
+        recorder.step("connect", time.perf_counter() - start)
+        await login(session, username, password, attempts=1)
+        for page in pages:
+            await session.step(page, page=page)
+    finally:
+        await session.close()
+    return {name: values[0] for name, values in recorder.latencies.items()}
+
+
+# ==========================================================
+# --- ONE CONCURRENCY LEVEL ---
+# ==========================================================
+def server_rss(pid):
+    """Resident set size of a process in bytes (Linux), or None."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+async def _sample_rss(pids, samples, interval=0.5):
+    # Summed over all server processes; ``pids`` may change meanwhile (restarts)
+    while True:
+        rss = [server_rss(pid) for pid in pids]
+        rss = [value for value in rss if value is not None]
+        if rss:
+            samples.append(sum(rss))
+        await asyncio.sleep(interval)
+
+
+async def _user(n, base_url, usernames, journeys, deadline, recorder, think, delay, seed):
+    await asyncio.sleep(delay)
+    rng = random.Random(f"{seed}:{n}")
+    session = Session(base_url, f"10.77.{n // 250}.{n % 250 + 1}", recorder)
+    try:
+        await session.open()
+        await login(session, usernames[n % len(usernames)], datagen.PASSWORD)
+    except Exception as e:
+        recorder.error("login", e)
+        await session.close()
+        return
+    try:
+        while time.monotonic() < deadline:
+            name = rng.choice(journeys)
+            try:
+                await JOURNEYS[name](session, rng)
+                recorder.journeys[name] += 1
+            except Exception as e:
+                recorder.error(name, e)
+            await asyncio.sleep(think * rng.uniform(0.5, 1.5))
+    finally:
+        await session.close()
+
+
+async def run_level(base_url, sessions, duration, usernames, journeys=None, think=1.0, ramp=5.0,
+                    server_pids=(), seed=0):
+    """Run ``sessions`` concurrent users for ``duration`` seconds after ramping up.
+
+    Returns a JSON-ready summary; server RSS is the sum over ``server_pids``.
+    """
+    journeys = journeys or list(JOURNEYS)
+    recorder = Recorder()
+    rss = []
+    sampler = asyncio.create_task(_sample_rss(server_pids, rss)) if server_pids else None
+    start = time.monotonic()
+    deadline = start + ramp + duration
+    await asyncio.gather(*(
+        _user(n, base_url, usernames, journeys, deadline, recorder, think, ramp * n / sessions, seed)
+        for n in range(sessions)
+    ))
+    elapsed = time.monotonic() - start
+    if sampler:
+        sampler.cancel()
+
+    steps = [s for name, values in recorder.latencies.items() if name != "preview.image" for s in values]
+    return {
+        "sessions": sessions,
+        "seconds": round(elapsed, 1),
+        "logged_in": sessions - recorder.errors["login"],
+        "journeys": dict(recorder.journeys),
+        "journeys_per_s": round(sum(recorder.journeys.values()) / elapsed, 2),
+        "runs_per_s": round(len(steps) / elapsed, 2),
+        "received_mb": round(recorder.bytes_received / 2 ** 20, 2),
+        "latency_ms": {
+            "all_runs": _latency_summary(steps) if steps else None,
+            **{name: _latency_summary(values) for name, values in sorted(recorder.latencies.items())},
+        },
+        "errors": dict(recorder.errors),
+        "error_samples": recorder.error_samples,
+        "reconnects": recorder.reconnects,
+        "server_rss_mb": {
+            "start": round(rss[0] / 2 ** 20, 1),
+            "peak": round(max(rss) / 2 ** 20, 1),
+            "mean": round(statistics.fmean(rss) / 2 ** 20, 1),
+            "end": round(rss[-1] / 2 ** 20, 1),
+        } if rss else None,
+    }
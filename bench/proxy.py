@@ -0,0 +1,137 @@
+# ==========================================================
+# --- LOCAL LOAD BALANCER ---
+# A small HTTP/websocket reverse proxy for trying out several server
+# processes on one machine (what a cloud load balancer or nginx does
+# in production):
+#
+#   python -m bench.proxy --port 8000 127.0.0.1:8501 127.0.0.1:8502
+#
+# Requests go round-robin to the backends, except Streamlit's session
+# endpoints (AFFINITY), which must reach the process holding the
+# browser's session: the first of them pins the browser to a backend
+# with the AFFINITY_COOKIE, later ones follow it. A backend that
+# refuses connections is skipped, and a browser pinned to it is
+# pinned to the next one, as after a crash or a restart.
+#
+# One request per client connection (Connection: close), except
+# websockets, which are piped both ways until either side closes.
+# ==========================================================
+
+import argparse
+import asyncio
+import itertools
+from http.cookies import SimpleCookie
+
+AFFINITY = ("/_stcore/stream", "/_stcore/upload_file/", "/media/")
+AFFINITY_COOKIE = "tms_backend"
+CHUNK = 64 * 1024
+
+
+class Proxy:
+    def __init__(self, backends):
+        self.backends = backends  # [(host, port)]
+        self._next = itertools.cycle(range(len(backends)))
+
+    def _order(self, pinned):
+        first = pinned if pinned is not None else next(self._next)
+        return [(first + n) % len(self.backends) for n in range(len(self.backends))]
+
+    async def _connect(self, pinned):
+        for index in self._order(pinned):
+            try:
+                return index, *await asyncio.open_connection(*self.backends[index])
+            except OSError:
+                continue
+        return None, None, None
+
+    async def handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        request_line, *lines = head.decode("latin-1").split("\r\n")[:-2]
+        headers = [line.split(":", 1) for line in lines if ":" in line]
+        header = {name.strip().lower(): value.strip() for name, value in headers}
+        path = request_line.split(" ")[1].split("?")[0] if " " in request_line else "/"
+        upgrade = header.get("upgrade", "").lower() == "websocket"
+
+        pinned = None
+        sticky = path.startswith(AFFINITY)
+        if sticky:
+            cookie = SimpleCookie(header.get("cookie", "")).get(AFFINITY_COOKIE)
+            if cookie and cookie.value.isdigit() and int(cookie.value) < len(self.backends):
+                pinned = int(cookie.value)
+        index, up_reader, up_writer = await self._connect(pinned)
+        if index is None:
+            writer.write(b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            writer.close()
+            return
+
+        # The client's address; a client that already says whom it stands
+        # for (the load test's simulated browsers) is taken at its word
+        dropped = {"x-forwarded-for"} if upgrade else {"x-forwarded-for", "connection", "keep-alive"}
+        keep = [f"{name}:{value}" for name, value in headers if name.strip().lower() not in dropped]
+        keep.append(f"X-Forwarded-For: {header.get('x-forwarded-for') or writer.get_extra_info('peername')[0]}")
+        if not upgrade:
+            keep.append("Connection: close")
+        up_writer.write(("\r\n".join([request_line, *keep]) + "\r\n\r\n").encode("latin-1"))
+        upload = asyncio.create_task(_pipe(reader, up_writer))
+        try:
+            response = await up_reader.readuntil(b"\r\n\r\n")
+            status, *response_lines = response.decode("latin-1").split("\r\n")[:-2]
+            if not upgrade:
+                response_lines = [line for line in response_lines if not line.lower().startswith("connection:")]
+                response_lines.append("Connection: close")
+            if sticky and index != pinned:
+                response_lines.append(f"Set-Cookie: {AFFINITY_COOKIE}={index}; Path=/; HttpOnly; SameSite=Lax")
+            writer.write(("\r\n".join([status, *response_lines]) + "\r\n\r\n").encode("latin-1"))
+            await _pipe(up_reader, writer)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            upload.cancel()
+            for w in (writer, up_writer):
+                w.close()
+
+
+async def _pipe(reader, writer):
+    try:
+        while data := await reader.read(CHUNK):
+            writer.write(data)
+            await writer.drain()
+        if writer.can_write_eof():
+            writer.write_eof()
+    except (ConnectionError, OSError):
+        pass
+
+
+async def serve(port, backends, host="127.0.0.1"):
+    proxy = Proxy(backends)
+    server = await asyncio.start_server(proxy.handle, host, port, limit=CHUNK)
+    async with server:
+        await server.serve_forever()
+
+
+def _backend(text):
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench.proxy",
+                                     description="Local load balancer for several TMS server processes.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("backends", nargs="+", type=_backend, metavar="HOST:PORT")
+    args = parser.parse_args()
+    print(f"Proxying http://{args.host}:{args.port}/ to " + ", ".join("%s:%d" % b for b in args.backends), flush=True)
+    try:
+        asyncio.run(serve(args.port, args.backends, args.host))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
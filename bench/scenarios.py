@@ -0,0 +1,137 @@
+# ==========================================================
+# --- SCENARIOS ---
+# Each scenario renders one page headlessly with Streamlit's AppTest
+# as a signed-in user, the way a browser session would:
+#
+#   cold    the first run of the page in this process (imports,
+#           caches and connection pool still empty)
+#   warm    ``repeat`` further runs in the same session, each after
+#           the scenario's interaction (if any): what a user waits
+#           for on every click
+#   queries database statements per warm run, counted by tms/metrics
+#   memory  peak traced Python allocations of one more warm run
+#           (tracemalloc slows the run, so it is not timed)
+# ==========================================================
+
+import logging
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+from streamlit.testing.v1 import AppTest
+
+from bench import datagen
+from tms import metrics
+
+ROOT = Path(__file__).resolve().parent.parent
+SEARCH_TERMS = ["quote", "site", "rev", "report", "zzz-no-match"]
+
+
+class Scenario:
+    """A page script, and what the user does before each warm run.
+
+    ``interact(at, i)`` is called before warm run ``i``.
+    """
+
+    def __init__(self, name, script, signed_in=True, interact=None):
+        self.name = name
+        self.script = script
+        self.signed_in = signed_in
+        self.interact = interact
+
+
+def _search(at, i):
+    at.text_input(key="files_name_filter").input(SEARCH_TERMS[i % len(SEARCH_TERMS)])
+
+
+def _page_through(at, i):
+    at.button(key="files_prev_page" if i % 2 else "files_next_page").click()
+
+
+SCENARIOS = [
+    Scenario("login", "app.py", signed_in=False),
+    Scenario("dashboard", "app.py"),
+    Scenario("file_manager", "pages/File_Manager.py"),
+    Scenario("file_manager_search", "pages/File_Manager.py", interact=_search),
+    Scenario("file_manager_paging", "pages/File_Manager.py", interact=_page_through),
+    Scenario("projects", "pages/Projects.py"),
+    Scenario("admin_panel", "pages/Admin_Panel.py"),
+]
+
+
+def _session(user_id):
+    return {
+        "authentication_status": True,
+        "name": datagen.ADMIN_USERNAME,
+        "username": datagen.ADMIN_USERNAME,
+        "user_role": "admin",
+        "user_id": user_id,
+    }
+
+
+def _run(at):
+    """Run once; returns (seconds, database statements)."""
+    metrics.reset()
+    start = time.perf_counter()
+    at.run()
+    elapsed = time.perf_counter() - start
+    queries = sum(
+        h["mean"] * h["count"] for h in metrics.snapshot()["histograms"]
+        if h["metric"] == "tms_script_run_queries" and h["count"]
+    )
+    return elapsed, int(queries)
+
+
+def _problems(at):
+    return [str(e.value) for e in at.exception] + [str(e.value) for e in at.error]
+
+
+def run(scenario, user_id, repeat=5, memory=True, timeout=300):
+    """Measure one scenario; returns a JSON-ready dict (times in ms)."""
+    # Set up from outside any script run, which Streamlit warns about
+    logging.disable(logging.WARNING)
+    try:
+        at = AppTest.from_file(str(ROOT / scenario.script), default_timeout=timeout)
+        if scenario.signed_in:
+            for key, value in _session(user_id).items():
+                at.session_state[key] = value
+    finally:
+        logging.disable(logging.NOTSET)
+
+    cold, cold_queries = _run(at)
+    problems = _problems(at)
+    warm, queries = [], []
+    for i in range(repeat):
+        if scenario.interact:
+            scenario.interact(at, i)
+        seconds, count = _run(at)
+        warm.append(seconds)
+        queries.append(count)
+        problems += _problems(at)
+
+    peak = None
+    if memory:
+        if scenario.interact:
+            scenario.interact(at, repeat)
+        tracemalloc.start()
+        try:
+            at.run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    ms = [s * 1000 for s in warm]
+    return {
+        "cold_ms": round(cold * 1000, 2),
+        "cold_queries": cold_queries,
+        "warm_ms": {
+            "p50": round(statistics.median(ms), 2),
+            "min": round(min(ms), 2),
+            "max": round(max(ms), 2),
+            "mean": round(statistics.fmean(ms), 2),
+        } if ms else None,
+        "queries": round(statistics.median(queries)) if queries else cold_queries,
+        "peak_traced_bytes": peak,
+        "errors": sorted(set(problems)),
+    }
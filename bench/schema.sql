@@ -0,0 +1,26 @@
+-- The users and files tables predate migrations/ (they were created by
+-- hand in the hosted database), so an empty benchmark database gets
+-- them here before the migrations run.
+CREATE TABLE IF NOT EXISTS users (
+    user_id SERIAL PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    password_hash TEXT,
+    role TEXT DEFAULT 'user',
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS files (
+    file_id SERIAL PRIMARY KEY,
+    file_name TEXT,
+    file_path TEXT NOT NULL,
+    uploaded_by INT REFERENCES users(user_id),
+    uploaded_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Marks a database as the benchmark's own: datagen refuses to empty
+-- one that has users but not this table.
+CREATE TABLE IF NOT EXISTS tms_bench (
+    generated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    scale TEXT NOT NULL,
+    seed INT NOT NULL
+);
@@ -0,0 +1,13 @@
+# ==========================================================
+# Thermoteq Management System (TMS)
+# Applies pending database migrations from migrations/
+# Usage: python migrate.py
+# ==========================================================
+
+from tms import migrations
+
+applied = migrations.apply_pending()
+if applied:
+    print(f"Applied {len(applied)} migration(s).")
+else:
+    print("Database is up to date.")
@@ -0,0 +1,7 @@
+# Hash any users.password_hash values that are still stored in plain text.
+from tms import users
+
+
+def upgrade(cur):
+    count = users.hash_plaintext_passwords(cur)
+    print(f"  hashed {count} plain-text password(s)")
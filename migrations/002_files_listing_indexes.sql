@@ -0,0 +1,29 @@
+-- Indexes behind the keyset-paginated "Existing Files" list in File_Manager.
+-- The list is ordered by (uploaded_at DESC, file_id DESC), so uploaded_at
+-- must never be NULL for the keyset comparison to be exact.
+UPDATE files SET uploaded_at = NOW() WHERE uploaded_at IS NULL;
+ALTER TABLE files ALTER COLUMN uploaded_at SET DEFAULT NOW();
+ALTER TABLE files ALTER COLUMN uploaded_at SET NOT NULL;
+
+-- Unfiltered pages and the date-range filter
+CREATE INDEX IF NOT EXISTS files_uploaded_at_file_id_idx
+    ON files (uploaded_at DESC, file_id DESC);
+
+-- "Uploaded by" filter
+CREATE INDEX IF NOT EXISTS files_uploaded_by_uploaded_at_idx
+    ON files (uploaded_by, uploaded_at DESC, file_id DESC);
+
+CREATE INDEX IF NOT EXISTS users_lower_username_idx
+    ON users (lower(username));
+
+-- File name "contains" filter (ILIKE '%...%'); needs pg_trgm, which is
+-- available on Supabase but not on every self-hosted PostgreSQL.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS files_file_name_trgm_idx
+            ON files USING gin (file_name gin_trgm_ops);
+    END IF;
+END
+$$;
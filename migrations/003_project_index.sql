@@ -0,0 +1,28 @@
+-- Metadata index of the projects/ tree, so Projects and Admin_Panel can
+-- render without walking the filesystem. Kept up to date by tms/catalog.py.
+CREATE TABLE IF NOT EXISTS projects (
+    project_id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Last seen directory mtime per project folder; a folder is only
+-- rescanned when its mtime changes.
+CREATE TABLE IF NOT EXISTS project_folders (
+    project_id INT NOT NULL REFERENCES projects(project_id) ON DELETE CASCADE,
+    folder TEXT NOT NULL,
+    mtime_ns BIGINT,
+    PRIMARY KEY (project_id, folder)
+);
+
+CREATE TABLE IF NOT EXISTS project_files (
+    project_file_id SERIAL PRIMARY KEY,
+    project_id INT NOT NULL REFERENCES projects(project_id) ON DELETE CASCADE,
+    folder TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    size_bytes BIGINT NOT NULL,
+    mtime_ns BIGINT NOT NULL,
+    sha256 CHAR(64),
+    indexed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    UNIQUE (project_id, folder, file_name)
+);
@@ -0,0 +1,21 @@
+-- Full-text search over the contents of company files and project files.
+-- One row per document; rows disappear with the file they describe.
+-- Maintained by tms/search.py.
+CREATE TABLE IF NOT EXISTS document_text (
+    document_id SERIAL PRIMARY KEY,
+    file_id INT UNIQUE REFERENCES files(file_id) ON DELETE CASCADE,
+    project_file_id INT UNIQUE REFERENCES project_files(project_file_id) ON DELETE CASCADE,
+    title TEXT NOT NULL,
+    -- What the text was extracted from (content hash or size:mtime);
+    -- a document is only re-extracted when this changes.
+    fingerprint TEXT NOT NULL,
+    body TEXT NOT NULL DEFAULT '',
+    tsv tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', title), 'A') ||
+        setweight(to_tsvector('english', body), 'B')
+    ) STORED,
+    indexed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    CHECK ((file_id IS NULL) <> (project_file_id IS NULL))
+);
+
+CREATE INDEX IF NOT EXISTS document_text_tsv_idx ON document_text USING gin (tsv);
@@ -0,0 +1,13 @@
+-- Content-addressed storage: one row per distinct file content.
+-- files.sha256 and project_files.sha256 are the references; a blob is
+-- freed when neither table refers to it any more (see tms/storage.py).
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 CHAR(64) PRIMARY KEY,
+    size_bytes BIGINT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+ALTER TABLE files ADD COLUMN IF NOT EXISTS sha256 CHAR(64);
+
+CREATE INDEX IF NOT EXISTS files_sha256_idx ON files (sha256);
+CREATE INDEX IF NOT EXISTS project_files_sha256_idx ON project_files (sha256);
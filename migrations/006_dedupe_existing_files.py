@@ -0,0 +1,39 @@
+# Move files stored before the blob store into it: every uploads/ file
+# and project file becomes a hard link to one blob per distinct content.
+from pathlib import Path
+
+from tms import config, storage
+
+
+def upgrade(cur):
+    cur.execute("SELECT file_id, file_path FROM files WHERE sha256 IS NULL;")
+    company_files = cur.fetchall()
+    for file_id, file_path in company_files:
+        path = Path(file_path)
+        if not path.is_file():
+            continue
+        sha256 = storage.sha256_file(path)
+        storage.adopt(cur, path, sha256)
+        cur.execute("UPDATE files SET sha256=%s WHERE file_id=%s;", (sha256, file_id))
+
+    cur.execute("""
+        SELECT pf.project_file_id, p.name, pf.folder, pf.file_name, pf.sha256
+        FROM project_files pf
+        JOIN projects p ON p.project_id = pf.project_id;
+    """)
+    project_files = cur.fetchall()
+    for project_file_id, project_name, folder, file_name, sha256 in project_files:
+        path = config.PROJECTS_DIR / project_name / folder / file_name
+        if not path.is_file():
+            continue
+        sha256 = sha256 or storage.sha256_file(path)
+        storage.adopt(cur, path, sha256)
+        stat = path.stat()
+        cur.execute(
+            "UPDATE project_files SET sha256=%s, size_bytes=%s, mtime_ns=%s WHERE project_file_id=%s;",
+            (sha256, stat.st_size, stat.st_mtime_ns, project_file_id)
+        )
+
+    cur.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM blobs;")
+    blobs, stored_bytes = cur.fetchone()
+    print(f"  {len(company_files) + len(project_files)} file(s) now share {blobs} blob(s), {stored_bytes} bytes")
@@ -0,0 +1,33 @@
+-- One version counter per cached table (see tms/querycache.py).
+-- Every statement that changes the table bumps its counter in the same
+-- transaction and announces the new value on the tms_table_versions
+-- channel, so caches in every server process drop stale results.
+CREATE TABLE IF NOT EXISTS table_versions (
+    table_name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO table_versions (table_name) VALUES ('files'), ('users')
+ON CONFLICT (table_name) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION tms_bump_table_version() RETURNS trigger AS $$
+DECLARE
+    new_version BIGINT;
+BEGIN
+    UPDATE table_versions SET version = version + 1
+    WHERE table_name = TG_TABLE_NAME
+    RETURNING version INTO new_version;
+    PERFORM pg_notify('tms_table_versions', TG_TABLE_NAME || ':' || new_version);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS files_bump_version ON files;
+CREATE TRIGGER files_bump_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON files
+    FOR EACH STATEMENT EXECUTE FUNCTION tms_bump_table_version();
+
+DROP TRIGGER IF EXISTS users_bump_version ON users;
+CREATE TRIGGER users_bump_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON users
+    FOR EACH STATEMENT EXECUTE FUNCTION tms_bump_table_version();
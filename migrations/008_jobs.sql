@@ -0,0 +1,32 @@
+-- Background job queue (see tms/jobs.py and worker.py).
+-- Workers claim the best queued job with FOR UPDATE SKIP LOCKED and
+-- hold it under a lease that they renew while it runs; a job whose
+-- lease ran out (worker died) is queued again.
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+    priority INT NOT NULL DEFAULT 0,          -- higher runs first
+    status TEXT NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    dedupe_key TEXT,                          -- at most one active job per (kind, key)
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 3,
+    run_after TIMESTAMP NOT NULL DEFAULT NOW(),
+    lease_expires_at TIMESTAMP,
+    worker TEXT,
+    enqueued_by TEXT,
+    result JSONB,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS jobs_queue_idx
+    ON jobs (priority DESC, run_after, job_id) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS jobs_running_lease_idx
+    ON jobs (lease_expires_at) WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS jobs_created_idx ON jobs (created_at DESC);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_dedupe_idx
+    ON jobs (kind, dedupe_key) WHERE dedupe_key IS NOT NULL AND status IN ('queued', 'running');
@@ -0,0 +1,23 @@
+-- Soft delete (see tms/trash.py). Deleting a project, project file or
+-- company file moves it under TRASH_DIR and stamps deleted_at; rows
+-- and blobs stay until the purger removes them after the retention
+-- window, so a delete can be undone from the Admin Panel.
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS deleted_by TEXT;
+ALTER TABLE project_files ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;
+ALTER TABLE project_files ADD COLUMN IF NOT EXISTS deleted_by TEXT;
+ALTER TABLE files ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;
+ALTER TABLE files ADD COLUMN IF NOT EXISTS deleted_by TEXT;
+
+-- Names only have to be unique among live rows: a new project or
+-- upload may reuse the name of one in the trash.
+ALTER TABLE projects DROP CONSTRAINT IF EXISTS projects_name_key;
+CREATE UNIQUE INDEX IF NOT EXISTS projects_live_name_idx ON projects (name) WHERE deleted_at IS NULL;
+ALTER TABLE project_files DROP CONSTRAINT IF EXISTS project_files_project_id_folder_file_name_key;
+CREATE UNIQUE INDEX IF NOT EXISTS project_files_live_name_idx
+    ON project_files (project_id, folder, file_name) WHERE deleted_at IS NULL;
+
+-- The purger's scan and the Admin Panel's trash view
+CREATE INDEX IF NOT EXISTS projects_deleted_idx ON projects (deleted_at) WHERE deleted_at IS NOT NULL;
+CREATE INDEX IF NOT EXISTS project_files_deleted_idx ON project_files (deleted_at) WHERE deleted_at IS NOT NULL;
+CREATE INDEX IF NOT EXISTS files_deleted_idx ON files (deleted_at) WHERE deleted_at IS NOT NULL;
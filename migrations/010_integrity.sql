@@ -0,0 +1,27 @@
+-- Disk/database consistency (see tms/integrity.py). The list pages
+-- show integrity_status instead of checking the filesystem per row:
+--   ok       file present (and its checksum matched when last verified)
+--   missing  the row's file is not on disk
+--   corrupt  the file's SHA-256 no longer matches the recorded one
+ALTER TABLE files ADD COLUMN IF NOT EXISTS integrity_status TEXT NOT NULL DEFAULT 'ok'
+    CHECK (integrity_status IN ('ok', 'missing', 'corrupt'));
+ALTER TABLE files ADD COLUMN IF NOT EXISTS verified_at TIMESTAMP;
+ALTER TABLE project_files ADD COLUMN IF NOT EXISTS integrity_status TEXT NOT NULL DEFAULT 'ok'
+    CHECK (integrity_status IN ('ok', 'missing', 'corrupt'));
+ALTER TABLE project_files ADD COLUMN IF NOT EXISTS verified_at TIMESTAMP;
+
+-- The scrubber re-hashes the least recently verified files first
+CREATE INDEX IF NOT EXISTS files_verified_at_idx ON files (verified_at NULLS FIRST) WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS project_files_verified_at_idx ON project_files (verified_at NULLS FIRST) WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS files_integrity_problem_idx ON files (integrity_status) WHERE integrity_status <> 'ok';
+CREATE INDEX IF NOT EXISTS project_files_integrity_problem_idx
+    ON project_files (integrity_status) WHERE integrity_status <> 'ok';
+
+-- Files on disk that no row refers to, as found by the last pass
+CREATE TABLE IF NOT EXISTS storage_orphans (
+    path TEXT PRIMARY KEY,
+    area TEXT NOT NULL,                 -- 'uploads' or 'blobs'
+    size_bytes BIGINT NOT NULL,
+    modified_at TIMESTAMP NOT NULL,
+    found_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,257 @@
+-- Storage usage rollups for the Admin Panel dashboard (tms/usage.py).
+-- Statement-level triggers fold each INSERT/UPDATE/DELETE on files,
+-- project_files and blobs into small summary tables, so the dashboard
+-- never scans the file tables. Rows count until they are purged:
+-- files in the trash still occupy disk.
+--
+--   storage_usage        totals per dimension: area (company/projects),
+--                        folder, type (extension), uploader, and store
+--                        (distinct blobs, i.e. bytes actually on disk)
+--   project_usage        per project and folder
+--   storage_usage_daily  net change per day and area (growth chart)
+
+ALTER TABLE files ADD COLUMN IF NOT EXISTS size_bytes BIGINT;
+UPDATE files f SET size_bytes = b.size_bytes FROM blobs b WHERE b.sha256 = f.sha256 AND f.size_bytes IS NULL;
+UPDATE files SET size_bytes = 0 WHERE size_bytes IS NULL;
+ALTER TABLE files ALTER COLUMN size_bytes SET DEFAULT 0;
+ALTER TABLE files ALTER COLUMN size_bytes SET NOT NULL;
+
+-- Username of whoever uploaded a project file (NULL: found on disk)
+ALTER TABLE project_files ADD COLUMN IF NOT EXISTS uploaded_by TEXT;
+
+CREATE TABLE IF NOT EXISTS storage_usage (
+    dimension TEXT NOT NULL,
+    key TEXT NOT NULL,
+    file_count BIGINT NOT NULL DEFAULT 0,
+    total_bytes BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (dimension, key)
+);
+
+CREATE TABLE IF NOT EXISTS project_usage (
+    project_id INT NOT NULL,
+    folder TEXT NOT NULL,
+    file_count BIGINT NOT NULL DEFAULT 0,
+    total_bytes BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (project_id, folder)
+);
+
+CREATE TABLE IF NOT EXISTS storage_usage_daily (
+    day DATE NOT NULL,
+    area TEXT NOT NULL,
+    file_delta BIGINT NOT NULL DEFAULT 0,
+    byte_delta BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, area)
+);
+
+CREATE OR REPLACE FUNCTION tms_file_type(file_name TEXT) RETURNS TEXT AS $$
+    SELECT COALESCE(lower(substring(file_name FROM '\.([^./]+)$')), '(none)');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Apply a delta (JSON array of {sign, folder, file_name, size, uploader})
+-- to storage_usage and storage_usage_daily. Keys are aggregated and
+-- sorted first, so concurrent writers lock summary rows in one order.
+CREATE OR REPLACE FUNCTION tms_apply_usage(usage_area TEXT, delta JSONB) RETURNS void AS $$
+    WITH d AS (
+        SELECT * FROM jsonb_to_recordset(delta)
+            AS x(sign INT, folder TEXT, file_name TEXT, size BIGINT, uploader TEXT)
+    ),
+    keyed AS (
+        SELECT 'area' AS dimension, usage_area AS key, sign, size FROM d
+        UNION ALL SELECT 'folder', folder, sign, size FROM d WHERE folder IS NOT NULL
+        UNION ALL SELECT 'type', tms_file_type(file_name), sign, size FROM d
+        UNION ALL SELECT 'uploader', COALESCE(uploader, '(unknown)'), sign, size FROM d
+    )
+    INSERT INTO storage_usage (dimension, key, file_count, total_bytes)
+    SELECT dimension, key, SUM(sign), SUM(sign * size) FROM keyed
+    GROUP BY dimension, key
+    ORDER BY dimension, key
+    ON CONFLICT (dimension, key) DO UPDATE
+    SET file_count = storage_usage.file_count + EXCLUDED.file_count,
+        total_bytes = storage_usage.total_bytes + EXCLUDED.total_bytes;
+
+    INSERT INTO storage_usage_daily (day, area, file_delta, byte_delta)
+    SELECT CURRENT_DATE, usage_area, SUM((x->>'sign')::INT), SUM((x->>'sign')::INT * (x->>'size')::BIGINT)
+    FROM jsonb_array_elements(delta) AS x
+    ON CONFLICT (day, area) DO UPDATE
+    SET file_delta = storage_usage_daily.file_delta + EXCLUDED.file_delta,
+        byte_delta = storage_usage_daily.byte_delta + EXCLUDED.byte_delta;
+$$ LANGUAGE sql;
+
+-- files: one delta per statement from the transition tables. An UPDATE
+-- only counts rows whose size or name changed (status updates are free).
+CREATE OR REPLACE FUNCTION tms_files_usage() RETURNS trigger AS $$
+DECLARE
+    delta JSONB;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT jsonb_agg(jsonb_build_object('sign', 1, 'file_name', n.file_name, 'size', n.size_bytes,
+                                            'uploader', u.username))
+        INTO delta
+        FROM new_rows n LEFT JOIN users u ON u.user_id = n.uploaded_by;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT jsonb_agg(jsonb_build_object('sign', -1, 'file_name', o.file_name, 'size', o.size_bytes,
+                                            'uploader', u.username))
+        INTO delta
+        FROM old_rows o LEFT JOIN users u ON u.user_id = o.uploaded_by;
+    ELSE
+        SELECT jsonb_agg(change) INTO delta FROM (
+            SELECT jsonb_build_object('sign', r.sign, 'file_name', r.file_name, 'size', r.size_bytes,
+                                      'uploader', u.username) AS change
+            FROM old_rows o
+            JOIN new_rows n ON n.file_id = o.file_id
+            CROSS JOIN LATERAL (VALUES (-1, o.file_name, o.size_bytes, o.uploaded_by),
+                                       (1, n.file_name, n.size_bytes, n.uploaded_by))
+                AS r(sign, file_name, size_bytes, uploaded_by)
+            LEFT JOIN users u ON u.user_id = r.uploaded_by
+            WHERE (o.file_name, o.size_bytes, o.uploaded_by) IS DISTINCT FROM (n.file_name, n.size_bytes, n.uploaded_by)
+        ) changed;
+    END IF;
+    IF delta IS NOT NULL THEN
+        PERFORM tms_apply_usage('company', delta);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION tms_project_files_usage() RETURNS trigger AS $$
+DECLARE
+    delta JSONB;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT jsonb_agg(jsonb_build_object('sign', 1, 'project_id', project_id, 'folder', folder,
+                                            'file_name', file_name, 'size', size_bytes, 'uploader', uploaded_by))
+        INTO delta FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT jsonb_agg(jsonb_build_object('sign', -1, 'project_id', project_id, 'folder', folder,
+                                            'file_name', file_name, 'size', size_bytes, 'uploader', uploaded_by))
+        INTO delta FROM old_rows;
+    ELSE
+        SELECT jsonb_agg(change) INTO delta FROM (
+            SELECT jsonb_build_object('sign', r.sign, 'project_id', r.project_id, 'folder', r.folder,
+                                      'file_name', r.file_name, 'size', r.size_bytes, 'uploader', r.uploaded_by) AS change
+            FROM old_rows o
+            JOIN new_rows n ON n.project_file_id = o.project_file_id
+            CROSS JOIN LATERAL (VALUES (-1, o.project_id, o.folder, o.file_name, o.size_bytes, o.uploaded_by),
+                                       (1, n.project_id, n.folder, n.file_name, n.size_bytes, n.uploaded_by))
+                AS r(sign, project_id, folder, file_name, size_bytes, uploaded_by)
+            WHERE (o.project_id, o.folder, o.file_name, o.size_bytes, o.uploaded_by)
+                  IS DISTINCT FROM (n.project_id, n.folder, n.file_name, n.size_bytes, n.uploaded_by)
+        ) changed;
+    END IF;
+    IF delta IS NULL THEN
+        RETURN NULL;
+    END IF;
+    PERFORM tms_apply_usage('projects', delta);
+
+    -- Skips projects already deleted in this transaction (purge cascades);
+    -- their project_usage rows go with them, see tms_projects_usage()
+    INSERT INTO project_usage (project_id, folder, file_count, total_bytes)
+    SELECT d.project_id, d.folder, SUM(d.sign), SUM(d.sign * d.size)
+    FROM jsonb_to_recordset(delta) AS d(sign INT, project_id INT, folder TEXT, size BIGINT)
+    WHERE EXISTS (SELECT 1 FROM projects p WHERE p.project_id = d.project_id)
+    GROUP BY d.project_id, d.folder
+    ORDER BY d.project_id, d.folder
+    ON CONFLICT (project_id, folder) DO UPDATE
+    SET file_count = project_usage.file_count + EXCLUDED.file_count,
+        total_bytes = project_usage.total_bytes + EXCLUDED.total_bytes;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION tms_projects_usage() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM project_usage WHERE project_id IN (SELECT project_id FROM old_rows);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- blobs: the distinct content actually stored (after deduplication)
+CREATE OR REPLACE FUNCTION tms_blobs_usage() RETURNS trigger AS $$
+DECLARE
+    files_delta BIGINT;
+    bytes_delta BIGINT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) INTO files_delta, bytes_delta FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT -COUNT(*), -COALESCE(SUM(size_bytes), 0) INTO files_delta, bytes_delta FROM old_rows;
+    ELSE
+        SELECT 0, COALESCE(SUM(n.size_bytes - o.size_bytes), 0) INTO files_delta, bytes_delta
+        FROM old_rows o JOIN new_rows n ON n.sha256 = o.sha256;
+    END IF;
+    IF files_delta <> 0 OR bytes_delta <> 0 THEN
+        INSERT INTO storage_usage (dimension, key, file_count, total_bytes)
+        VALUES ('store', 'blobs', files_delta, bytes_delta)
+        ON CONFLICT (dimension, key) DO UPDATE
+        SET file_count = storage_usage.file_count + EXCLUDED.file_count,
+            total_bytes = storage_usage.total_bytes + EXCLUDED.total_bytes;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables allow one event per trigger
+DROP TRIGGER IF EXISTS files_usage_insert ON files;
+DROP TRIGGER IF EXISTS files_usage_update ON files;
+DROP TRIGGER IF EXISTS files_usage_delete ON files;
+CREATE TRIGGER files_usage_insert AFTER INSERT ON files
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION tms_files_usage();
+CREATE TRIGGER files_usage_update AFTER UPDATE ON files
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION tms_files_usage();
+CREATE TRIGGER files_usage_delete AFTER DELETE ON files
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION tms_files_usage();
+
+DROP TRIGGER IF EXISTS project_files_usage_insert ON project_files;
+DROP TRIGGER IF EXISTS project_files_usage_update ON project_files;
+DROP TRIGGER IF EXISTS project_files_usage_delete ON project_files;
+CREATE TRIGGER project_files_usage_insert AFTER INSERT ON project_files
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION tms_project_files_usage();
+CREATE TRIGGER project_files_usage_update AFTER UPDATE ON project_files
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION tms_project_files_usage();
+CREATE TRIGGER project_files_usage_delete AFTER DELETE ON project_files
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION tms_project_files_usage();
+
+DROP TRIGGER IF EXISTS projects_usage_delete ON projects;
+CREATE TRIGGER projects_usage_delete AFTER DELETE ON projects
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION tms_projects_usage();
+
+DROP TRIGGER IF EXISTS blobs_usage_insert ON blobs;
+DROP TRIGGER IF EXISTS blobs_usage_update ON blobs;
+DROP TRIGGER IF EXISTS blobs_usage_delete ON blobs;
+CREATE TRIGGER blobs_usage_insert AFTER INSERT ON blobs
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION tms_blobs_usage();
+CREATE TRIGGER blobs_usage_update AFTER UPDATE ON blobs
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION tms_blobs_usage();
+CREATE TRIGGER blobs_usage_delete AFTER DELETE ON blobs
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION tms_blobs_usage();
+
+-- Starting point from what is already stored (re-runnable: rebuilt)
+TRUNCATE storage_usage, project_usage, storage_usage_daily;
+
+INSERT INTO storage_usage (dimension, key, file_count, total_bytes)
+SELECT dimension, key, COUNT(*), SUM(size) FROM (
+    SELECT 'company' AS area, NULL AS folder, f.file_name, f.size_bytes AS size, u.username AS uploader
+    FROM files f LEFT JOIN users u ON u.user_id = f.uploaded_by
+    UNION ALL
+    SELECT 'projects', folder, file_name, size_bytes, uploaded_by FROM project_files
+) d
+CROSS JOIN LATERAL (VALUES ('area', d.area), ('folder', d.folder), ('type', tms_file_type(d.file_name)),
+                           ('uploader', COALESCE(d.uploader, '(unknown)'))) AS k(dimension, key)
+WHERE k.key IS NOT NULL
+GROUP BY dimension, key;
+
+INSERT INTO storage_usage (dimension, key, file_count, total_bytes)
+SELECT 'store', 'blobs', COUNT(*), COALESCE(SUM(size_bytes), 0) FROM blobs;
+
+INSERT INTO project_usage (project_id, folder, file_count, total_bytes)
+SELECT project_id, folder, COUNT(*), SUM(size_bytes) FROM project_files GROUP BY project_id, folder;
+
+-- Growth history: upload dates for company files; project files only
+-- have their (re)index time
+INSERT INTO storage_usage_daily (day, area, file_delta, byte_delta)
+SELECT day, area, COUNT(*), SUM(size) FROM (
+    SELECT uploaded_at::date AS day, 'company' AS area, size_bytes AS size FROM files
+    UNION ALL
+    SELECT indexed_at::date, 'projects', size_bytes FROM project_files
+) d
+GROUP BY day, area;
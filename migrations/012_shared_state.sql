@@ -0,0 +1,37 @@
+-- State that has to be shared when several server processes serve the
+-- app behind a load balancer (see "SEVERAL SERVER PROCESSES" in
+-- tms/config.py).
+
+-- Login attempts and failures for the rate limits of tms/auth.py, so
+-- the limits hold across processes. Rows are only useful for
+-- LOGIN_RATE_WINDOW seconds; losing them in a crash just resets the
+-- limits, hence UNLOGGED.
+CREATE UNLOGGED TABLE IF NOT EXISTS login_events (
+    kind TEXT NOT NULL CHECK (kind IN ('failure', 'attempt')),
+    key TEXT NOT NULL,                        -- lower-cased username or client address
+    at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS login_events_key_idx ON login_events (kind, key, at DESC);
+CREATE INDEX IF NOT EXISTS login_events_at_idx ON login_events (at);
+
+-- Each user's last view (open preview, expanded project, selection ...),
+-- restored by tms/sessions.py when their browser reconnects to another
+-- process.
+CREATE TABLE IF NOT EXISTS session_views (
+    username TEXT PRIMARY KEY,
+    state JSONB NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Running server processes (tms/instances.py): a heartbeat every
+-- INSTANCE_HEARTBEAT_INTERVAL seconds with the process's raw metrics,
+-- which the Admin Panel merges into figures for all processes.
+CREATE TABLE IF NOT EXISTS server_instances (
+    instance_id TEXT PRIMARY KEY,             -- host:pid
+    host TEXT NOT NULL,
+    pid INT NOT NULL,
+    started_at TIMESTAMP NOT NULL,
+    seen_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    metrics JSONB NOT NULL DEFAULT '{}'::jsonb
+);
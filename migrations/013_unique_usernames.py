@@ -0,0 +1,24 @@
+# Usernames are unique regardless of case (users_username_lower_key),
+# which the CSV import's ON CONFLICT and the case-insensitive login
+# rely on. Accounts whose names differ only in case have to be renamed
+# or merged by an admin first; this migration stops and lists them
+# rather than choose which account survives.
+
+
+def upgrade(cur):
+    cur.execute("""
+        SELECT string_agg(username, ', ' ORDER BY user_id)
+        FROM users
+        GROUP BY lower(username)
+        HAVING COUNT(*) > 1
+        ORDER BY lower(username);
+    """)
+    collisions = [row[0] for row in cur.fetchall()]
+    if collisions:
+        raise RuntimeError(
+            "Usernames that differ only in case must be renamed or merged before "
+            "migration 013 can run: " + "; ".join(collisions)
+        )
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS users_username_lower_key ON users (lower(username));")
+    # Superseded by the unique index
+    cur.execute("DROP INDEX IF EXISTS users_lower_username_idx;")
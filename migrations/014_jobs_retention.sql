@@ -0,0 +1,5 @@
+-- Finished jobs are deleted after JOB_RETENTION_DAYS by the worker's
+-- prune_jobs job (tms/jobs.py prune); this index finds them without
+-- reading the queued and running ones.
+CREATE INDEX IF NOT EXISTS jobs_finished_idx
+    ON jobs (status, finished_at) WHERE status IN ('done', 'failed');
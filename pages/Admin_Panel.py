@@ -1,15 +1,16 @@
+from datetime import datetime
+
 import streamlit as st
-from pathlib import Path
-import shutil
-import os
 import pandas as pd
-import psycopg2
-import psycopg2.extras
-import bcrypt
+
+from tms import auth, catalog, config, db, instances, integrity, jobs, metrics, sessions, trash, usage, users, web
+from tms.downloads import csv_download_button
+from tms.files import all_files, delete_file, restore_file
 
 # ==========================================================
 # --- ADMIN ACCESS CONTROL ---
 # ==========================================================
+sessions.sync()
 if st.session_state.get("user_role") != "admin":
     st.error("🔒 Access Denied — Admins Only")
     st.stop()
@@ -31,33 +32,15 @@ if "refresh_admin" not in st.session_state:
 # ==========================================================
 # --- DIRECTORIES ---
 # ==========================================================
-PROJECTS_DIR = Path("projects")
+PROJECTS_DIR = config.PROJECTS_DIR
 PROJECTS_DIR.mkdir(exist_ok=True)
-UPLOAD_DIR = Path("uploads")
+UPLOAD_DIR = config.UPLOAD_DIR
 UPLOAD_DIR.mkdir(exist_ok=True)
 
-# ==========================================================
-# --- POSTGRESQL CONNECTION SETTINGS ---
-# ==========================================================
-DB_HOST = os.environ.get("DB_HOST", "localhost")
-DB_PORT = int(os.environ.get("DB_PORT", "5432"))
-DB_NAME = os.environ.get("DB_NAME", "thermoteq_db")
-DB_USER = os.environ.get("DB_USER", "postgres")
-DB_PASSWORD = os.environ.get("DB_PASSWORD", "kahenisatima")  # replace with your password
-
-def get_db_connection():
-    return psycopg2.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD
-    )
-
 # ==========================================================
 # --- TAB NAVIGATION ---
 # ==========================================================
-tabs = ["Projects & Files", "Manage Users"]
+tabs = ["Projects & Files", "Manage Users", "Storage", "Trash", "Background Jobs", "Performance"]
 selected_tab = st.sidebar.radio("Admin Panel Sections", tabs)
 
 # ==========================================================
@@ -66,8 +49,14 @@ selected_tab = st.sidebar.radio("Admin Panel Sections", tabs)
 if selected_tab == "Projects & Files":
     st.subheader("📂 Projects & Files Management")
 
-    projects = [p for p in PROJECTS_DIR.iterdir() if p.is_dir()]
-    uploaded_files = [f for f in UPLOAD_DIR.iterdir() if f.is_file()]
+    # Read from the project index and the files table, not the filesystem
+    catalog.start_watcher()
+    try:
+        projects = [PROJECTS_DIR / name for name in catalog.list_projects()]
+        uploaded_files = all_files()  # cached until the files table changes
+    except Exception as e:
+        st.error(f"⚠️ Could not load projects and files from database: {e}")
+        projects, uploaded_files = [], []
 
     st.markdown("### 🏗️ Projects")
     if not projects:
@@ -75,19 +64,19 @@ if selected_tab == "Projects & Files":
     else:
         for project in projects:
             with st.expander(f"📘 {project.name}", expanded=False):
-                st.write(f"**Path:** `{project.resolve()}`")
+                st.write(f"**Path:** `{project.absolute()}`")
                 # Delete project
                 if st.button(f"🗑️ Delete Project", key=f"del_proj_{project.name}"):
-                    shutil.rmtree(project)
-                    st.success(f"✅ Project '{project.name}' deleted successfully.")
+                    catalog.delete_project(project.name, deleted_by=st.session_state.get("username"))
+                    st.success(f"✅ Project '{project.name}' moved to the trash.")
                     st.session_state["refresh_admin"] = not st.session_state["refresh_admin"]
                     st.rerun()
 
                 # List all files under project folders
-                for folder in ["files", "invoices", "purchases", "images"]:
+                project_files = catalog.list_project_files(project.name)
+                for folder in config.PROJECT_FOLDERS:
                     folder_path = project / folder
-                    folder_path.mkdir(exist_ok=True)
-                    files = list(folder_path.glob("*"))
+                    files = [folder_path / row["file_name"] for row in project_files[folder]]
                     st.markdown(f"**{folder.capitalize()}**")
                     if not files:
                         st.write("_No files_")
@@ -98,8 +87,9 @@ if selected_tab == "Projects & Files":
                                 st.write(f.name)
                             with col2:
                                 if st.button("🗑️", key=f"del_{project.name}_{folder}_{f.name}_{idx}"):
-                                    f.unlink()
-                                    st.success(f"✅ File '{f.name}' deleted successfully.")
+                                    catalog.remove_file(project.name, folder, f.name,
+                                                        deleted_by=st.session_state.get("username"))
+                                    st.success(f"✅ File '{f.name}' moved to the trash.")
                                     st.session_state["refresh_admin"] = not st.session_state["refresh_admin"]
                                     st.rerun()
 
@@ -110,11 +100,12 @@ if selected_tab == "Projects & Files":
         for f in uploaded_files:
             col1, col2 = st.columns([8, 1])
             with col1:
-                st.write(f.name)
+                status = "" if f["integrity_status"] == "ok" else f" — ⚠️ {f['integrity_status']}"
+                st.write(f["file_name"] + status)
             with col2:
-                if st.button("🗑️", key=f"del_upload_{f.name}"):
-                    f.unlink()
-                    st.success(f"✅ File '{f.name}' deleted successfully.")
+                if st.button("🗑️", key=f"del_upload_{f['file_id']}"):
+                    delete_file(f["file_id"], deleted_by=st.session_state.get("username"))
+                    st.success(f"✅ File '{f['file_name']}' moved to the trash.")
                     st.session_state["refresh_admin"] = not st.session_state["refresh_admin"]
                     st.rerun()
 
@@ -128,13 +119,8 @@ elif selected_tab == "Manage Users":
 
     # --- Fetch users from DB ---
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute("SELECT user_id, username, role, created_at FROM users ORDER BY user_id;")
-        users = cur.fetchall()
-        df = pd.DataFrame(users, columns=["user_id", "username", "role", "created_at"])
-        cur.close()
-        conn.close()
+        user_rows = users.list_users()  # cached until the users table changes
+        df = pd.DataFrame(user_rows, columns=["user_id", "username", "role", "created_at"])
     except Exception as e:
         st.error(f"⚠️ Could not fetch users: {e}")
         df = pd.DataFrame()
@@ -159,21 +145,18 @@ elif selected_tab == "Manage Users":
         if submitted:
             if new_username and new_password:
                 try:
-                    conn = get_db_connection()
-                    cur = conn.cursor()
-                    cur.execute("SELECT username FROM users WHERE username=%s;", (new_username,))
-                    if cur.fetchone():
-                        st.error("❌ Username already exists.")
-                    else:
-                        hashed = bcrypt.hashpw(new_password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
-                        cur.execute(
-                            "INSERT INTO users (username, password_hash, role) VALUES (%s, %s, %s);",
-                            (new_username, hashed, new_role)
-                        )
-                        conn.commit()
-                        st.success(f"✅ User '{new_username}' added successfully!")
-                    cur.close()
-                    conn.close()
+                    hashed = auth.hash_password(new_password)  # before borrowing a connection
+                    with db.get_cursor() as cur:
+                        cur.execute("SELECT username FROM users WHERE lower(username)=lower(%s);", (new_username,))
+                        if cur.fetchone():
+                            st.error("❌ Username already exists.")
+                        else:
+                            cur.execute(
+                                "INSERT INTO users (username, password_hash, role) VALUES (%s, %s, %s);",
+                                (new_username, hashed, new_role)
+                            )
+                            st.success(f"✅ User '{new_username}' added successfully!")
+                    users.invalidate_credentials()
                     st.session_state["refresh_admin"] = not st.session_state["refresh_admin"]
                     st.rerun()
                 except Exception as e:
@@ -190,19 +173,16 @@ elif selected_tab == "Manage Users":
         new_role = st.selectbox("New Role", ["user", "admin"], index=0)
         if st.button("Update User"):
             try:
-                conn = get_db_connection()
-                cur = conn.cursor()
-                # Update password only if provided
-                if new_password:
-                    hashed = bcrypt.hashpw(new_password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
-                    cur.execute("UPDATE users SET password_hash=%s, role=%s WHERE username=%s;", 
-                                (hashed, new_role, selected_user))
-                else:
-                    cur.execute("UPDATE users SET role=%s WHERE username=%s;", 
-                                (new_role, selected_user))
-                conn.commit()
-                cur.close()
-                conn.close()
+                hashed = auth.hash_password(new_password) if new_password else None
+                with db.get_cursor() as cur:
+                    # Update password only if provided
+                    if hashed:
+                        cur.execute("UPDATE users SET password_hash=%s, role=%s WHERE username=%s;", 
+                                    (hashed, new_role, selected_user))
+                    else:
+                        cur.execute("UPDATE users SET role=%s WHERE username=%s;", 
+                                    (new_role, selected_user))
+                users.invalidate_credentials()
                 st.success(f"✅ User '{selected_user}' updated successfully!")
                 st.session_state["refresh_admin"] = not st.session_state["refresh_admin"]
                 st.rerun()
@@ -216,18 +196,387 @@ elif selected_tab == "Manage Users":
         selected_user = st.selectbox("Select user to delete", df["username"].tolist(), key="delete_user")
         if st.button("Delete Selected User"):
             try:
-                conn = get_db_connection()
-                cur = conn.cursor()
-                cur.execute("DELETE FROM users WHERE username=%s;", (selected_user,))
-                conn.commit()
-                cur.close()
-                conn.close()
+                with db.get_cursor() as cur:
+                    cur.execute("DELETE FROM users WHERE username=%s;", (selected_user,))
+                users.invalidate_credentials()
                 st.success(f"✅ User '{selected_user}' deleted successfully.")
                 st.session_state["refresh_admin"] = not st.session_state["refresh_admin"]
                 st.rerun()
             except Exception as e:
                 st.error(f"⚠️ Could not delete user: {e}")
 
+    # --- Import / Export ---
+    st.markdown("---")
+    st.subheader("📥 Import / Export Users")
+    st.markdown(
+        "Import a CSV with the columns **username**, **password** and **role** (`user` or `admin`). "
+        "Existing users are updated; a blank password keeps their current one."
+    )
+    with st.form("import_users_form", clear_on_submit=True):
+        users_csv = st.file_uploader("Users CSV", type=["csv"])
+        import_submitted = st.form_submit_button("Import Users")
+    if import_submitted and users_csv is not None:
+        try:
+            rows, failures = users.parse_csv(users_csv)
+            with st.spinner(f"Importing {len(rows)} users…"):
+                report = users.import_users(rows)
+        except (UnicodeDecodeError, ValueError) as e:
+            st.error(f"❌ Could not read the CSV: {e}")
+        except Exception as e:
+            st.error(f"⚠️ Could not import users: {e}")
+        else:
+            failures = sorted(failures + report["failures"])
+            st.session_state["user_import_report"] = {**report, "failures": failures}
+            st.session_state["refresh_admin"] = not st.session_state["refresh_admin"]
+            st.rerun()
+
+    report = st.session_state.get("user_import_report")
+    if report:
+        st.success(f"✅ {report['created']} users created, {report['updated']} updated.")
+        if report["failures"]:
+            st.warning(f"⚠️ {len(report['failures'])} rows were not imported:")
+            st.dataframe(pd.DataFrame(report["failures"], columns=["line", "username", "reason"]), hide_index=True)
+
+    csv_download_button("📤 Export Users (CSV)", web.users_export_url(), users.iter_csv, "users.csv", key="export_users")
+
+# ==========================================================
+# --- TAB 3: STORAGE ---
+# Usage from the trigger-maintained rollups (tms/usage.py) and the
+# results of the worker's storage check and checksum scrub
+# (tms/integrity.py); nothing here touches the filesystem.
+# ==========================================================
+elif selected_tab == "Storage":
+    st.subheader("📊 Storage Usage")
+    try:
+        usage_totals = usage.totals()
+        project_usage = usage.by_project()
+        type_usage = usage.by_dimension("type")
+        uploader_usage = usage.by_dimension("uploader")
+        growth_rows = usage.growth()
+    except Exception as e:
+        st.error(f"⚠️ Could not load storage usage: {e}")
+        usage_totals, project_usage, type_usage, uploader_usage, growth_rows = {}, [], [], [], []
+
+    if usage_totals:
+        ucol1, ucol2, ucol3, ucol4 = st.columns(4)
+        ucol1.metric("Stored files", usage.format_bytes(usage_totals["logical_bytes"]),
+                     f"{usage_totals['files']} files", delta_color="off")
+        ucol2.metric("On disk", usage.format_bytes(usage_totals["disk_bytes"]),
+                     f"{usage_totals['blobs']} blobs", delta_color="off")
+        ucol3.metric("Saved by deduplication", usage.format_bytes(usage_totals["dedupe_savings"]))
+        ucol4.metric("In the trash", usage.format_bytes(usage_totals["trash_bytes"]),
+                     f"{usage_totals['trash_files']} files", delta_color="off")
+        st.caption(
+            f"Company files {usage.format_bytes(usage_totals['company_bytes'])} · "
+            f"project files {usage.format_bytes(usage_totals['project_bytes'])}. "
+            "Trashed files count until they are purged."
+        )
+
+    st.markdown("#### 📁 Largest Projects")
+    if project_usage:
+        project_df = pd.DataFrame([
+            {"Project": row["project"], "Files": row["file_count"], "MB": row["total_bytes"] / 1024 ** 2,
+             **{folder: usage.format_bytes(row["folders"].get(folder)) for folder in config.PROJECT_FOLDERS}}
+            for row in project_usage
+        ])
+        st.bar_chart(project_df.set_index("Project")["MB"])
+        st.dataframe(project_df.drop(columns="MB"), hide_index=True)
+    else:
+        st.info("No project files yet.")
+
+    ucol1, ucol2 = st.columns(2)
+    for col, title, rows, label in (
+        (ucol1, "#### 🧾 By File Type", type_usage, "Type"),
+        (ucol2, "#### 👤 By Uploader", uploader_usage, "Uploader"),
+    ):
+        with col:
+            st.markdown(title)
+            if rows:
+                st.dataframe(pd.DataFrame([
+                    {label: row["key"], "Files": row["file_count"], "Size": usage.format_bytes(row["total_bytes"])}
+                    for row in rows
+                ]), hide_index=True)
+            else:
+                st.info("Nothing stored yet.")
+
+    st.markdown("#### 📈 Growth (last 90 days)")
+    if growth_rows:
+        growth_df = pd.DataFrame(growth_rows)
+        growth_df["MB"] = growth_df["total_bytes"].astype(float) / 1024 ** 2
+        st.line_chart(growth_df.pivot(index="day", columns="area", values="MB").ffill().fillna(0))
+    else:
+        st.info("No uploads in the last 90 days.")
+
+    st.markdown("---")
+    st.subheader("🩺 Storage Integrity")
+    try:
+        health = integrity.summary()
+        problem_rows = integrity.problems()
+        orphan_rows = integrity.orphans()
+    except Exception as e:
+        st.error(f"⚠️ Could not load storage status: {e}")
+        health, problem_rows, orphan_rows = {}, [], []
+
+    if health:
+        for col, (status, count) in zip(st.columns(len(health)), health.items()):
+            col.metric(status.capitalize(), count)
+
+    st.markdown("#### ⚠️ Missing or Damaged Files")
+    if problem_rows:
+        st.dataframe(pd.DataFrame(problem_rows), hide_index=True)
+    else:
+        st.info("No missing or corrupt files found.")
+
+    st.markdown("#### 🧩 Files Without a Database Row")
+    if orphan_rows:
+        st.caption("Found on disk by the last check but not referenced by any file record.")
+        st.dataframe(pd.DataFrame(orphan_rows), hide_index=True)
+    else:
+        st.info("No orphaned files found.")
+
+    scol1, scol2 = st.columns(2)
+    with scol1:
+        if st.button("🔍 Check Storage Now"):
+            job_id = jobs.enqueue("check_storage", dedupe_key="manual", enqueued_by=st.session_state.get("username"))
+            st.success(f"✅ Storage check queued as job {job_id}.")
+    with scol2:
+        if st.button("🧪 Verify Checksums Now"):
+            job_id = jobs.enqueue("scrub_files", dedupe_key="manual", enqueued_by=st.session_state.get("username"))
+            st.success(f"✅ Checksum scrub queued as job {job_id}.")
+
+# ==========================================================
+# --- TAB 4: TRASH ---
+# Deleted projects and files (tms/trash.py) until the worker purges
+# them TRASH_RETENTION_DAYS after deletion.
+# ==========================================================
+elif selected_tab == "Trash":
+    st.subheader("🗑️ Trash")
+    st.markdown(
+        f"Deleted items are kept for **{config.TRASH_RETENTION_DAYS:g} days** "
+        "and then removed permanently by the background worker."
+    )
+
+    RESTORE = {
+        "projects": catalog.restore_project,
+        "project_files": catalog.restore_file,
+        "files": restore_file,
+    }
+    KIND_LABELS = {"projects": "Project", "project_files": "Project file", "files": "Company file"}
+
+    try:
+        trashed = trash.list_items()
+    except Exception as e:
+        st.error(f"⚠️ Could not load the trash: {e}")
+        trashed = []
+
+    if not trashed:
+        st.info("The trash is empty.")
+    for item in trashed:
+        col1, col2, col3 = st.columns([6, 3, 1])
+        with col1:
+            st.write(f"**{item['name']}** — {KIND_LABELS[item['kind']]}"
+                     + (f" in {item['location']}" if item["location"] else ""))
+        with col2:
+            st.caption(
+                f"Deleted {item['deleted_at']:%Y-%m-%d %H:%M}"
+                + (f" by {item['deleted_by']}" if item["deleted_by"] else "")
+                + f" · purged after {item['purge_after']:%Y-%m-%d}"
+            )
+        with col3:
+            if st.button("↩️", key=f"restore_{item['kind']}_{item['item_id']}", help="Restore"):
+                try:
+                    restored = RESTORE[item["kind"]](item["item_id"])
+                except ValueError as e:
+                    st.error(f"❌ {e}")
+                else:
+                    if restored:
+                        st.session_state["refresh_admin"] = not st.session_state["refresh_admin"]
+                        st.rerun()
+                    st.warning("⚠️ Already restored or purged.")
+
+    def empty_trash():
+        # Button callback: unticks the confirmation before the checkbox is drawn again
+        st.session_state["empty_trash_job"] = jobs.enqueue(
+            "purge_trash", {"retention_days": 0}, dedupe_key="empty", enqueued_by=st.session_state.get("username")
+        )
+        st.session_state["confirm_empty_trash"] = False
+
+    if trashed:
+        st.markdown("---")
+        # Cannot be undone, so it takes a second, explicit step
+        confirm_empty = st.checkbox(
+            f"I understand that all {len(trashed)} item(s) in the trash will be deleted permanently.",
+            key="confirm_empty_trash",
+        )
+        st.button("🧹 Empty Trash Now", disabled=not confirm_empty, on_click=empty_trash)
+        job_id = st.session_state.pop("empty_trash_job", None)
+        if job_id:
+            st.success(f"✅ Purge queued as job {job_id}; see Background Jobs.")
+
+# ==========================================================
+# --- TAB 5: BACKGROUND JOBS ---
+# Queue state for worker.py (tms/jobs.py). Refreshes itself while
+# jobs are waiting or running.
+# ==========================================================
+elif selected_tab == "Background Jobs":
+    st.subheader("⚙️ Background Jobs")
+    st.markdown("Work done outside the web server by `python worker.py`.")
+
+    @st.fragment(run_every=config.JOB_STATUS_POLL_INTERVAL)
+    def job_status():
+        try:
+            job_counts = jobs.counts()
+            status_filter = st.session_state.get("jobs_status_filter")
+            job_rows = jobs.recent(limit=200, status=None if status_filter == "all" else status_filter)
+        except Exception as e:
+            st.error(f"⚠️ Could not load jobs: {e}")
+            return
+
+        cols = st.columns(len(job_counts))
+        for col, (status, count) in zip(cols, job_counts.items()):
+            col.metric(status.capitalize(), count)
+
+        if not job_rows:
+            st.info("No jobs to show.")
+            return
+        df = pd.DataFrame([dict(row) for row in job_rows])
+        df["payload"] = df["payload"].astype(str)
+        st.dataframe(df, hide_index=True)
+
+    st.radio("Show", ["all"] + jobs.STATUSES, horizontal=True, key="jobs_status_filter")
+    job_status()
+
+    st.markdown("---")
+    jcol1, jcol2 = st.columns(2)
+    with jcol1:
+        st.markdown("**Retry a failed job**")
+        retry_id = st.number_input("Job ID", min_value=1, step=1, key="jobs_retry_id")
+        if st.button("🔁 Retry Job"):
+            if jobs.retry(int(retry_id)):
+                st.success(f"✅ Job {int(retry_id)} queued again.")
+            else:
+                st.error("❌ Only failed jobs can be retried.")
+    with jcol2:
+        st.markdown("**Document search index**")
+        if st.button("🔎 Re-index documents now"):
+            job_id = jobs.enqueue("index_documents", dedupe_key="all", enqueued_by=st.session_state.get("username"))
+            st.success(f"✅ Indexing queued as job {job_id}.")
+
+# ==========================================================
+# --- TAB 6: PERFORMANCE ---
+# Timings and byte counts of this server process since it started
+# or was reset (tms/metrics.py), or of all server processes merged
+# from their heartbeats (tms/instances.py). Times are shown in
+# milliseconds.
+# ==========================================================
+elif selected_tab == "Performance":
+    st.subheader("⏱️ Performance")
+    if not config.METRICS_ENABLED:
+        st.info("Metrics are switched off (TMS_METRICS=0).")
+        st.stop()
+
+    try:
+        processes = instances.live()
+    except Exception as e:
+        processes = []
+        st.warning(f"⚠️ Could not list the server processes: {e}")
+    scope = "This process"
+    if len(processes) > 1:
+        scope = st.radio("Show", ["This process", "All processes"], horizontal=True, key="perf_scope")
+    if scope == "All processes":
+        perf = metrics.merged_snapshot([row["metrics"] for row in processes])
+        st.caption(f"{len(processes)} server processes, since {datetime.fromtimestamp(perf['since']):%Y-%m-%d %H:%M:%S}; "
+                   f"the others as of their last heartbeat (every {config.INSTANCE_HEARTBEAT_INTERVAL:g} s).")
+    else:
+        perf = metrics.snapshot()
+        st.caption(f"This server process ({instances.INSTANCE_ID}), "
+                   f"since {datetime.fromtimestamp(perf['since']):%Y-%m-%d %H:%M:%S}.")
+
+    if len(processes) > 1:
+        st.markdown("#### 🖥️ Server Processes")
+        for problem in instances.deployment_problems():
+            st.warning(f"⚠️ {problem}")
+        st.dataframe(pd.DataFrame([
+            {
+                "Process": row["instance_id"] + (" (this one)" if row["instance_id"] == instances.INSTANCE_ID else ""),
+                "Started": row["started_at"],
+                "Last heartbeat": row["seen_at"],
+                "Ready after (s)": row["metrics"].get("startup", {}).get("marks", {}).get("ready"),
+                "Script runs": sum(h[3] for h in row["metrics"].get("histograms", [])
+                                   if h[0] == "tms_script_run_seconds"),
+            }
+            for row in processes
+        ]), hide_index=True)
+
+    def histogram_table(name, columns, scale=1000):
+        rows = [row for row in perf["histograms"] if row["metric"] == name]
+        if not rows:
+            st.info("Nothing recorded yet.")
+            return
+        df = pd.DataFrame(rows)[columns + ["count", "mean", "p50", "p95", "p99"]]
+        for column in ("mean", "p50", "p95", "p99"):
+            df[column] = (df[column].astype(float) * scale).round(1)
+        st.dataframe(df.sort_values("p95", ascending=False), hide_index=True)
+
+    st.markdown("#### 📄 Script Runs (ms)")
+    histogram_table("tms_script_run_seconds", ["page", "kind"])
+    st.markdown("#### 🗄️ Database Statements (ms)")
+    histogram_table("tms_db_query_seconds", ["statement"])
+    st.markdown("#### 🔢 Statements per Script Run")
+    histogram_table("tms_script_run_queries", ["page"], scale=1)
+    st.markdown("#### 📂 Directory Scans (ms)")
+    histogram_table("tms_fs_scan_seconds", ["area"])
+
+    st.markdown("#### 🚀 Startup (s)")
+    startup = perf.get("startup", {"marks": {}, "phases": {}})
+    if scope == "All processes":
+        st.caption("Per process: see “Ready after” above, or switch to this process.")
+    elif startup["marks"] or startup["phases"]:
+        st.caption(f"Process started {datetime.fromtimestamp(startup['started']):%Y-%m-%d %H:%M:%S}; "
+                   "milestones are seconds since then, warm-up steps are durations.")
+        scol1, scol2 = st.columns(2)
+        scol1.dataframe(pd.DataFrame(
+            [{"Milestone": mark, "Seconds": round(seconds, 3)} for mark, seconds in startup["marks"].items()]
+        ), hide_index=True)
+        scol2.dataframe(pd.DataFrame(
+            [{"Warm-up step": phase, "Seconds": round(seconds, 3)} for phase, seconds in startup["phases"].items()]
+        ), hide_index=True)
+    else:
+        st.info("Nothing recorded yet.")
+
+    st.markdown("#### 📦 Bytes")
+    byte_rows = [
+        {"What": f"{'Read' if row['metric'] == 'tms_file_read_bytes_total' else 'Sent'}: "
+                 f"{row.get('source') or row.get('channel')}",
+         "Bytes": usage.format_bytes(row["value"])}
+        for row in perf["counters"]
+    ]
+    if perf.get("process_io"):
+        byte_rows.append({"What": "Read from storage (whole process)", "Bytes": usage.format_bytes(perf["process_io"]["read"])})
+    if byte_rows:
+        st.dataframe(pd.DataFrame(byte_rows), hide_index=True)
+    else:
+        st.info("Nothing recorded yet.")
+    if not web.SERVED:
+        st.caption("Bytes sent are only counted when the app runs through server.py.")
+
+    st.markdown("---")
+    pcol1, pcol2 = st.columns(2)
+    with pcol1:
+        st.download_button(
+            "📤 Prometheus Metrics",
+            data=metrics.render_prometheus,
+            file_name="tms_metrics.txt",
+            mime="text/plain",
+            on_click="ignore",
+        )
+        if web.SERVED:
+            st.caption("Also served at `/tms/metrics` (see TMS_METRICS_TOKEN).")
+    with pcol2:
+        if st.button("♻️ Reset Metrics"):
+            metrics.reset()
+            st.rerun()
+
 # ==========================================================
 # --- PAGE REFRESH ---
 # ==========================================================
@@ -0,0 +1,51 @@
+import streamlit as st
+from pathlib import Path
+
+from tms import config, jobs, search, sessions, web
+from tms.downloads import download_button
+
+# --- PAGE CONFIG ---
+st.set_page_config(page_title="Thermoteq Document Search", layout="wide")
+sessions.sync()
+st.title("🔎 Thermoteq Document Search")
+st.write("Search inside quotes, invoices, purchase orders and other uploaded documents.")
+
+# --- BACKGROUND INDEXING --- (by the worker; one catch-up pass per session)
+if "search_index_requested" not in st.session_state:
+    st.session_state["search_index_requested"] = True
+    jobs.enqueue("index_documents", dedupe_key="all")
+
+query = st.text_input(
+    "Search documents",
+    placeholder='e.g. tanzania mine office quote, "steel frame", invoice -draft',
+).strip()
+
+if query:
+    try:
+        results = search.search(query)
+    except Exception as e:
+        st.error(f"⚠️ Could not search documents: {e}")
+        results = []
+
+    if not results:
+        st.info("No documents match your search.")
+    else:
+        st.caption(f"{len(results)} best matches")
+        for idx, result in enumerate(results):
+            if result["file_id"] is not None:
+                location = "📁 Company files"
+                file_path = Path(result["file_path"])
+                url = web.company_file_url(result["file_id"])
+            else:
+                location = f"📘 {result['project_name']} / {result['folder']}"
+                file_path = config.PROJECTS_DIR / result["project_name"] / result["folder"] / result["title"]
+                url = web.project_file_url(result["project_name"], result["folder"], result["title"])
+
+            col1, col2 = st.columns([8, 1])
+            with col1:
+                st.markdown(f"**📄 {result['title']}** — {location}")
+                if result["snippet"]:
+                    st.markdown(f"<small>{result['snippet']}</small>", unsafe_allow_html=True)
+            with col2:
+                download_button("📥", url, file_path, result["title"], key=f"search_download_{idx}")
+            st.markdown("---")
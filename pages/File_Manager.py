@@ -1,32 +1,18 @@
 import streamlit as st
+from functools import partial
 from pathlib import Path
-import psycopg2
-import psycopg2.extras
-import base64
-from datetime import datetime
-import os
+
+from tms import bulk, config, export, jobs, sessions, web
+from tms.downloads import download_button, zip_download_button
+from tms.files import PAGE_SIZES, delete_file, get_file, list_files, save_uploads
+from tms.preview import pdf_preview
 
 # --- PAGE CONFIG ---
 st.set_page_config(page_title="Thermoteq File Manager", layout="wide")
+sessions.sync()
 st.title("📁 Thermoteq File Manager")
 st.write("Upload, preview, and manage your files securely.")
 
-# --- DATABASE CONNECTION ---
-DB_HOST = os.environ.get("DB_HOST", "localhost")
-DB_PORT = int(os.environ.get("DB_PORT", "5432"))
-DB_NAME = os.environ.get("DB_NAME", "thermoteq_db")
-DB_USER = os.environ.get("DB_USER", "postgres")
-DB_PASSWORD = os.environ.get("DB_PASSWORD", "kahenisatima")
-
-def get_db_connection():
-    return psycopg2.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD
-    )
-
 # --- SESSION STATE ---
 if "preview_file_id" not in st.session_state:
     st.session_state["preview_file_id"] = None
@@ -36,147 +22,268 @@ if "user_role" not in st.session_state:
     st.session_state["user_role"] = "user"
 if "user_id" not in st.session_state:
     st.session_state["user_id"] = 1
-if "uploaded" not in st.session_state:
-    st.session_state["uploaded"] = False
+if "files_page_cursors" not in st.session_state:
+    # Stack of keyset cursors: the last entry is the start of the current page
+    st.session_state["files_page_cursors"] = [None]
+if "files_filter_key" not in st.session_state:
+    st.session_state["files_filter_key"] = None
+if "files_selected" not in st.session_state:
+    # file_ids ticked for a zip export; kept across pages and filters
+    st.session_state["files_selected"] = set()
+
+
+# --- ROW & PAGE ACTIONS ---
+# Button callbacks run before their fragment reruns, so the change
+# shows without an extra st.rerun() of the whole page.
+def toggle_selected(file_id):
+    if st.session_state[f"select_{file_id}"]:
+        st.session_state["files_selected"].add(file_id)
+    else:
+        st.session_state["files_selected"].discard(file_id)
+
+
+def open_preview(file_id):
+    st.session_state["preview_file_id"] = file_id
+
+
+def close_preview(file_id):
+    st.session_state["last_viewed_file_id"] = file_id
+    st.session_state["preview_file_id"] = None
+
+
+def delete_row(file_id, file_name):
+    try:
+        # Moves the file to the trash (restorable by an admin) and
+        # invalidates the cached listing
+        delete_file(file_id, deleted_by=st.session_state.get("username"))
+    except Exception as e:
+        st.session_state["files_notice"] = ("error", f"⚠️ Could not delete file: {e}")
+        return
+    st.session_state["files_notice"] = ("success", f"✅ '{file_name}' moved to the trash.")
+
+    # Reset preview/last viewed/selection states if needed
+    st.session_state["files_selected"].discard(file_id)
+    if st.session_state.get("preview_file_id") == file_id:
+        st.session_state["preview_file_id"] = None
+    if st.session_state.get("last_viewed_file_id") == file_id:
+        st.session_state["last_viewed_file_id"] = None
+
+
+def change_page(step, cursor=None):
+    if step > 0:
+        st.session_state["files_page_cursors"].append(cursor)
+    else:
+        st.session_state["files_page_cursors"].pop()
+
 
-UPLOAD_DIR = Path("uploads")
+UPLOAD_DIR = config.UPLOAD_DIR
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# ==========================================================
 # --- UPLOAD MODE --- (Always on Top)
-st.markdown("### 📤 Upload File")
-uploaded_file = st.file_uploader(
-    "Select a file", type=["pdf", "docx", "xlsx", "txt", "csv"], key="upload"
-)
+# Each section below is a fragment: its widgets rerun only that
+# section. Only a finished upload reruns the page, so the list
+# picks up the new files.
+# ==========================================================
+UPLOAD_TYPES = ["pdf", "docx", "xlsx", "txt", "csv"]
 
-if uploaded_file and not st.session_state["uploaded"]:
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    unique_filename = f"{timestamp}_{uploaded_file.name}"
-    save_path = UPLOAD_DIR / unique_filename
 
-    with open(save_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+@st.fragment
+def upload_section():
+    st.markdown("### 📤 Upload Files")
+    report = st.session_state.pop("upload_report", None)
+    if report:
+        bulk.report(*report)
+    uploaded_files = st.file_uploader(
+        "Select files or a .zip archive", type=UPLOAD_TYPES + ["zip"], accept_multiple_files=True, key="upload"
+    )
 
+    new_uploads = bulk.pending(uploaded_files or [], "uploaded")
+    if not new_uploads:
+        return
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO files (file_name, file_path, uploaded_by) VALUES (%s, %s, %s) RETURNING file_id;",
-            (uploaded_file.name, str(save_path), st.session_state["user_id"])
+        # Streamed to disk in parallel, recorded one INSERT per batch (tms/bulk.py)
+        items, skipped = bulk.expand(new_uploads, UPLOAD_TYPES)
+        file_ids, failures = save_uploads(
+            items, st.session_state["user_id"], progress=bulk.progress_bar("Uploading…")
         )
-        conn.commit()
-        cur.close()
-        conn.close()
-        st.success(f"✅ '{uploaded_file.name}' uploaded successfully!")
-        st.session_state["uploaded"] = True
-        st.rerun()
     except Exception as e:
-        st.error(f"⚠️ Could not save file to database: {e}")
+        st.error(f"⚠️ Could not save files to database: {e}")
+        return
+    finally:
+        # Even after an error: batches already recorded must not be saved again
+        bulk.mark_done(new_uploads, "uploaded")
+    jobs.enqueue("index_documents", dedupe_key="all")
+    st.session_state["upload_report"] = (len(file_ids), skipped + failures)
+    st.session_state["files_page_cursors"] = [None]
+    st.rerun()
+
 
+# ==========================================================
 # --- FILE PREVIEW MODE ---
-if st.session_state["preview_file_id"]:
-    file_id = st.session_state["preview_file_id"]
+# ==========================================================
+def preview_pane(file_id):
+    """Show one file; False if it no longer exists."""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute("SELECT file_name, file_path FROM files WHERE file_id=%s;", (file_id,))
-        file_data = cur.fetchone()
-        cur.close()
-        conn.close()
+        file_data = get_file(file_id)
     except Exception as e:
         st.error(f"⚠️ Could not fetch file: {e}")
         st.stop()
 
     if not file_data:
         st.error("❌ File not found in database.")
-        st.session_state["preview_file_id"] = None
-        st.rerun()
+        return False
 
     file_name = file_data["file_name"]
     file_path = Path(file_data["file_path"])
 
     st.subheader(f"📄 Preview: {file_name}")
 
-    if st.button("⬅️ Back to File List"):
-        st.session_state["last_viewed_file_id"] = file_id
-        st.session_state["preview_file_id"] = None
-        st.rerun()
+    st.button("⬅️ Back to File List", on_click=close_preview, args=(file_id,))
 
     if not file_path.exists():
         st.warning("⚠️ File is missing on disk.")
     else:
         ext = file_path.suffix.lower()
         if ext == ".pdf":
-            with open(file_path, "rb") as f:
-                b64_pdf = base64.b64encode(f.read()).decode("utf-8")
-            st.markdown(
-                f'<iframe src="data:application/pdf;base64,{b64_pdf}" width="100%" height="800px" style="border:none;"></iframe>',
-                unsafe_allow_html=True
-            )
+            pdf_preview(file_path, web.company_file_url(file_id, inline=True), key=f"pdf_{file_id}",
+                        sha256=file_data["sha256"])
         elif ext in [".jpg", ".jpeg", ".png"]:
             st.image(file_path, use_container_width=True)
         else:
-            st.download_button("📥 Download File", file_path.open("rb"), file_name=file_name)
+            download_button("📥 Download File", web.company_file_url(file_id), file_path, file_name, key=f"preview_download_{file_id}")
+    return True
 
-# --- LIST FILES --- (Show ONLY when NOT in preview mode)
-if not st.session_state["preview_file_id"]:
+
+# ==========================================================
+# --- LIST FILES --- (cached, see tms/files.py)
+# ==========================================================
+def file_list():
     st.markdown("### 📄 Existing Files")
+    notice = st.session_state.pop("files_notice", None)
+    if notice:
+        getattr(st, notice[0])(notice[1])
+
+    # --- FILTERS & PAGE SIZE --- (applied in SQL, see tms/files.py)
+    fcol1, fcol2, fcol3, fcol4 = st.columns([3, 2, 2, 1])
+    with fcol1:
+        name_filter = st.text_input("🔍 File name contains", key="files_name_filter").strip()
+    with fcol2:
+        uploader_filter = st.text_input("👤 Uploaded by (username)", key="files_uploader_filter").strip()
+    with fcol3:
+        date_range = st.date_input("📅 Uploaded between", value=(), key="files_date_filter")
+    with fcol4:
+        page_size = st.selectbox("Per page", PAGE_SIZES, key="files_page_size")
+
+    date_from = date_range[0] if len(date_range) > 0 else None
+    date_to = date_range[1] if len(date_range) > 1 else None
+
+    # Any filter change starts again from the first page
+    filter_key = (name_filter, uploader_filter, date_from, date_to, page_size)
+    if st.session_state["files_filter_key"] != filter_key:
+        st.session_state["files_filter_key"] = filter_key
+        st.session_state["files_page_cursors"] = [None]
+
+    page_cursors = st.session_state["files_page_cursors"]
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute("SELECT file_id, file_name, file_path, uploaded_at FROM files ORDER BY uploaded_at DESC;")
-        files = cur.fetchall()
-        cur.close()
-        conn.close()
+        files, next_cursor = list_files(
+            page_size,
+            after=page_cursors[-1],
+            name=name_filter,
+            uploader=uploader_filter,
+            date_from=date_from,
+            date_to=date_to,
+        )
     except Exception as e:
         st.error(f"⚠️ Could not fetch files from database: {e}")
-        files = []
+        files, next_cursor = [], None
 
     if files:
         for file in files:
             file_path = Path(file["file_path"])
-            col1, col2, col3, col4 = st.columns([4, 1, 1, 1])
+            # Kept current by the worker's storage check (tms/integrity.py)
+            on_disk = file["integrity_status"] != "missing"
+            col0, col1, col2, col3, col4 = st.columns([0.3, 4, 1, 1, 1])
+            with col0:
+                st.checkbox(
+                    "Select",
+                    value=file["file_id"] in st.session_state["files_selected"],
+                    key=f"select_{file['file_id']}",
+                    on_change=toggle_selected,
+                    args=(file["file_id"],),
+                    label_visibility="collapsed",
+                )
             with col1:
                 # Highlight only after clicking back
                 if file["file_id"] == st.session_state.get("last_viewed_file_id"):
                     st.markdown(f"<span style='color:red; font-weight:bold;'>📎 {file['file_name']}</span>", unsafe_allow_html=True)
                 else:
                     st.write(f"📎 {file['file_name']}")
+                if file["integrity_status"] == "corrupt":
+                    st.caption("⚠️ Checksum mismatch: this file may be damaged.")
             with col2:
-                if file_path.exists():
-                    if st.button("👁️ View", key=f"view_{file['file_id']}"):
-                        st.session_state["preview_file_id"] = file["file_id"]
-                        st.rerun()
+                if on_disk:
+                    st.button("👁️ View", key=f"view_{file['file_id']}", on_click=open_preview, args=(file["file_id"],))
                 else:
                     st.warning("⚠️ File missing")
             with col3:
-                if file_path.exists():
-                    with file_path.open("rb") as f:
-                        st.download_button("📥", f, file_name=file["file_name"], key=f"download_{file['file_id']}")
+                if on_disk:
+                    download_button(
+                        "📥",
+                        web.company_file_url(file["file_id"]),
+                        file_path,
+                        file["file_name"],
+                        key=f"download_{file['file_id']}",
+                    )
                 else:
                     st.warning("⚠️ Missing")
             with col4:
-                if st.button("🗑️ Delete", key=f"delete_{file['file_id']}"):
-                    try:
-                        # Delete from disk
-                        if file_path.exists():
-                            file_path.unlink()
-                        # Delete from database
-                        conn = get_db_connection()
-                        cur = conn.cursor()
-                        cur.execute("DELETE FROM files WHERE file_id=%s;", (file["file_id"],))
-                        conn.commit()
-                        cur.close()
-                        conn.close()
-                        st.success(f"✅ '{file['file_name']}' deleted successfully.")
-
-                        # Reset uploaded flag and preview/last viewed states if needed
-                        st.session_state["uploaded"] = False
-                        if st.session_state.get("preview_file_id") == file["file_id"]:
-                            st.session_state["preview_file_id"] = None
-                        if st.session_state.get("last_viewed_file_id") == file["file_id"]:
-                            st.session_state["last_viewed_file_id"] = None
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"⚠️ Could not delete file: {e}")
+                st.button(
+                    "🗑️ Delete",
+                    key=f"delete_{file['file_id']}",
+                    on_click=delete_row,
+                    args=(file["file_id"], file["file_name"]),
+                )
+    elif len(page_cursors) > 1 or filter_key[:4] != ("", "", None, None):
+        st.info("No files match these filters.")
     else:
         st.info("No files uploaded yet.")
+
+    # --- EXPORT SELECTED --- (one streamed zip, tms/export.py)
+    selected = sorted(st.session_state["files_selected"])
+    if selected:
+        ecol1, ecol2 = st.columns([2, 1])
+        with ecol1:
+            zip_download_button(
+                f"📦 Download {len(selected)} selected as .zip",
+                web.files_export_url(selected),
+                partial(export.company_file_entries, selected),
+                "files.zip",
+                key="files_export",
+            )
+        with ecol2:
+            st.button("Clear selection", key="files_clear_selection", on_click=st.session_state["files_selected"].clear)
+
+    # --- PAGINATION ---
+    pcol1, pcol2, pcol3 = st.columns([1, 4, 1])
+    with pcol1:
+        st.button("⬅️ Previous", disabled=len(page_cursors) <= 1, key="files_prev_page", on_click=change_page, args=(-1,))
+    with pcol2:
+        st.caption(f"Page {len(page_cursors)}")
+    with pcol3:
+        st.button("Next ➡️", disabled=next_cursor is None, key="files_next_page", on_click=change_page, args=(1, next_cursor))
+
+
+@st.fragment
+def files_section():
+    # Preview and list share one fragment: switching between them (or
+    # paging, filtering, deleting) reruns only this part of the page.
+    file_id = st.session_state["preview_file_id"]
+    if file_id and preview_pane(file_id):
+        return
+    st.session_state["preview_file_id"] = None
+    file_list()
+
+
+upload_section()
+files_section()
@@ -1,31 +1,31 @@
 import streamlit as st
+from functools import partial
 from pathlib import Path
-import shutil
-import base64
-import psycopg2
-import psycopg2.extras
-
-# --- DATABASE CONNECTION FUNCTION ---
-def get_db_connection():
-    conn = psycopg2.connect(
-        host="localhost",
-        database="thermoteq_db",
-        user="your_user",
-        password="your_password"
-    )
-    return conn
+
+from tms import bulk, catalog, config, export, jobs, sessions, web
+from tms.downloads import download_button, zip_download_button
+from tms.preview import pdf_preview
 
 # --- PAGE CONFIG ---
 st.set_page_config(page_title="Thermoteq Projects", layout="wide")
+sessions.sync()
 
 # --- PAGE TITLE ---
 st.title("📂 Thermoteq Projects")
 st.write("Manage, track, and organize all your projects in one place.")
 
 # --- PROJECTS DIRECTORY ---
-PROJECTS_DIR = Path("projects")
+PROJECTS_DIR = config.PROJECTS_DIR
 PROJECTS_DIR.mkdir(exist_ok=True)
 
+# --- PROJECT INDEX --- (pages read the index, never walk projects/)
+catalog.start_watcher()
+try:
+    indexed_projects = catalog.list_projects()
+except Exception as e:
+    st.error(f"⚠️ Could not load projects from database: {e}")
+    st.stop()
+
 # --- SESSION STATE ---
 for key in [
     "view_file_path",
@@ -39,7 +39,144 @@ for key in [
         st.session_state[key] = None
 
 if st.session_state["project_order"] is None:
-    st.session_state["project_order"] = [p.name for p in PROJECTS_DIR.iterdir() if p.is_dir()]
+    st.session_state["project_order"] = list(indexed_projects)
+
+# --- UPLOADS ---
+# Per folder: accepted types and uploader label (a .zip of them is also accepted)
+UPLOAD_TYPES = {
+    "files": ["pdf", "docx", "xlsx"],
+    "invoices": ["pdf", "xlsx", "docx"],
+    "purchases": ["pdf", "xlsx", "docx"],
+    "images": ["jpg", "jpeg", "png"],
+}
+UPLOAD_LABELS = {"files": "File", "invoices": "Invoice", "purchases": "Purchase", "images": "Image"}
+
+
+def ingest_uploads(project_name, folder, uploads, allowed_types, label):
+    """Save an uploader's new files (or zip contents) into one project folder."""
+    key = f"ingested_{folder}_{project_name}"
+    new_uploads = bulk.pending(uploads or [], key)
+    if not new_uploads:
+        return
+    # Streamed to disk in parallel; a taken name gets a " (n)" suffix
+    items, skipped = bulk.expand(new_uploads, allowed_types)
+    try:
+        saved, failures = catalog.save_files(
+            project_name, folder, items,
+            progress=bulk.progress_bar("Uploading…"),
+            uploaded_by=st.session_state.get("username"),
+        )
+    finally:
+        # Even after an error: batches already recorded must not be saved again
+        bulk.mark_done(new_uploads, key)
+    jobs.enqueue("index_documents", dedupe_key="all")
+    bulk.report(len(saved), skipped + failures, what=label)
+
+
+# ==========================================================
+# --- PROJECT BODY ---
+# A fragment: uploads and deletes inside one project rerun only
+# that project, not the page. Only built for expanded projects.
+# ==========================================================
+def remove_file(project_name, folder, file_name):
+    # Button callback: runs before the fragment rerun, so the row is gone from it
+    try:
+        catalog.remove_file(project_name, folder, file_name, deleted_by=st.session_state.get("username"))
+    except Exception as e:
+        st.session_state[f"notice_{project_name}"] = ("error", f"❌ Could not delete '{file_name}': {e}")
+    else:
+        st.session_state[f"notice_{project_name}"] = ("success", f"✅ Moved '{file_name}' to the trash.")
+
+
+@st.fragment
+def project_body(project):
+    notice = st.session_state.pop(f"notice_{project.name}", None)
+    if notice:
+        getattr(st, notice[0])(notice[1])
+    st.write(f"**Path:** `{project.absolute()}`")
+    # All four folders in one archive, streamed (tms/export.py)
+    zip_download_button(
+        "📦 Export Project (.zip)",
+        web.project_export_url(project.name),
+        partial(export.project_entries, project.name),
+        f"{project.name}.zip",
+        key=f"export_{project.name}",
+    )
+    st.markdown("---")
+
+    # --- UPLOAD FILES ---
+    st.markdown("#### 🧰 Upload Files")
+    for column, (folder, label) in zip(st.columns(4), UPLOAD_LABELS.items()):
+        with column:
+            uploads = st.file_uploader(
+                f"Add {label}s to {project.name}",
+                type=UPLOAD_TYPES[folder] + ["zip"],
+                accept_multiple_files=True,
+                key=f"{folder}_upload_{project.name}",
+            )
+            ingest_uploads(project.name, folder, uploads, UPLOAD_TYPES[folder], label.lower())
+
+    st.markdown("---")
+
+    # --- VIEW & DOWNLOAD FILES ---
+    st.markdown("### 👁️ View & Download Files")
+
+    project_files = catalog.list_project_files(project.name)
+
+    def list_files(folder_path, label):
+        rows = project_files[folder_path.name]
+        st.markdown(f"#### {label}")
+        if not rows:
+            st.caption(f"No {label.lower()} available yet.")
+        else:
+            for idx, row in enumerate(rows):
+                file = folder_path / row["file_name"]
+                is_highlighted = file.name == st.session_state.get("highlight_file")
+                highlight_style = "background-color: #F61111FF; padding:4px; border-radius:6px;" if is_highlighted else ""
+
+                col1, col2, col3, col4 = st.columns([5, 1, 1, 1])
+                with col1:
+                    st.markdown(f"<div style='{highlight_style}'>📄 {file.name}</div>", unsafe_allow_html=True)
+                    if row["integrity_status"] != "ok":
+                        st.caption(f"⚠️ {row['integrity_status'].capitalize()} (last storage check)")
+                with col2:
+                    if st.button("👁️ View", key=f"view_{project.name}_{folder_path.name}_{file.name}_{idx}"):
+                        st.session_state["view_file_path"] = str(file)
+                        st.session_state["view_project_name"] = project.name
+                        st.session_state["expand_project"] = project.name
+                        st.session_state["highlight_file"] = file.name
+                        st.rerun()
+                with col3:
+                    download_button(
+                        "⬇️",
+                        web.project_file_url(project.name, folder_path.name, file.name),
+                        file,
+                        file.name,
+                        key=f"download_{project.name}_{folder_path.name}_{file.name}_{idx}"
+                    )
+                with col4:
+                    if st.session_state.get("user_role") == "admin":
+                        st.button(
+                            "🗑️ Delete",
+                            key=f"delete_{project.name}_{folder_path.name}_{file.name}_{idx}",
+                            on_click=remove_file,
+                            args=(project.name, folder_path.name, file.name),
+                        )
+
+    for folder in config.PROJECT_FOLDERS:
+        list_files(project / folder, folder.capitalize())
+
+    st.markdown("---")
+
+    # --- DELETE PROJECT FOR ADMINS ONLY ---
+    if st.session_state.get("user_role") == "admin":
+        if st.button(f"🗑️ Delete Project: {project.name}", key=f"del_{project.name}"):
+            # Moved to the trash; restorable from the Admin Panel until purged
+            catalog.delete_project(project.name, deleted_by=st.session_state.get("username"))
+            st.rerun()
+    else:
+        st.caption("🔒 Only admins can delete projects.")
+
 
 # ==========================================================
 # --- DISPLAY SELECTED FILE (VIEW MODE) ---
@@ -65,11 +202,13 @@ if st.session_state["view_file_path"]:
 
         ext = file_path.suffix.lower()
         if ext == ".pdf":
-            with open(file_path, "rb") as f:
-                base64_pdf = base64.b64encode(f.read()).decode("utf-8")
-            st.markdown(f"""
-                <iframe src="data:application/pdf;base64,{base64_pdf}#toolbar=1" width="100%" height="750px" style="border:none;"></iframe>
-            """, unsafe_allow_html=True)
+            pdf_preview(
+                file_path,
+                web.project_file_url(project_name, file_path.parent.name, file_path.name, inline=True),
+                key="project_pdf",
+                height=750,
+                sha256=catalog.file_sha256(project_name, file_path.parent.name, file_path.name),
+            )
         elif ext in [".jpg", ".jpeg", ".png"]:
             st.image(str(file_path), use_container_width=True)
         elif ext in [".txt", ".py", ".csv", ".log"]:
@@ -78,8 +217,13 @@ if st.session_state["view_file_path"]:
             st.text_area("File Content", content, height=400)
         else:
             st.warning("⚠️ Preview not supported for this file type.")
-            with open(file_path, "rb") as f:
-                st.download_button(label="📥 Download File", data=f, file_name=file_path.name, mime="application/octet-stream")
+            download_button(
+                "📥 Download File",
+                web.project_file_url(project_name, file_path.parent.name, file_path.name),
+                file_path,
+                file_path.name,
+                key="view_download",
+            )
 
         st.stop()
 
@@ -90,17 +234,13 @@ st.subheader("➕ Create a New Project")
 project_name_input = st.text_input("Enter project name")
 
 if st.button("Create Project"):
-    if project_name_input.strip():
-        project_path = PROJECTS_DIR / project_name_input.strip()
-        if not project_path.exists():
-            for folder in ["files", "invoices", "purchases", "images"]:
-                (project_path / folder).mkdir(parents=True, exist_ok=True)
-            st.success(f"✅ Project **{project_name_input}** created successfully.")
-            st.rerun()
-        else:
-            st.warning("⚠️ A project with that name already exists.")
-    else:
+    if not catalog.valid_project_name(project_name_input.strip()):
         st.error("❌ Please enter a valid project name.")
+    elif catalog.create_project(project_name_input.strip()):
+        st.success(f"✅ Project **{project_name_input}** created successfully.")
+        st.rerun()
+    else:
+        st.warning("⚠️ A project with that name already exists.")
 
 # ==========================================================
 # --- REORDER PROJECTS ---
@@ -111,14 +251,14 @@ if expanded_project and expanded_project in st.session_state["project_order"]:
     st.session_state["project_order"].insert(0, expanded_project)
 
 projects_ordered = []
+indexed_names = set(indexed_projects)
 for name in st.session_state["project_order"]:
-    path = PROJECTS_DIR / name
-    if path.exists() and path.is_dir():
-        projects_ordered.append(path)
-for p in PROJECTS_DIR.iterdir():
-    if p.is_dir() and p not in projects_ordered:
-        projects_ordered.append(p)
-        st.session_state["project_order"].append(p.name)
+    if name in indexed_names:
+        projects_ordered.append(PROJECTS_DIR / name)
+for name in indexed_projects:
+    if name not in st.session_state["project_order"]:
+        projects_ordered.append(PROJECTS_DIR / name)
+        st.session_state["project_order"].append(name)
 
 # ==========================================================
 # --- SEARCH / FILTER PROJECTS ---
@@ -136,108 +276,15 @@ if not projects_ordered:
     st.info("No projects available yet.")
 else:
     for project in projects_ordered:
-        for folder in ["files", "invoices", "purchases", "images"]:
-            (project / folder).mkdir(exist_ok=True)
-
-        expanded_state = st.session_state.get("expand_project") == project.name
-
-        with st.expander(f"📘 Open Project: {project.name}", expanded=expanded_state):
-            st.write(f"**Path:** `{project.resolve()}`")
-            st.markdown("---")
-
-            # --- UPLOAD FILES ---
-            st.markdown("#### 🧰 Upload Files")
-            col1, col2, col3, col4 = st.columns(4)
-            with col1:
-                file_to_upload = st.file_uploader(f"Add File to {project.name}", type=["pdf", "docx", "xlsx"], key=f"file_{project.name}")
-                if file_to_upload:
-                    save_path = project / "files" / file_to_upload.name
-                    with open(save_path, "wb") as f:
-                        f.write(file_to_upload.getbuffer())
-                    st.success(f"📁 File '{file_to_upload.name}' added to {project.name}")
-                    st.rerun()
-            with col2:
-                invoice_to_upload = st.file_uploader(f"Add Invoice to {project.name}", type=["pdf", "xlsx", "docx"], key=f"invoice_{project.name}")
-                if invoice_to_upload:
-                    save_path = project / "invoices" / invoice_to_upload.name
-                    with open(save_path, "wb") as f:
-                        f.write(invoice_to_upload.getbuffer())
-                    st.success(f"🧾 Invoice '{invoice_to_upload.name}' added to {project.name}")
-                    st.rerun()
-            with col3:
-                purchase_to_upload = st.file_uploader(f"Add Purchase to {project.name}", type=["pdf", "xlsx", "docx"], key=f"purchase_{project.name}")
-                if purchase_to_upload:
-                    save_path = project / "purchases" / purchase_to_upload.name
-                    with open(save_path, "wb") as f:
-                        f.write(purchase_to_upload.getbuffer())
-                    st.success(f"🛒 Purchase '{purchase_to_upload.name}' added to {project.name}")
-                    st.rerun()
-            with col4:
-                image_to_upload = st.file_uploader(f"Add Image to {project.name}", type=["jpg", "jpeg", "png"], key=f"image_{project.name}")
-                if image_to_upload:
-                    save_path = project / "images" / image_to_upload.name
-                    with open(save_path, "wb") as f:
-                        f.write(image_to_upload.getbuffer())
-                    st.success(f"🖼️ Image '{image_to_upload.name}' added to {project.name}")
-                    st.rerun()
-
-            st.markdown("---")
-
-            # --- VIEW & DOWNLOAD FILES ---
-            st.markdown("### 👁️ View & Download Files")
-
-            def list_files(folder_path, label):
-                files = list(folder_path.glob("*"))
-                st.markdown(f"#### {label}")
-                if not files:
-                    st.caption(f"No {label.lower()} available yet.")
-                else:
-                    for idx, file in enumerate(files):
-                        is_highlighted = file.name == st.session_state.get("highlight_file")
-                        highlight_style = "background-color: #F61111FF; padding:4px; border-radius:6px;" if is_highlighted else ""
-
-                        col1, col2, col3, col4 = st.columns([5, 1, 1, 1])
-                        with col1:
-                            st.markdown(f"<div style='{highlight_style}'>📄 {file.name}</div>", unsafe_allow_html=True)
-                        with col2:
-                            if st.button("👁️ View", key=f"view_{folder_path.name}_{file.name}_{idx}"):
-                                st.session_state["view_file_path"] = str(file)
-                                st.session_state["view_project_name"] = project.name
-                                st.session_state["expand_project"] = project.name
-                                st.session_state["highlight_file"] = file.name
-                                st.rerun()
-                        with col3:
-                            with open(file, "rb") as f:
-                                st.download_button(
-                                    label="⬇️",
-                                    data=f,
-                                    file_name=file.name,
-                                    mime="application/octet-stream",
-                                    key=f"download_{folder_path.name}_{file.name}_{idx}"
-                                )
-                        with col4:
-                            if st.session_state.get("user_role") == "admin":
-                                if st.button("🗑️ Delete", key=f"delete_{folder_path.name}_{file.name}_{idx}"):
-                                    try:
-                                        file.unlink()
-                                        st.success(f"✅ Deleted '{file.name}' successfully!")
-                                        st.rerun()
-                                    except Exception as e:
-                                        st.error(f"❌ Could not delete '{file.name}': {e}")
-
-            for folder in ["files", "invoices", "purchases", "images"]:
-                list_files(project / folder, folder.capitalize())
-
-            st.markdown("---")
-
-            # --- DELETE PROJECT FOR ADMINS ONLY ---
-            if st.session_state.get("user_role") == "admin":
-                if st.button(f"🗑️ Delete Project: {project.name}", key=f"del_{project.name}"):
-                    shutil.rmtree(project)
-                    st.success(f"✅ Deleted project: {project.name}")
-                    st.rerun()
-            else:
-                st.caption("🔒 Only admins can delete projects.")
+        open_key = f"project_open_{project.name}"
+        if st.session_state.get("expand_project") == project.name and open_key not in st.session_state:
+            st.session_state[open_key] = True  # reopen after "Back to file location"
+
+        # Tracks its open state, so a collapsed project builds nothing
+        expander = st.expander(f"📘 Open Project: {project.name}", key=open_key, on_change="rerun")
+        if expander.open:
+            with expander:
+                project_body(project)
 
 st.markdown("---")
 st.caption("Thermoteq Project Management • Secure & Organized")
@@ -0,0 +1,33 @@
+# ==========================================================
+# Thermoteq Management System (TMS)
+# ASGI entry point: serves app.py plus the file endpoints in
+# tms/web.py (streamed downloads and previews), with script runs,
+# queries and bytes sent measured by tms/metrics.py. Each process
+# warms up (tms/warmup.py) before it accepts traffic.
+# Run with: streamlit run server.py
+#
+# Any number of these processes, on one or more nodes, can serve the
+# app behind a load balancer (Procfile "web" scaled to N) when they
+# share the database, TMS_DATA_DIR, TMS_COOKIE_KEY and
+# STREAMLIT_SERVER_COOKIE_SECRET. Only Streamlit's own session
+# endpoints (/_stcore/stream, /_stcore/upload_file/, /media/) must
+# reach the process that holds the browser's session, so the balancer
+# needs affinity (e.g. a sticky cookie) for those; every other request
+# can go to any process. bench/proxy.py is such a balancer for trying
+# it out locally.
+# ==========================================================
+
+import streamlit as st
+from starlette.middleware import Middleware
+
+from tms import metrics, warmup, web
+
+metrics.startup_mark("loaded")
+metrics.install()
+
+app = st.App(
+    "app.py",
+    lifespan=warmup.lifespan,
+    routes=web.routes(),
+    middleware=[Middleware(metrics.SentBytesMiddleware)],
+)
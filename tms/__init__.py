@@ -0,0 +1,5 @@
+# ==========================================================
+# Thermoteq Management System (TMS)
+# Shared application package used by app.py and pages/
+# Author: Thermoteq Technologies
+# ==========================================================
@@ -0,0 +1,281 @@
+# ==========================================================
+# --- PASSWORD HASHING & LOGIN ---
+# bcrypt is slow on purpose, so it never runs on a script thread
+# unbounded: every hash and check goes through one small thread pool
+# per process (bcrypt releases the GIL while it works). At most
+# PASSWORD_WORKERS run at once and PASSWORD_QUEUE_MAX wait; beyond
+# that callers get Busy instead of queueing behind everyone else.
+#
+# login() refuses usernames and IP addresses that failed or tried
+# too often within LOGIN_RATE_WINDOW (counted across all server
+# processes) before doing any hashing, checks unknown usernames
+# against a dummy hash so they take as long as known ones, and
+# upgrades a stored hash weaker than BCRYPT_ROUNDS in the
+# background after a successful check.
+# ==========================================================
+
+import functools
+import ipaddress
+import logging
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+import psycopg2
+import streamlit as st
+
+from tms import config, db, users
+
+log = logging.getLogger(__name__)
+
+
+class Busy(Exception):
+    """Raised when PASSWORD_QUEUE_MAX hashes are already waiting."""
+
+
+class RateLimited(Exception):
+    """Raised by login() for a username or address that tried too often."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"too many login attempts, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+# ==========================================================
+# --- HASHING POOL ---
+# ==========================================================
+_pool = None
+_pool_lock = threading.Lock()
+_capacity = threading.BoundedSemaphore(max(config.PASSWORD_WORKERS, 1) + max(config.PASSWORD_QUEUE_MAX, 0))
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max(config.PASSWORD_WORKERS, 1), thread_name_prefix="tms-bcrypt")
+    return _pool
+
+
+def _submit(fn, *args):
+    if not _capacity.acquire(blocking=False):
+        raise Busy("too many password checks in progress")
+    try:
+        future = _get_pool().submit(fn, *args)
+    except BaseException:
+        _capacity.release()
+        raise
+    future.add_done_callback(lambda _: _capacity.release())
+    return future
+
+
+def _check(plain_password, hashed):
+    try:
+        return bcrypt.checkpw(plain_password.encode("utf-8"), hashed.encode("utf-8"))
+    except ValueError:  # malformed hash, or a password bcrypt refuses
+        return False
+
+
+def hash_password(plain_password):
+    """Hash in the pool at BCRYPT_ROUNDS and wait for the result."""
+    if users.password_too_long(plain_password):
+        raise ValueError("Passwords can be at most 72 bytes long.")
+    return _submit(users.hash_password, plain_password).result()
+
+
+def verify_password(plain_password, hashed):
+    """Check a password against a stored bcrypt hash in the pool."""
+    return _submit(_check, plain_password, hashed).result()
+
+
+@functools.cache
+def _dummy_hash():
+    # What login() checks passwords for unknown usernames against
+    return hash_password("tms-unknown-user")
+
+
+def needs_rehash(hashed):
+    """True for hashes of an older bcrypt variant or below BCRYPT_ROUNDS."""
+    try:
+        return not hashed.startswith("$2b$") or int(hashed[4:6]) < config.BCRYPT_ROUNDS
+    except ValueError:
+        return True
+
+
+def _store_rehash(username, old_hash, future):
+    try:
+        with db.get_cursor() as cur:
+            # Only if nobody changed the password meanwhile
+            cur.execute(
+                "UPDATE users SET password_hash=%s WHERE username=%s AND password_hash=%s;",
+                (future.result(), username, old_hash)
+            )
+            changed = cur.rowcount
+        if changed:
+            users.invalidate_credentials()
+            log.info("Upgraded the password hash of %s", username)
+    except Exception:
+        log.exception("Could not upgrade the password hash of %s", username)
+
+
+def _rehash_later(username, plain_password, old_hash):
+    try:
+        future = _submit(users.hash_password, plain_password)
+    except Busy:
+        return  # next login
+    future.add_done_callback(lambda f: _store_rehash(username, old_hash, f))
+
+
+# ==========================================================
+# --- RATE LIMITING ---
+# Counted in the login_events table, so the limits hold however
+# many server processes the load balancer spreads attempts over.
+# While the database cannot be reached each process counts in its
+# own memory instead: enough to keep that process's cores free.
+# ==========================================================
+class _Window:
+    """Recent event times per key, forgotten after LOGIN_RATE_WINDOW seconds."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._events = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def _expire(self, key, now):
+        events = self._events.get(key)
+        while events and events[0] <= now - config.LOGIN_RATE_WINDOW:
+            events.popleft()
+        if key in self._events and not events:
+            del self._events[key]
+
+    def retry_after(self, key):
+        """Seconds until ``key`` may try again; 0 if it may now."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(key, now)
+            events = self._events.get(key)
+            if not events or len(events) < self.limit:
+                return 0
+            return max(1, math.ceil(events[-self.limit] + config.LOGIN_RATE_WINDOW - now))
+
+    def add(self, key):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._events) > 10000:
+                for old_key in list(self._events):
+                    self._expire(old_key, now)
+            self._events[key].append(now)
+
+    def clear(self, key):
+        with self._lock:
+            self._events.pop(key, None)
+
+
+class _SharedWindow:
+    """A _Window kept in the login_events table as rows of ``kind``."""
+
+    def __init__(self, kind, limit):
+        self.kind = kind
+        self.limit = limit
+        self._local = _Window(limit)
+
+    def retry_after(self, key):
+        """Seconds until ``key`` may try again; 0 if it may now."""
+        try:
+            with db.get_cursor() as cur:
+                # The limit-th most recent event in the window decides
+                cur.execute("""
+                    SELECT EXTRACT(EPOCH FROM at + make_interval(secs => %s) - NOW())
+                    FROM login_events
+                    WHERE kind = %s AND key = %s AND at > NOW() - make_interval(secs => %s)
+                    ORDER BY at DESC
+                    OFFSET %s LIMIT 1;
+                """, (config.LOGIN_RATE_WINDOW, self.kind, key, config.LOGIN_RATE_WINDOW, self.limit - 1))
+                row = cur.fetchone()
+        except psycopg2.Error:
+            log.warning("Login rate limits fall back to this process's memory", exc_info=True)
+            return self._local.retry_after(key)
+        return max(1, math.ceil(row[0])) if row else 0
+
+    def add(self, key):
+        try:
+            with db.get_cursor() as cur:
+                cur.execute("INSERT INTO login_events (kind, key) VALUES (%s, %s);", (self.kind, key))
+                cur.execute("DELETE FROM login_events WHERE at <= NOW() - make_interval(secs => %s);",
+                            (config.LOGIN_RATE_WINDOW,))
+        except psycopg2.Error:
+            self._local.add(key)
+
+    def clear(self, key):
+        self._local.clear(key)
+        try:
+            with db.get_cursor() as cur:
+                cur.execute("DELETE FROM login_events WHERE kind = %s AND key = %s;", (self.kind, key))
+        except psycopg2.Error:
+            pass
+
+
+_failures = _SharedWindow("failure", config.LOGIN_MAX_FAILURES)  # by lower-cased username
+_attempts = _SharedWindow("attempt", config.LOGIN_MAX_ATTEMPTS_PER_IP)  # by client address
+
+
+def _trusted_proxy(address):
+    if config.TRUST_ALL_PROXIES:
+        return True
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in network for network in config.TRUSTED_PROXIES)
+
+
+def client_ip():
+    """Address of the browser behind the current session, if known.
+
+    X-Forwarded-For is only believed on connections from TRUSTED_PROXIES.
+    Its entries are then read from the right, past any further trusted
+    proxies: everything left of those is whatever the client sent.
+    """
+    peer = st.context.ip_address
+    # Streamlit gives no address for connections from localhost
+    if not _trusted_proxy(peer or "127.0.0.1"):
+        return peer
+    hops = [hop.strip() for hop in st.context.headers.get("X-Forwarded-For", "").split(",") if hop.strip()]
+    if config.TRUST_ALL_PROXIES:
+        return hops[-1] if hops else peer
+    for hop in reversed(hops):
+        if not _trusted_proxy(hop):
+            return hop
+    return peer
+
+
+# ==========================================================
+# --- LOGIN ---
+# ==========================================================
+def login(username, password, ip_address=None):
+    """Check a username (in any letter case) and password; returns the user's credentials entry or None.
+
+    Raises RateLimited before any hashing if the username or address
+    tried too often, and Busy if the hashing pool is full.
+    """
+    user_key = username.strip().lower()
+    retry_after = max(_failures.retry_after(user_key), _attempts.retry_after(ip_address) if ip_address else 0)
+    if retry_after:
+        raise RateLimited(retry_after)
+    if ip_address:
+        _attempts.add(ip_address)
+
+    user = users.find_user(username)
+    # An unknown username costs a bcrypt check too, so timing cannot tell it apart
+    stored_hash = user["password"] if user is not None else _dummy_hash()
+    if not verify_password(password, stored_hash) or user is None:
+        _failures.add(user_key)
+        return None
+    _failures.clear(user_key)
+    if needs_rehash(user["password"]):
+        _rehash_later(user["name"], password, user["password"])
+    return user
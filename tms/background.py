@@ -0,0 +1,54 @@
+# ==========================================================
+# --- BACKGROUND TASKS ---
+# Small periodic maintenance loops (index reconciliation, search
+# indexing) run in one daemon thread each per server process.
+# ==========================================================
+
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+_tasks = {}
+_tasks_lock = threading.Lock()
+
+
+class PeriodicTask:
+    def __init__(self, name, func, interval):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.ready = threading.Event()  # set after the first run
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name=f"tms-{name}", daemon=True)
+
+    def _loop(self):
+        first = True
+        while True:
+            try:
+                self.func(first)
+                first = False
+            except Exception:
+                log.exception("Background task %s failed", self.name)
+            finally:
+                self.ready.set()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def wake(self):
+        """Run the task now instead of waiting for the next interval."""
+        self._wake.set()
+
+
+def start_periodic(name, func, interval, wait=0):
+    """Start ``func(first_run)`` every ``interval`` seconds, once per process.
+
+    Waits up to ``wait`` seconds for the first run to finish.
+    """
+    with _tasks_lock:
+        task = _tasks.get(name)
+        if task is None or not task._thread.is_alive():
+            task = _tasks[name] = PeriodicTask(name, func, interval)
+            task._thread.start()
+    task.ready.wait(wait)
+    return task
@@ -0,0 +1,138 @@
+# ==========================================================
+# --- BULK UPLOAD ---
+# Several files at once, picked together or packed in a .zip.
+# Files are staged (streamed to disk and hashed, tms/storage.py)
+# in parallel by a small thread pool, then recorded in batches:
+# one transaction and one multi-row INSERT per batch.
+# ==========================================================
+
+import contextlib
+import logging
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+
+import psycopg2
+import streamlit as st
+
+from tms import config, db, storage
+
+log = logging.getLogger(__name__)
+
+
+# ==========================================================
+# --- INPUT ---
+# An item is (file_name, open_source); open_source() returns a
+# context manager yielding a readable binary file object.
+# ==========================================================
+def expand(uploads, allowed_types):
+    """Turn uploaded files into items, unpacking any .zip archives.
+
+    Returns (items, skipped) where skipped is a list of (name, reason).
+    Archive folders are flattened; only ``allowed_types`` are kept.
+    """
+    allowed = {f".{t.lower().lstrip('.')}" for t in allowed_types}
+    items, skipped = [], []
+    for uploaded in uploads:
+        if not uploaded.name.lower().endswith(".zip"):
+            items.append((uploaded.name, lambda f=uploaded: contextlib.nullcontext(f)))
+            continue
+        try:
+            archive = zipfile.ZipFile(uploaded)
+        except zipfile.BadZipFile:
+            skipped.append((uploaded.name, "not a valid zip archive"))
+            continue
+        for info in archive.infolist():
+            path = PurePosixPath(info.filename)
+            if info.is_dir() or "__MACOSX" in path.parts or path.name.startswith("."):
+                continue
+            if path.suffix.lower() not in allowed:
+                skipped.append((info.filename, "file type not allowed"))
+                continue
+            items.append((path.name, lambda a=archive, i=info: a.open(i)))
+    return items, skipped
+
+
+# ==========================================================
+# --- INGEST ---
+# ==========================================================
+def _stage(item):
+    file_name, open_source = item
+    with open_source() as source:
+        return storage.stage(source, file_name)
+
+
+def ingest_many(items, record, progress=None):
+    """Stage ``items`` in parallel and record them batch by batch.
+
+    ``record(cur, batch)`` runs inside one transaction per batch with a
+    list of (file_name, StagedFile); it must commit() every staged file
+    and return a list of results. A failed batch is rolled back, its
+    files removed and each of them listed as a failure; later batches
+    still run. Files that cannot be staged (too large, unreadable) are
+    skipped. ``progress(done, total)`` is called after each batch.
+
+    Returns (results, failures) with failures as (file_name, reason).
+    """
+    items = list(items)
+    results, failures = [], []
+    batch_size = max(1, config.BULK_UPLOAD_BATCH_SIZE)
+    with ThreadPoolExecutor(max_workers=config.BULK_UPLOAD_WORKERS, thread_name_prefix="tms-upload") as pool:
+        for start in range(0, len(items), batch_size):
+            chunk = items[start:start + batch_size]
+            futures = [pool.submit(_stage, item) for item in chunk]
+            with contextlib.ExitStack() as stack:
+                batch = []
+                for (file_name, _), future in zip(chunk, futures):
+                    try:
+                        batch.append((file_name, stack.enter_context(future.result())))
+                    except (OSError, ValueError, zipfile.BadZipFile) as e:
+                        failures.append((file_name, str(e)))
+                # Same lock order in every session: blob rows by hash
+                batch.sort(key=lambda entry: entry[1].sha256)
+                if batch:
+                    try:
+                        with db.get_cursor() as cur:
+                            results.extend(record(cur, batch))
+                    except (psycopg2.Error, OSError, ValueError) as e:
+                        log.warning("Could not record a batch of %d upload(s)", len(batch), exc_info=True)
+                        # Rolled back: the blobs and links commit() made are not recorded anywhere
+                        for file_name, staged in batch:
+                            staged.discard()
+                            failures.append((file_name, f"not saved: {e}"))
+            if progress:
+                progress(min(start + batch_size, len(items)), len(items))
+    return results, failures
+
+
+# ==========================================================
+# --- PAGE HELPERS ---
+# File uploaders keep returning their files on every rerun, so each
+# page remembers (under ``key``) which uploads it already saved.
+# ==========================================================
+def pending(uploads, key):
+    seen = st.session_state.setdefault(key, set())
+    return [uploaded for uploaded in uploads if uploaded.file_id not in seen]
+
+
+def mark_done(uploads, key):
+    st.session_state.setdefault(key, set()).update(uploaded.file_id for uploaded in uploads)
+
+
+def progress_bar(label):
+    """A st.progress bar and a progress(done, total) callback for it."""
+    bar = st.progress(0.0, text=label)
+
+    def update(done, total):
+        bar.progress(done / total if total else 1.0, text=f"{label} {done}/{total}")
+    return update
+
+
+def report(saved, failures, what="file"):
+    if saved:
+        st.success(f"✅ {saved} {what}{'s' if saved != 1 else ''} uploaded successfully!")
+    if failures:
+        st.warning(f"⚠️ {len(failures)} {what}{'s' if len(failures) != 1 else ''} skipped.")
+        with st.expander("Show skipped files"):
+            for file_name, reason in failures:
+                st.write(f"• **{file_name}** — {reason}")
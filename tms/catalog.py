@@ -0,0 +1,382 @@
+# ==========================================================
+# --- PROJECT INDEX ---
+# Projects, their four folders and the files in them are kept in
+# PostgreSQL (migrations/003) so pages can render from the index
+# without touching the filesystem. The index is updated directly
+# by upload/delete actions and reconciled in the background: a
+# folder is only rescanned when its directory mtime has changed.
+# Deleted projects and files stay in the index, marked deleted,
+# until they are purged from the trash (tms/trash.py).
+# ==========================================================
+
+import os
+from pathlib import Path
+
+from psycopg2.extras import execute_values
+
+from tms import background, bulk, config, db, metrics, storage, trash
+
+
+def project_path(project_name):
+    return config.PROJECTS_DIR / project_name
+
+
+def valid_project_name(project_name):
+    return bool(project_name) and project_name not in (".", "..") and "/" not in project_name and "\\" not in project_name
+
+
+# ==========================================================
+# --- READS (used while rendering) ---
+# ==========================================================
+def list_projects():
+    with db.get_cursor() as cur:
+        cur.execute("SELECT name FROM projects WHERE deleted_at IS NULL ORDER BY project_id;")
+        return [row[0] for row in cur.fetchall()]
+
+
+def list_project_files(project_name):
+    """Return {folder: [rows]} for one project; every folder is present."""
+    folders = {folder: [] for folder in config.PROJECT_FOLDERS}
+    with db.get_cursor(dict_rows=True) as cur:
+        cur.execute("""
+            SELECT pf.folder, pf.file_name, pf.size_bytes, pf.mtime_ns, pf.sha256, pf.integrity_status
+            FROM project_files pf
+            JOIN projects p ON p.project_id = pf.project_id
+            WHERE p.name = %s AND p.deleted_at IS NULL AND pf.deleted_at IS NULL
+            ORDER BY pf.folder, pf.file_name;
+        """, (project_name,))
+        for row in cur.fetchall():
+            folders.setdefault(row["folder"], []).append(row)
+    return folders
+
+
+def file_sha256(project_name, folder, file_name):
+    """The indexed SHA-256 of one project file, or None."""
+    with db.get_cursor() as cur:
+        cur.execute("""
+            SELECT pf.sha256 FROM project_files pf
+            JOIN projects p ON p.project_id = pf.project_id
+            WHERE p.name = %s AND p.deleted_at IS NULL
+              AND pf.folder = %s AND pf.file_name = %s AND pf.deleted_at IS NULL;
+        """, (project_name, folder, file_name))
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+# ==========================================================
+# --- WRITES (keep disk and index in step) ---
+# ==========================================================
+def _project_id(cur, project_name):
+    cur.execute(
+        """
+        INSERT INTO projects (name) VALUES (%s)
+        ON CONFLICT (name) WHERE deleted_at IS NULL DO UPDATE SET name = EXCLUDED.name
+        RETURNING project_id;
+        """,
+        (project_name,)
+    )
+    return cur.fetchone()[0]
+
+
+def _upsert_file(cur, project_id, folder, file_name, size, mtime_ns, sha256, uploaded_by=None):
+    # uploaded_by stays NULL for files found on disk by the reconciler
+    cur.execute("""
+        INSERT INTO project_files (project_id, folder, file_name, size_bytes, mtime_ns, sha256, uploaded_by)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (project_id, folder, file_name) WHERE deleted_at IS NULL DO UPDATE
+        SET size_bytes = EXCLUDED.size_bytes,
+            mtime_ns = EXCLUDED.mtime_ns,
+            sha256 = EXCLUDED.sha256,
+            indexed_at = NOW(),
+            integrity_status = 'ok',
+            verified_at = NULL;
+    """, (project_id, folder, file_name, size, mtime_ns, sha256, uploaded_by))
+
+
+def create_project(project_name):
+    """Create the project folders and index entry; False if it already exists."""
+    path = project_path(project_name)
+    if path.exists():
+        return False
+    for folder in config.PROJECT_FOLDERS:
+        (path / folder).mkdir(parents=True, exist_ok=True)
+    with db.get_cursor() as cur:
+        _project_id(cur, project_name)
+    return True
+
+
+def save_file(project_name, folder, file_name, source, uploaded_by=None):
+    """Store an uploaded file in a project folder and index it.
+
+    ``source`` is read in chunks (see storage.stage). An existing file of
+    the same name is kept and the new one saved as "name (1).ext"; the
+    path actually used is returned. ``uploaded_by`` is a username.
+    """
+    with storage.stage(source, file_name) as staged:
+        with db.get_cursor() as cur:
+            project_id = _project_id(cur, project_name)
+            dest = staged.commit(cur, project_path(project_name) / folder / file_name)
+            stat = dest.stat()
+            _upsert_file(cur, project_id, folder, dest.name, stat.st_size, stat.st_mtime_ns, staged.sha256, uploaded_by)
+    return dest
+
+
+def save_files(project_name, folder, items, progress=None, uploaded_by=None):
+    """Bulk save_file for (file_name, open_source) items, see tms/bulk.py.
+
+    Returns (saved_paths, failures).
+    """
+    folder_path = project_path(project_name) / folder
+
+    def record(cur, batch):
+        project_id = _project_id(cur, project_name)
+        rows, paths = [], []
+        for file_name, staged in batch:
+            dest = staged.commit(cur, folder_path / file_name)
+            stat = dest.stat()
+            rows.append((project_id, folder, dest.name, stat.st_size, stat.st_mtime_ns, staged.sha256, uploaded_by))
+            paths.append(dest)
+        execute_values(cur, """
+            INSERT INTO project_files (project_id, folder, file_name, size_bytes, mtime_ns, sha256, uploaded_by)
+            VALUES %s
+            ON CONFLICT (project_id, folder, file_name) WHERE deleted_at IS NULL DO UPDATE
+            SET size_bytes = EXCLUDED.size_bytes,
+                mtime_ns = EXCLUDED.mtime_ns,
+                sha256 = EXCLUDED.sha256,
+                indexed_at = NOW(),
+                integrity_status = 'ok',
+                verified_at = NULL;
+        """, rows, page_size=len(rows))
+        return paths
+
+    return bulk.ingest_many(items, record, progress)
+
+
+def remove_file(project_name, folder, file_name, deleted_by=None):
+    """Move a project file to the trash; False if it is not indexed."""
+    with trash.Moves() as move, db.get_cursor() as cur:
+        cur.execute("""
+            UPDATE project_files SET deleted_at = NOW(), deleted_by = %s
+            WHERE project_id = (SELECT project_id FROM projects WHERE name = %s AND deleted_at IS NULL)
+              AND folder = %s AND file_name = %s AND deleted_at IS NULL
+            RETURNING project_file_id;
+        """, (deleted_by, project_name, folder, file_name))
+        row = cur.fetchone()
+        if not row:
+            return False
+        source = project_path(project_name) / folder / file_name
+        if source.exists():
+            move(source, trash.path("project_files", row[0], file_name))
+    return True
+
+
+def restore_file(project_file_id):
+    """Put a trashed project file back (as "name (1)" if the name was reused).
+
+    Raises ValueError if its project is itself in the trash.
+    """
+    with trash.Moves() as move, db.get_cursor() as cur:
+        cur.execute("""
+            SELECT p.name, p.deleted_at IS NOT NULL, pf.folder, pf.file_name
+            FROM project_files pf JOIN projects p ON p.project_id = pf.project_id
+            WHERE pf.project_file_id = %s AND pf.deleted_at IS NOT NULL
+            FOR UPDATE OF pf;
+        """, (project_file_id,))
+        row = cur.fetchone()
+        if not row:
+            return False
+        project_name, project_deleted, folder, file_name = row
+        if project_deleted:
+            raise ValueError(f"Restore project '{project_name}' first.")
+        source = trash.path("project_files", project_file_id, file_name)
+        if not source.exists():
+            raise ValueError(f"'{file_name}' is missing from the trash.")
+        file_name = move(source, project_path(project_name) / folder / file_name).name
+        cur.execute(
+            "UPDATE project_files SET deleted_at = NULL, deleted_by = NULL, file_name = %s WHERE project_file_id = %s;",
+            (file_name, project_file_id)
+        )
+    return True
+
+
+def delete_project(project_name, deleted_by=None):
+    """Move a project to the trash; False if there is no such project.
+
+    Only a rename and one UPDATE, however many files the project has;
+    the space is reclaimed later by trash.purge().
+    """
+    with trash.Moves() as move, db.get_cursor() as cur:
+        cur.execute(
+            "UPDATE projects SET deleted_at = NOW(), deleted_by = %s WHERE name = %s AND deleted_at IS NULL RETURNING project_id;",
+            (deleted_by, project_name)
+        )
+        row = cur.fetchone()
+        if not row:
+            return False
+        source = project_path(project_name)
+        if source.exists():
+            move(source, trash.path("projects", row[0], project_name))
+    return True
+
+
+def restore_project(project_id):
+    """Put a trashed project back; ValueError if its name is in use again."""
+    with trash.Moves() as move, db.get_cursor() as cur:
+        cur.execute("SELECT name FROM projects WHERE project_id = %s AND deleted_at IS NOT NULL FOR UPDATE;", (project_id,))
+        row = cur.fetchone()
+        if not row:
+            return False
+        project_name = row[0]
+        dest = project_path(project_name)
+        cur.execute("SELECT 1 FROM projects WHERE name = %s AND deleted_at IS NULL;", (project_name,))
+        if cur.fetchone() or dest.exists():
+            raise ValueError(f"A project named '{project_name}' already exists.")
+        cur.execute("UPDATE projects SET deleted_at = NULL, deleted_by = NULL WHERE project_id = %s;", (project_id,))
+        # Rescan every folder on the next reconcile pass
+        cur.execute("DELETE FROM project_folders WHERE project_id = %s;", (project_id,))
+        source = trash.path("projects", project_id, project_name)
+        if source.exists():
+            move(source, dest)
+    return True
+
+
+# ==========================================================
+# --- RECONCILIATION ---
+# ==========================================================
+def _rescan_folder(cur, project_id, folder, folder_path):
+    cur.execute(
+        """
+        SELECT file_name, size_bytes, mtime_ns, sha256 FROM project_files
+        WHERE project_id = %s AND folder = %s AND deleted_at IS NULL;
+        """,
+        (project_id, folder)
+    )
+    indexed = {name: (size, mtime_ns, sha256) for name, size, mtime_ns, sha256 in cur.fetchall()}
+    present = set()
+    for entry in os.scandir(folder_path):
+        if entry.name.startswith(".tms-"):
+            continue  # in-flight temporary link
+        try:
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            present.add(entry.name)
+            old = indexed.get(entry.name)
+            if old and old[:2] == (stat.st_size, stat.st_mtime_ns):
+                continue
+            # New or changed outside the app: hash it and dedupe it in place
+            sha256 = storage.sha256_file(entry.path)
+            storage.adopt(cur, Path(entry.path), sha256)
+            stat = os.stat(entry.path)
+        except FileNotFoundError:
+            present.discard(entry.name)  # removed while we were scanning
+            continue
+        _upsert_file(cur, project_id, folder, entry.name, stat.st_size, stat.st_mtime_ns, sha256)
+        if old and old[2] != sha256:
+            storage.release(cur, old[2])
+    missing = list(set(indexed) - present)
+    if missing:
+        cur.execute(
+            """
+            DELETE FROM project_files
+            WHERE project_id = %s AND folder = %s AND file_name = ANY(%s) AND deleted_at IS NULL
+            RETURNING sha256;
+            """,
+            (project_id, folder, missing)
+        )
+        for (sha256,) in cur.fetchall():
+            storage.release(cur, sha256)
+
+
+def _changed_folders(project_name, project_id, seen, full):
+    """[(folder, path, mtime_ns)] to rescan; None if the project directory is gone."""
+    changed = []
+    for folder in config.PROJECT_FOLDERS:
+        folder_path = project_path(project_name) / folder
+        try:
+            folder_path.mkdir(exist_ok=True)
+            # Taken before the scan so changes made during it are caught next time
+            mtime_ns = folder_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None  # project directory removed mid-pass
+        if full or seen.get((project_id, folder)) != mtime_ns:
+            changed.append((folder, folder_path, mtime_ns))
+    return changed
+
+
+def _reconcile_project(project_id, changed):
+    # One transaction per project, so a pass over a large tree never
+    # holds a connection (or blob locks) for longer than one project takes
+    with db.get_cursor() as cur:
+        # Another process rescanning this project right now covers it
+        cur.execute("SELECT pg_try_advisory_xact_lock(hashtext('tms_project_index'), %s);", (project_id,))
+        if not cur.fetchone()[0]:
+            return
+        # Waits for a delete in progress; a trashed project is left alone
+        cur.execute("SELECT 1 FROM projects WHERE project_id = %s AND deleted_at IS NULL FOR SHARE;", (project_id,))
+        if not cur.fetchone():
+            return
+        for folder, folder_path, mtime_ns in changed:
+            try:
+                with metrics.timer("tms_fs_scan_seconds", area="projects"):
+                    _rescan_folder(cur, project_id, folder, folder_path)
+            except FileNotFoundError:
+                return  # project directory removed mid-pass
+            cur.execute("""
+                INSERT INTO project_folders (project_id, folder, mtime_ns) VALUES (%s, %s, %s)
+                ON CONFLICT (project_id, folder) DO UPDATE SET mtime_ns = EXCLUDED.mtime_ns;
+            """, (project_id, folder, mtime_ns))
+
+
+def reconcile(full=False):
+    """Bring the index in line with the projects/ tree.
+
+    Only folders whose mtime differs from the last pass are rescanned,
+    unless ``full`` is set, each project in a transaction of its own.
+    Returns False if another process is already listing the projects.
+    """
+    config.PROJECTS_DIR.mkdir(exist_ok=True)
+    with db.get_cursor() as cur:
+        cur.execute("SELECT pg_try_advisory_xact_lock(hashtext('tms_project_index'));")
+        if not cur.fetchone()[0]:
+            return False
+
+        on_disk = {entry.name for entry in os.scandir(config.PROJECTS_DIR) if entry.is_dir()}
+        cur.execute("SELECT project_id, name FROM projects WHERE deleted_at IS NULL;")
+        known = {name: project_id for project_id, name in cur.fetchall()}
+        for project_name in on_disk - known.keys():
+            known[project_name] = _project_id(cur, project_name)
+        gone = [known.pop(name) for name in list(known) if name not in on_disk]
+        if gone:
+            # Directories removed outside the app go to the trash like a
+            # delete_project() (with nothing to move), so their trashed files
+            # keep their rows and trash entries until trash.purge(). A project
+            # being moved to the trash right now is skipped once its delete commits.
+            cur.execute(
+                "UPDATE projects SET deleted_at = NOW() WHERE project_id = ANY(%s) AND deleted_at IS NULL;",
+                (gone,)
+            )
+
+        cur.execute("SELECT project_id, folder, mtime_ns FROM project_folders;")
+        seen = {(project_id, folder): mtime_ns for project_id, folder, mtime_ns in cur.fetchall()}
+
+    for project_name, project_id in known.items():
+        changed = _changed_folders(project_name, project_id, seen, full)
+        if changed:
+            _reconcile_project(project_id, changed)
+    return True
+
+
+def start_watcher(wait=10):
+    """Start the background reconciler once per process.
+
+    The first pass rescans every folder; the first call waits up to
+    ``wait`` seconds for it so a freshly started server does not render
+    an empty project list.
+    """
+    background.start_periodic(
+        "project-index",
+        lambda first_run: reconcile(full=first_run),
+        config.INDEX_RECONCILE_INTERVAL,
+        wait=wait,
+    )
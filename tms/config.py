@@ -0,0 +1,283 @@
+# ==========================================================
+# --- TMS SETTINGS ---
+# All runtime settings are read from the environment once, here,
+# so app.py, the pages and any worker process agree on them.
+# ==========================================================
+
+import ipaddress
+import os
+from pathlib import Path
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_networks(name):
+    networks = []
+    for entry in os.environ.get(name, "").split(","):
+        try:
+            networks.append(ipaddress.ip_network(entry.strip(), strict=False))
+        except ValueError:
+            pass
+    return networks
+
+
+# ==========================================================
+# --- POSTGRESQL ---
+# DATABASE_URL (e.g. the Supabase connection string) wins when set,
+# otherwise the individual DB_* variables are used.
+# ==========================================================
+DATABASE_URL = os.environ.get("DATABASE_URL")
+DB_HOST = os.environ.get("DB_HOST", "localhost")
+DB_PORT = _env_int("DB_PORT", 5432)
+DB_NAME = os.environ.get("DB_NAME", "thermoteq_db")
+DB_USER = os.environ.get("DB_USER", "postgres")
+DB_PASSWORD = os.environ.get("DB_PASSWORD", "kahenisatima")
+
+# Connection pool sizing (per server process)
+DB_POOL_MIN = _env_int("TMS_DB_POOL_MIN", 1)
+DB_POOL_MAX = _env_int("TMS_DB_POOL_MAX", 10)
+# Seconds to wait for a free pooled connection before giving up
+DB_POOL_TIMEOUT = _env_float("TMS_DB_POOL_TIMEOUT", 10)
+# Seconds to wait for PostgreSQL when opening a new connection
+DB_CONNECT_TIMEOUT = _env_int("TMS_DB_CONNECT_TIMEOUT", 10)
+# Connections idle for longer than this are pinged before being handed out
+DB_HEALTHCHECK_INTERVAL = _env_float("TMS_DB_HEALTHCHECK_INTERVAL", 30)
+
+
+def db_connect_kwargs():
+    """Keyword arguments for psycopg2.connect() built from the settings above."""
+    if DATABASE_URL:
+        return {"dsn": DATABASE_URL, "connect_timeout": DB_CONNECT_TIMEOUT}
+    return {
+        "host": DB_HOST,
+        "port": DB_PORT,
+        "dbname": DB_NAME,
+        "user": DB_USER,
+        "password": DB_PASSWORD,
+        "connect_timeout": DB_CONNECT_TIMEOUT,
+    }
+
+
+# ==========================================================
+# --- LOGIN COOKIE ---
+# Shared by app.py (streamlit-authenticator), tms/sessions.py and
+# the file endpoints in tms/web.py, which verify the same signed
+# cookie. Every server process must have the same TMS_COOKIE_KEY.
+# ==========================================================
+COOKIE_NAME = "tms_cookie"
+COOKIE_KEY = os.environ.get("TMS_COOKIE_KEY", "abcdef")
+COOKIE_EXPIRY_DAYS = 30
+
+# ==========================================================
+# --- PASSWORDS & LOGIN ---
+# bcrypt runs in a pool of PASSWORD_WORKERS threads per process
+# with at most PASSWORD_QUEUE_MAX hashes waiting (tms/auth.py).
+# Stored hashes below BCRYPT_ROUNDS are upgraded at the next
+# login. Within LOGIN_RATE_WINDOW seconds a username may fail
+# LOGIN_MAX_FAILURES times and an IP address try
+# LOGIN_MAX_ATTEMPTS_PER_IP logins before further attempts are
+# refused without hashing.
+# ==========================================================
+BCRYPT_ROUNDS = _env_int("TMS_BCRYPT_ROUNDS", 12)
+PASSWORD_WORKERS = _env_int("TMS_PASSWORD_WORKERS", 2)
+PASSWORD_QUEUE_MAX = _env_int("TMS_PASSWORD_QUEUE_MAX", 16)
+LOGIN_RATE_WINDOW = _env_int("TMS_LOGIN_RATE_WINDOW", 300)
+LOGIN_MAX_FAILURES = _env_int("TMS_LOGIN_MAX_FAILURES", 5)
+LOGIN_MAX_ATTEMPTS_PER_IP = _env_int("TMS_LOGIN_MAX_ATTEMPTS_PER_IP", 30)
+
+
+# ==========================================================
+# --- FILE STORAGE ---
+# Every directory below lives under DATA_DIR unless set on its own.
+# With several server processes, DATA_DIR is one shared filesystem
+# (e.g. an NFS mount) that all of them see at the same path.
+# ==========================================================
+DATA_DIR = Path(os.environ.get("TMS_DATA_DIR", "."))
+UPLOAD_DIR = Path(os.environ.get("TMS_UPLOAD_DIR", DATA_DIR / "uploads"))
+PROJECTS_DIR = Path(os.environ.get("TMS_PROJECTS_DIR", DATA_DIR / "projects"))
+PROJECT_FOLDERS = ["files", "invoices", "purchases", "images"]
+
+# Bytes read from disk per step when serving a file; this bounds the
+# memory used by each download regardless of file size.
+DOWNLOAD_CHUNK_SIZE = _env_int("TMS_DOWNLOAD_CHUNK_SIZE", 256 * 1024)
+
+# ==========================================================
+# --- PDF PREVIEW ---
+# Rendered pages are cached on disk by file hash + page number,
+# so every viewer after the first gets them without re-rendering.
+# The worker trims the cache to PREVIEW_CACHE_MAX_MB every
+# PREVIEW_PRUNE_INTERVAL seconds, least recently viewed documents
+# first.
+# ==========================================================
+PREVIEW_CACHE_DIR = Path(os.environ.get("TMS_PREVIEW_CACHE_DIR", DATA_DIR / "cache" / "pdf_pages"))
+PREVIEW_DPI = _env_int("TMS_PREVIEW_DPI", 110)
+PREVIEW_CACHE_MAX_MB = _env_int("TMS_PREVIEW_CACHE_MAX_MB", 2048)
+PREVIEW_PRUNE_INTERVAL = _env_int("TMS_PREVIEW_PRUNE_INTERVAL", 3600)
+
+# ==========================================================
+# --- STARTUP ---
+# server.py warms each process up before it accepts traffic
+# (tms/warmup.py). WARMUP_TIMEOUT bounds the wait for the first
+# pass of the project index; TMS_WARMUP=0 skips the warm-up.
+# ==========================================================
+WARMUP_ENABLED = os.environ.get("TMS_WARMUP", "1") != "0"
+WARMUP_TIMEOUT = _env_float("TMS_WARMUP_TIMEOUT", 30)
+
+# ==========================================================
+# --- SEVERAL SERVER PROCESSES ---
+# Any number of web processes (Procfile "web" scaled to N, on one
+# or more nodes) can run against one database and DATA_DIR. A
+# browser that reconnects to another process gets its sign-in and,
+# if younger than SESSION_RESUME_SECONDS, its last view back
+# (tms/sessions.py). Each process reports itself and its metrics
+# every INSTANCE_HEARTBEAT_INTERVAL seconds (tms/instances.py).
+# ==========================================================
+SESSION_RESUME_SECONDS = _env_int("TMS_SESSION_RESUME_SECONDS", 900)
+INSTANCE_HEARTBEAT_INTERVAL = _env_float("TMS_INSTANCE_HEARTBEAT_INTERVAL", 15)
+# Load balancers / reverse proxies whose X-Forwarded-For header is
+# believed (tms/auth.py client_ip), as comma-separated addresses or
+# networks, e.g. "10.0.0.0/8,127.0.0.1". "*" believes any peer: only
+# for hosts that cannot be reached except through the proxy. Unset,
+# the header is ignored and the connection's own address is used.
+TRUSTED_PROXIES = _env_networks("TMS_TRUSTED_PROXIES")
+TRUST_ALL_PROXIES = "*" in os.environ.get("TMS_TRUSTED_PROXIES", "").replace(" ", "").split(",")
+
+# ==========================================================
+# --- PROJECT INDEX ---
+# Seconds between background reconciliations of the projects/
+# tree against the index (see tms/catalog.py).
+# ==========================================================
+INDEX_RECONCILE_INTERVAL = _env_float("TMS_INDEX_RECONCILE_INTERVAL", 30)
+
+# ==========================================================
+# --- DOCUMENT SEARCH ---
+# ==========================================================
+# Seconds between the worker's passes that index new/changed files
+SEARCH_INDEX_INTERVAL = _env_float("TMS_SEARCH_INDEX_INTERVAL", 60)
+# Characters of extracted text kept per document (tsvector limit is 1 MB)
+SEARCH_MAX_TEXT_CHARS = _env_int("TMS_SEARCH_MAX_TEXT_CHARS", 400_000)
+
+# ==========================================================
+# --- CONTENT-ADDRESSED BLOB STORE ---
+# Every stored file's bytes live once under BLOB_DIR, named by
+# SHA-256; uploads/ and projects/ entries are hard links to them.
+# Must be on the same filesystem as UPLOAD_DIR and PROJECTS_DIR.
+# ==========================================================
+BLOB_DIR = Path(os.environ.get("TMS_BLOB_DIR", DATA_DIR / "blobs"))
+
+# ==========================================================
+# --- UPLOAD INGEST ---
+# Uploads are copied to disk in UPLOAD_CHUNK_SIZE pieces and
+# rejected once they exceed the limit for their file type.
+# Override a limit with e.g. TMS_UPLOAD_MAX_MB_PDF=500.
+# ==========================================================
+UPLOAD_CHUNK_SIZE = _env_int("TMS_UPLOAD_CHUNK_SIZE", 1024 * 1024)
+_UPLOAD_MAX_MB_DEFAULTS = {
+    ".pdf": 200,
+    ".docx": 50,
+    ".xlsx": 50,
+    ".txt": 20,
+    ".csv": 50,
+    ".jpg": 25,
+    ".jpeg": 25,
+    ".png": 25,
+}
+UPLOAD_MAX_BYTES = {
+    ext: _env_int(f"TMS_UPLOAD_MAX_MB_{ext[1:].upper()}", mb) * 1024 * 1024
+    for ext, mb in _UPLOAD_MAX_MB_DEFAULTS.items()
+}
+UPLOAD_MAX_BYTES_DEFAULT = _env_int("TMS_UPLOAD_MAX_MB", 50) * 1024 * 1024
+
+# ==========================================================
+# --- BULK UPLOAD ---
+# Multi-file and zip uploads are staged by BULK_UPLOAD_WORKERS
+# threads and recorded BULK_UPLOAD_BATCH_SIZE files per INSERT.
+# ==========================================================
+BULK_UPLOAD_WORKERS = _env_int("TMS_BULK_UPLOAD_WORKERS", 4)
+BULK_UPLOAD_BATCH_SIZE = _env_int("TMS_BULK_UPLOAD_BATCH_SIZE", 50)
+
+# ==========================================================
+# --- USER IMPORT / EXPORT ---
+# CSV imports hash their passwords in USER_IMPORT_WORKERS
+# processes (all cores by default) and are limited to
+# USER_IMPORT_MAX_ROWS rows. Exports are read
+# USER_EXPORT_FETCH_SIZE rows at a time.
+# ==========================================================
+USER_IMPORT_WORKERS = _env_int("TMS_USER_IMPORT_WORKERS", os.cpu_count() or 1)
+USER_IMPORT_MAX_ROWS = _env_int("TMS_USER_IMPORT_MAX_ROWS", 5000)
+USER_EXPORT_FETCH_SIZE = _env_int("TMS_USER_EXPORT_FETCH_SIZE", 500)
+
+# ==========================================================
+# --- QUERY RESULT CACHE ---
+# Results of cached reads (tms/querycache.py) shared by all
+# sessions of a process; old versions age out by count.
+# ==========================================================
+QUERY_CACHE_MAX_ENTRIES = _env_int("TMS_QUERY_CACHE_MAX_ENTRIES", 2000)
+
+# ==========================================================
+# --- BACKGROUND JOBS ---
+# Run by `python worker.py` (Procfile "worker"); JOB_CONCURRENCY
+# jobs execute at once, each in its own process. A running job's
+# lease is renewed while it runs; an expired lease means the worker
+# died and the job is queued again.
+# ==========================================================
+JOB_CONCURRENCY = _env_int("TMS_JOB_CONCURRENCY", 2)
+JOB_POLL_INTERVAL = _env_float("TMS_JOB_POLL_INTERVAL", 5.0)
+JOB_LEASE_SECONDS = _env_int("TMS_JOB_LEASE_SECONDS", 300)
+JOB_MAX_ATTEMPTS = _env_int("TMS_JOB_MAX_ATTEMPTS", 3)
+JOB_RETRY_DELAY = _env_int("TMS_JOB_RETRY_DELAY", 30)  # doubled after each failed attempt
+JOB_STATUS_POLL_INTERVAL = _env_float("TMS_JOB_STATUS_POLL_INTERVAL", 3.0)  # pages waiting on a job
+# Finished (done/failed) jobs are deleted once older than this, by a
+# job run every JOB_PRUNE_INTERVAL seconds
+JOB_RETENTION_DAYS = _env_float("TMS_JOB_RETENTION_DAYS", 14)
+JOB_PRUNE_INTERVAL = _env_int("TMS_JOB_PRUNE_INTERVAL", 3600)
+JOB_PRUNE_BATCH_SIZE = _env_int("TMS_JOB_PRUNE_BATCH_SIZE", 5000)  # rows per transaction
+
+# ==========================================================
+# --- TRASH ---
+# Deleted projects and files are moved under TRASH_DIR (keep it on
+# the same filesystem as PROJECTS_DIR and UPLOAD_DIR so the move is
+# a rename) and purged by the worker once older than the retention
+# window. See tms/trash.py.
+# ==========================================================
+TRASH_DIR = Path(os.environ.get("TMS_TRASH_DIR", DATA_DIR / "trash"))
+TRASH_RETENTION_DAYS = _env_float("TMS_TRASH_RETENTION_DAYS", 30)
+TRASH_PURGE_INTERVAL = _env_int("TMS_TRASH_PURGE_INTERVAL", 3600)
+TRASH_PURGE_BATCH_SIZE = _env_int("TMS_TRASH_PURGE_BATCH_SIZE", 200)  # rows per transaction
+
+# ==========================================================
+# --- INTEGRITY CHECKS ---
+# Run by the worker (tms/integrity.py): a presence check of uploads/
+# and the blob store against the database every
+# INTEGRITY_CHECK_INTERVAL seconds, and a scrub that re-hashes the
+# least recently verified files with SCRUB_WORKERS threads, up to
+# SCRUB_MAX_FILES files or SCRUB_MAX_MB per run.
+# ==========================================================
+INTEGRITY_CHECK_INTERVAL = _env_int("TMS_INTEGRITY_CHECK_INTERVAL", 900)
+SCRUB_INTERVAL = _env_int("TMS_SCRUB_INTERVAL", 3600)
+SCRUB_WORKERS = _env_int("TMS_SCRUB_WORKERS", 4)
+SCRUB_MAX_FILES = _env_int("TMS_SCRUB_MAX_FILES", 5000)
+SCRUB_MAX_BYTES = _env_int("TMS_SCRUB_MAX_MB", 2048) * 1024 * 1024
+
+# ==========================================================
+# --- PERFORMANCE METRICS ---
+# In-memory timings and byte counts per process (tms/metrics.py),
+# shown in the Admin Panel for this process or, merged from their
+# heartbeats, for all of them. GET /tms/metrics serves them to
+# Prometheus with "Authorization: Bearer <TMS_METRICS_TOKEN>";
+# without a token only logged-in admins can read it.
+# ==========================================================
+METRICS_ENABLED = os.environ.get("TMS_METRICS", "1") != "0"
+METRICS_TOKEN = os.environ.get("TMS_METRICS_TOKEN", "")
@@ -0,0 +1,147 @@
+# ==========================================================
+# --- SHARED POSTGRESQL ACCESS ---
+# One connection pool per server process, shared by app.py,
+# every page and every Streamlit session.
+# ==========================================================
+
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extras
+import psycopg2.pool
+
+from tms import config, metrics
+
+_pool = None
+_pool_lock = threading.Lock()
+# Caps the number of borrowers so callers wait instead of hitting PoolError
+_slots = threading.BoundedSemaphore(max(config.DB_POOL_MAX, 1))
+# id(connection) -> time.monotonic() of its last successful use
+_last_used = {}
+
+
+class _TimedCursorMixin:
+    # Every statement's latency goes to tms/metrics.py
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            metrics.query_done(query, time.perf_counter() - start)
+
+
+class _TimedCursor(_TimedCursorMixin, psycopg2.extensions.cursor):
+    pass
+
+
+class _TimedDictCursor(_TimedCursorMixin, psycopg2.extras.DictCursor):
+    pass
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Raised when no pooled connection became free within DB_POOL_TIMEOUT."""
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = psycopg2.pool.ThreadedConnectionPool(
+                    max(config.DB_POOL_MIN, 0),
+                    max(config.DB_POOL_MAX, 1),
+                    **config.db_connect_kwargs(),
+                )
+    return _pool
+
+
+def close_pool():
+    """Close every pooled connection (used on shutdown and after a fork)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
+
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    last_used = _last_used.get(id(conn))
+    if last_used is not None and time.monotonic() - last_used < config.DB_HEALTHCHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _discard(pool, conn):
+    _last_used.pop(id(conn), None)
+    try:
+        pool.putconn(conn, close=True)
+    except psycopg2.pool.PoolError:
+        pass
+
+
+def _borrow():
+    pool = _get_pool()
+    # One retry: a stale connection (server restart, idle timeout) is
+    # thrown away and replaced by a fresh one.
+    for _ in range(2):
+        conn = pool.getconn()
+        if _is_healthy(conn):
+            return pool, conn
+        _discard(pool, conn)
+    raise psycopg2.OperationalError("Could not obtain a healthy database connection.")
+
+
+@contextmanager
+def get_connection():
+    """Borrow a pooled connection.
+
+    Commits when the block finishes, rolls back if it raises, and always
+    hands the connection back to the pool. Connections that failed at the
+    network level are closed instead of being reused.
+    """
+    if not _slots.acquire(timeout=config.DB_POOL_TIMEOUT):
+        raise PoolTimeout("Timed out waiting for a free database connection.")
+    try:
+        pool, conn = _borrow()
+        try:
+            yield conn
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            _discard(pool, conn)
+            raise
+        except BaseException:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                _discard(pool, conn)
+            else:
+                pool.putconn(conn)
+            raise
+        else:
+            _last_used[id(conn)] = time.monotonic()
+            pool.putconn(conn)
+    finally:
+        _slots.release()
+
+
+@contextmanager
+def get_cursor(dict_rows=False):
+    """Borrow a pooled connection and yield a cursor on it.
+
+    With ``dict_rows=True`` rows can be indexed by column name.
+    """
+    with get_connection() as conn:
+        cursor_factory = _TimedDictCursor if dict_rows else _TimedCursor
+        with conn.cursor(cursor_factory=cursor_factory) as cur:
+            yield cur
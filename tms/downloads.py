@@ -0,0 +1,77 @@
+# ==========================================================
+# --- LAZY DOWNLOAD BUTTONS ---
+# Nothing is read from disk while a page renders. When the file
+# endpoints are mounted (server.py) the button is a plain link that
+# streams the file over HTTP; otherwise Streamlit reads the file only
+# at the moment the button is clicked.
+#
+# zip_download_button and csv_download_button do the same for
+# archives built by tms/export.py and generated CSV files; only the
+# HTTP route streams them, the fallback has to assemble them in
+# memory.
+# ==========================================================
+
+from functools import partial
+from pathlib import Path
+
+import streamlit as st
+
+from tms import export, metrics, web
+
+
+def _file_bytes(path):
+    data = Path(path).read_bytes()
+    metrics.inc("tms_file_read_bytes_total", len(data), source="download")
+    return data
+
+
+def download_button(label, url, path, file_name, key):
+    if web.SERVED:
+        st.link_button(label, url)
+    else:
+        st.download_button(
+            label,
+            data=partial(_file_bytes, path),
+            file_name=file_name,
+            mime="application/octet-stream",
+            on_click="ignore",
+            key=key,
+        )
+
+
+def _zip_bytes(make_entries):
+    return b"".join(export.iter_zip(make_entries()))
+
+
+def zip_download_button(label, url, make_entries, file_name, key):
+    """``make_entries`` is only called when the fallback button is clicked."""
+    if web.SERVED:
+        st.link_button(label, url)
+    else:
+        st.download_button(
+            label,
+            data=partial(_zip_bytes, make_entries),
+            file_name=file_name,
+            mime="application/zip",
+            on_click="ignore",
+            key=key,
+        )
+
+
+def _csv_bytes(make_chunks):
+    return b"".join(make_chunks())
+
+
+def csv_download_button(label, url, make_chunks, file_name, key):
+    """``make_chunks`` (returning an iterable of bytes) is only called when the fallback button is clicked."""
+    if web.SERVED:
+        st.link_button(label, url)
+    else:
+        st.download_button(
+            label,
+            data=partial(_csv_bytes, make_chunks),
+            file_name=file_name,
+            mime="text/csv",
+            on_click="ignore",
+            key=key,
+        )
@@ -0,0 +1,107 @@
+# ==========================================================
+# --- ZIP EXPORT ---
+# Projects and file selections are downloaded as one .zip built
+# on the fly: each entry is read in DOWNLOAD_CHUNK_SIZE pieces and
+# the compressed bytes are handed out as soon as they exist, so no
+# temp file or whole archive is ever held. Formats that are already
+# compressed are stored as-is, which keeps exports disk-bound.
+# ==========================================================
+
+import io
+import zipfile
+from pathlib import Path
+
+from tms import catalog, config, db, metrics
+
+# Already-compressed formats: deflating them again costs CPU for ~0% gain
+STORED_SUFFIXES = {".pdf", ".jpg", ".jpeg", ".png", ".docx", ".xlsx", ".zip"}
+
+
+class _Sink(io.RawIOBase):
+    """Unseekable write target that collects bytes until drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _unique(name, used):
+    candidate, n = name, 0
+    while candidate in used:
+        n += 1
+        stem, dot, suffix = name.rpartition(".")
+        candidate = f"{stem} ({n}).{suffix}" if dot else f"{name} ({n})"
+    used.add(candidate)
+    return candidate
+
+
+# ==========================================================
+# --- ENTRIES: (name in archive, path on disk) ---
+# ==========================================================
+def project_entries(project_name):
+    """Every indexed file of a project, grouped by folder."""
+    root = catalog.project_path(project_name)
+    return [
+        (f"{project_name}/{folder}/{row['file_name']}", root / folder / row["file_name"])
+        for folder, rows in catalog.list_project_files(project_name).items()
+        for row in rows
+    ]
+
+
+def company_file_entries(file_ids):
+    """Company files by id; clashing names get a " (n)" suffix."""
+    with db.get_cursor() as cur:
+        cur.execute(
+            """
+            SELECT file_name, file_path FROM files
+            WHERE file_id = ANY(%s) AND deleted_at IS NULL
+            ORDER BY uploaded_at, file_id;
+            """,
+            (list(file_ids),)
+        )
+        rows = cur.fetchall()
+    used = set()
+    return [(_unique(file_name, used), Path(file_path)) for file_name, file_path in rows]
+
+
+# ==========================================================
+# --- STREAMING ---
+# ==========================================================
+def iter_zip(entries):
+    """Yield a zip archive of ``entries`` piece by piece.
+
+    Files that disappeared since the entries were listed are left out.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", allowZip64=True) as archive:
+        for arcname, path in entries:
+            try:
+                source = open(path, "rb")
+            except FileNotFoundError:
+                continue
+            with source:
+                info = zipfile.ZipInfo.from_file(path, arcname)
+                if Path(path).suffix.lower() in STORED_SUFFIXES:
+                    info.compress_type = zipfile.ZIP_STORED
+                else:
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                with archive.open(info, "w", force_zip64=True) as dest:
+                    for chunk in iter(lambda: source.read(config.DOWNLOAD_CHUNK_SIZE), b""):
+                        metrics.inc("tms_file_read_bytes_total", len(chunk), source="export")
+                        dest.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+            yield sink.drain()
+    yield sink.drain()  # central directory
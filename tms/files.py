@@ -0,0 +1,191 @@
+# ==========================================================
+# --- COMPANY FILES (files table) ---
+# Keyset-paginated listing for File_Manager. Pages are ordered by
+# (uploaded_at DESC, file_id DESC) and continue from the last row
+# of the previous page, so every page costs the same regardless
+# of how many files exist. Indexes: migrations/002.
+#
+# Reads are cached across sessions until the files (or users) table
+# changes, see tms/querycache.py. Writers call invalidate_listing()
+# after committing so this process sees the change at once.
+# ==========================================================
+
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from psycopg2.extras import execute_values
+
+from tms import bulk, config, db, querycache, storage, trash
+
+PAGE_SIZES = [25, 50, 100]
+
+
+@querycache.cached("files", "users")
+def list_files(page_size, after=None, name=None, uploader=None, date_from=None, date_to=None):
+    """Return one page of files plus the cursor for the next page.
+
+    ``after`` is the ``(uploaded_at, file_id)`` cursor returned for the
+    previous page (None for the first page). The next-page cursor is None
+    when there are no more rows.
+    """
+    conditions = ["f.deleted_at IS NULL"]
+    params = []
+    if after is not None:
+        conditions.append("(f.uploaded_at, f.file_id) < (%s, %s)")
+        params.extend(after)
+    if name:
+        conditions.append("f.file_name ILIKE %s")
+        params.append(f"%{_escape_like(name)}%")
+    if uploader:
+        conditions.append("f.uploaded_by IN (SELECT user_id FROM users WHERE lower(username) = lower(%s))")
+        params.append(uploader)
+    if date_from:
+        conditions.append("f.uploaded_at >= %s")
+        params.append(date_from)
+    if date_to:
+        conditions.append("f.uploaded_at < %s")
+        params.append(date_to + timedelta(days=1))
+
+    where = f"WHERE {' AND '.join(conditions)}"
+    with db.get_cursor(dict_rows=True) as cur:
+        # One extra row tells us whether a next page exists
+        cur.execute(
+            f"""
+            SELECT f.file_id, f.file_name, f.file_path, f.uploaded_at, u.username AS uploaded_by,
+                   f.integrity_status
+            FROM files f
+            LEFT JOIN users u ON u.user_id = f.uploaded_by
+            {where}
+            ORDER BY f.uploaded_at DESC, f.file_id DESC
+            LIMIT %s;
+            """,
+            params + [page_size + 1]
+        )
+        rows = cur.fetchall()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = (rows[-1]["uploaded_at"], rows[-1]["file_id"])
+    return rows, next_cursor
+
+
+@querycache.cached("files")
+def get_file(file_id):
+    """file_name, file_path and sha256 of one file, or None."""
+    with db.get_cursor(dict_rows=True) as cur:
+        cur.execute("SELECT file_name, file_path, sha256 FROM files WHERE file_id=%s AND deleted_at IS NULL;", (file_id,))
+        return cur.fetchone()
+
+
+@querycache.cached("files")
+def all_files():
+    """Every company file, newest first (Admin Panel)."""
+    with db.get_cursor(dict_rows=True) as cur:
+        cur.execute("""
+            SELECT file_id, file_name, file_path, integrity_status FROM files
+            WHERE deleted_at IS NULL
+            ORDER BY uploaded_at DESC, file_id DESC;
+        """)
+        return cur.fetchall()
+
+
+def invalidate_listing():
+    """Make this process's cached reads reflect a committed write to files."""
+    querycache.written("files")
+
+
+def _escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# ==========================================================
+# --- UPLOAD & DELETE ---
+# uploads/ entries are links into the blob store (tms/storage.py);
+# files.sha256 is the reference that keeps the content alive.
+# Deleting moves the file to the trash (tms/trash.py).
+# ==========================================================
+def save_upload(file_name, source, uploaded_by):
+    """Store an uploaded company file and record it; returns the new file_id.
+
+    ``source`` is read in chunks (see storage.stage); the file and its
+    files row are committed together or not at all.
+    """
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    with storage.stage(source, file_name) as staged:
+        with db.get_cursor() as cur:
+            save_path = staged.commit(cur, config.UPLOAD_DIR / f"{timestamp}_{file_name}")
+            cur.execute(
+                """
+                INSERT INTO files (file_name, file_path, uploaded_by, sha256, size_bytes)
+                VALUES (%s, %s, %s, %s, %s) RETURNING file_id;
+                """,
+                (file_name, str(save_path), uploaded_by, staged.sha256, staged.size)
+            )
+            file_id = cur.fetchone()[0]
+    invalidate_listing()
+    return file_id
+
+
+def save_uploads(items, uploaded_by, progress=None):
+    """Bulk save_upload for (file_name, open_source) items, see tms/bulk.py.
+
+    Returns (file_ids, failures).
+    """
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+
+    def record(cur, batch):
+        rows = []
+        for file_name, staged in batch:
+            save_path = staged.commit(cur, config.UPLOAD_DIR / f"{timestamp}_{file_name}")
+            rows.append((file_name, str(save_path), uploaded_by, staged.sha256, staged.size))
+        inserted = execute_values(
+            cur,
+            "INSERT INTO files (file_name, file_path, uploaded_by, sha256, size_bytes) VALUES %s RETURNING file_id;",
+            rows,
+            page_size=len(rows),
+            fetch=True,
+        )
+        return [row[0] for row in inserted]
+
+    try:
+        return bulk.ingest_many(items, record, progress)
+    finally:
+        invalidate_listing()  # earlier batches may have committed
+
+
+def delete_file(file_id, deleted_by=None):
+    """Move a company file to the trash; False if there is no such file."""
+    with trash.Moves() as move, db.get_cursor() as cur:
+        cur.execute(
+            "UPDATE files SET deleted_at = NOW(), deleted_by = %s WHERE file_id=%s AND deleted_at IS NULL RETURNING file_path;",
+            (deleted_by, file_id)
+        )
+        row = cur.fetchone()
+        if not row:
+            return False
+        source = Path(row[0])
+        if source.exists():
+            move(source, trash.path("files", file_id, source.name))
+    invalidate_listing()
+    return True
+
+
+def restore_file(file_id):
+    """Put a trashed company file back; False if it is not in the trash."""
+    with trash.Moves() as move, db.get_cursor() as cur:
+        cur.execute("SELECT file_path FROM files WHERE file_id=%s AND deleted_at IS NOT NULL FOR UPDATE;", (file_id,))
+        row = cur.fetchone()
+        if not row:
+            return False
+        file_path = Path(row[0])
+        source = trash.path("files", file_id, file_path.name)
+        if not source.exists():
+            raise ValueError(f"'{file_path.name}' is missing from the trash.")
+        file_path = move(source, file_path)
+        cur.execute(
+            "UPDATE files SET deleted_at = NULL, deleted_by = NULL, file_path = %s WHERE file_id=%s;",
+            (str(file_path), file_id)
+        )
+    invalidate_listing()
+    return True
@@ -0,0 +1,92 @@
+# ==========================================================
+# --- SERVER INSTANCES ---
+# Every web process (server.py) registers itself in the
+# server_instances table and refreshes its row every
+# INSTANCE_HEARTBEAT_INTERVAL seconds with its raw metrics
+# (tms/metrics.py export()). Any process can then list the live
+# ones and merge their figures for the Admin Panel. Rows of
+# processes that stopped without saying so are dropped after ten
+# missed heartbeats.
+#
+# deployment_problems() lists settings that differ per process
+# unless set explicitly, which breaks requests that reach another
+# process than the one that issued a cookie.
+# ==========================================================
+
+import logging
+import os
+import socket
+
+from psycopg2.extras import Json
+from streamlit import config as st_config
+
+from tms import background, config, db, metrics
+
+log = logging.getLogger(__name__)
+
+HOST = socket.gethostname()
+INSTANCE_ID = f"{HOST}:{os.getpid()}"
+DEFAULT_COOKIE_KEY = "abcdef"
+
+
+def deployment_problems():
+    """Settings that must be shared by all server processes but are not."""
+    problems = []
+    if config.COOKIE_KEY == DEFAULT_COOKIE_KEY:
+        problems.append("TMS_COOKIE_KEY is not set: login cookies are signed with the built-in default key.")
+    if not st_config.is_manually_set("server.cookieSecret"):
+        problems.append(
+            "server.cookieSecret is not set (STREAMLIT_SERVER_COOKIE_SECRET): each process signs "
+            "Streamlit's own cookies with a random secret of its own."
+        )
+    return problems
+
+
+def heartbeat(first_run=False):
+    with db.get_cursor() as cur:
+        cur.execute("""
+            INSERT INTO server_instances (instance_id, host, pid, started_at, seen_at, metrics)
+            VALUES (%s, %s, %s, to_timestamp(%s)::timestamp, NOW(), %s)
+            ON CONFLICT (instance_id) DO UPDATE SET seen_at = NOW(), metrics = EXCLUDED.metrics;
+        """, (INSTANCE_ID, HOST, os.getpid(), metrics.PROCESS_STARTED, Json(metrics.export())))
+        cur.execute("DELETE FROM server_instances WHERE seen_at < NOW() - make_interval(secs => %s);",
+                    (10 * config.INSTANCE_HEARTBEAT_INTERVAL,))
+        if first_run:
+            cur.execute("SELECT COUNT(*) FROM server_instances WHERE instance_id <> %s;", (INSTANCE_ID,))
+            others = cur.fetchone()[0]
+    if first_run and others:
+        for problem in deployment_problems():
+            log.warning("Running next to %d other server process(es): %s", others, problem)
+
+
+def start():
+    """Register this process and keep its row fresh."""
+    return background.start_periodic("instance-heartbeat", heartbeat, config.INSTANCE_HEARTBEAT_INTERVAL)
+
+
+def deregister():
+    try:
+        with db.get_cursor() as cur:
+            cur.execute("DELETE FROM server_instances WHERE instance_id = %s;", (INSTANCE_ID,))
+    except Exception:
+        log.warning("Could not deregister %s", INSTANCE_ID, exc_info=True)
+
+
+def live():
+    """Processes that sent a heartbeat within the last three intervals, oldest first.
+
+    This process's own entry carries its current figures rather than
+    those of its last heartbeat.
+    """
+    with db.get_cursor(dict_rows=True) as cur:
+        cur.execute("""
+            SELECT instance_id, host, pid, started_at, seen_at, metrics
+            FROM server_instances
+            WHERE seen_at > NOW() - make_interval(secs => %s)
+            ORDER BY started_at, instance_id;
+        """, (3 * config.INSTANCE_HEARTBEAT_INTERVAL,))
+        rows = [dict(row) for row in cur.fetchall()]
+    for row in rows:
+        if row["instance_id"] == INSTANCE_ID:
+            row["metrics"] = metrics.export()
+    return rows
@@ -0,0 +1,269 @@
+# ==========================================================
+# --- STORAGE INTEGRITY ---
+# Keeps the integrity_status columns (migrations/010) current so
+# pages never stat files to decide what to show:
+#
+# check()  one batched pass comparing the files table with uploads/
+#          and the blobs table with BLOB_DIR (the projects/ tree is
+#          handled by catalog.reconcile, which it runs first). Rows
+#          whose file is gone become "missing"; files no row refers
+#          to are recorded in storage_orphans.
+# scrub()  re-hashes the least recently verified files in a thread
+#          pool and marks mismatches "corrupt" (bit rot, or a file
+#          edited in place outside the app).
+#
+# Both run in the worker (tasks "check_storage" / "scrub_files").
+# ==========================================================
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from psycopg2.extras import execute_values
+
+from tms import catalog, config, db, files, metrics, storage
+
+log = logging.getLogger(__name__)
+
+STATUSES = ["ok", "missing", "corrupt"]
+
+
+# ==========================================================
+# --- PRESENCE CHECK ---
+# ==========================================================
+def _scan_files(directory):
+    """{name: stat} of the regular files directly in ``directory``."""
+    found = {}
+    try:
+        entries = os.scandir(directory)
+    except FileNotFoundError:
+        return found
+    with entries:
+        for entry in entries:
+            if entry.name.startswith(".tms-"):
+                continue  # in-flight temporary link
+            try:
+                if entry.is_file():
+                    found[entry.name] = entry.stat()
+            except FileNotFoundError:
+                pass
+    return found
+
+
+def _scan_blobs():
+    """{sha256: (path, stat)} of the files in the blob store."""
+    found = {}
+    for top, _dirs, names in os.walk(config.BLOB_DIR):
+        if Path(top).name == ".incoming":
+            continue
+        for name, stat in _scan_files(top).items():
+            if len(name) == 64:
+                found[name] = (os.path.join(top, name), stat)
+    return found
+
+
+def _orphan_row(path, area, stat):
+    return (str(path), area, stat.st_size, datetime.fromtimestamp(stat.st_mtime))
+
+
+def _record_orphans(cur, area, rows):
+    cur.execute("DELETE FROM storage_orphans WHERE area = %s;", (area,))
+    if rows:
+        execute_values(
+            cur,
+            "INSERT INTO storage_orphans (path, area, size_bytes, modified_at) VALUES %s ON CONFLICT (path) DO NOTHING;",
+            rows,
+        )
+
+
+def _set_status(cur, table, key_column, changes):
+    # changes: [(row id, new status)]; one statement, only when needed
+    # (every UPDATE on files invalidates the cached listings)
+    if changes:
+        execute_values(cur, f"""
+            UPDATE {table} t SET integrity_status = v.status
+            FROM (VALUES %s) AS v(item_id, status)
+            WHERE t.{key_column} = v.item_id;
+        """, changes)
+
+
+def check():
+    """Compare the database with uploads/ and the blob store.
+
+    Returns {"missing": n, "found_again": n, "orphans": n}.
+    """
+    catalog.reconcile()
+
+    upload_dir = os.path.abspath(config.UPLOAD_DIR)
+    with metrics.timer("tms_fs_scan_seconds", area="uploads"):
+        uploads = _scan_files(config.UPLOAD_DIR)
+    with metrics.timer("tms_fs_scan_seconds", area="blobs"):
+        blobs = _scan_blobs()
+    result = {"missing": 0, "found_again": 0, "orphans": 0}
+    with db.get_cursor() as cur:
+        # Read after the scans, so files whose row commits meanwhile are
+        # not reported as orphans
+        cur.execute("SELECT file_id, file_path, integrity_status, deleted_at IS NOT NULL FROM files;")
+        referenced, changes = set(), []
+        for file_id, file_path, status, deleted in cur.fetchall():
+            in_uploads = os.path.dirname(os.path.abspath(file_path)) == upload_dir
+            name = os.path.basename(file_path)
+            if in_uploads:
+                referenced.add(name)
+            if deleted:
+                continue  # lives in the trash, see tms/trash.py
+            present = name in uploads if in_uploads else os.path.isfile(file_path)
+            if not present and status != "missing":
+                changes.append((file_id, "missing"))
+                result["missing"] += 1
+            elif present and status == "missing":
+                changes.append((file_id, "ok"))  # corrupt stays until re-verified
+                result["found_again"] += 1
+        _set_status(cur, "files", "file_id", changes)
+
+        orphans = [
+            _orphan_row(Path(config.UPLOAD_DIR) / name, "uploads", stat)
+            for name, stat in uploads.items() if name not in referenced
+        ]
+        cur.execute("SELECT sha256 FROM blobs;")
+        known = {row[0] for row in cur.fetchall()}
+        orphans += [_orphan_row(path, "blobs", stat) for sha256, (path, stat) in blobs.items() if sha256 not in known]
+        _record_orphans(cur, "uploads", [row for row in orphans if row[1] == "uploads"])
+        _record_orphans(cur, "blobs", [row for row in orphans if row[1] == "blobs"])
+        result["orphans"] = len(orphans)
+    if changes:
+        files.invalidate_listing()
+    return result
+
+
+# ==========================================================
+# --- CHECKSUM SCRUB ---
+# ==========================================================
+def _scrub_candidates(cur, limit):
+    cur.execute("""
+        (SELECT 'files' AS kind, file_id AS item_id, file_path, NULL, NULL, NULL, sha256, verified_at
+         FROM files
+         WHERE deleted_at IS NULL AND sha256 IS NOT NULL
+         ORDER BY verified_at NULLS FIRST LIMIT %s)
+        UNION ALL
+        (SELECT 'project_files', pf.project_file_id, NULL, p.name, pf.folder, pf.file_name, pf.sha256, pf.verified_at
+         FROM project_files pf
+         JOIN projects p ON p.project_id = pf.project_id
+         WHERE pf.deleted_at IS NULL AND p.deleted_at IS NULL AND pf.sha256 IS NOT NULL
+         ORDER BY pf.verified_at NULLS FIRST LIMIT %s)
+        ORDER BY verified_at NULLS FIRST
+        LIMIT %s;
+    """, (limit, limit, limit))
+    for kind, item_id, file_path, project_name, folder, file_name, sha256, _ in cur.fetchall():
+        path = Path(file_path) if kind == "files" else catalog.project_path(project_name) / folder / file_name
+        yield kind, item_id, path, sha256
+
+
+def scrub(max_files=None, max_bytes=None):
+    """Re-hash up to ``max_files`` files / ``max_bytes`` bytes, oldest verification first.
+
+    Files sharing one inode (links to the same blob) are hashed once.
+    Returns the number of files checked per status.
+    """
+    max_files = max_files or config.SCRUB_MAX_FILES
+    max_bytes = max_bytes or config.SCRUB_MAX_BYTES
+    with db.get_cursor() as cur:
+        candidates = list(_scrub_candidates(cur, max_files))
+
+    by_inode, checked, total = {}, [], 0
+    for kind, item_id, path, sha256 in candidates:
+        try:
+            stat = path.stat()
+        except OSError:
+            checked.append((kind, item_id, sha256, "missing"))
+            continue
+        inode = (stat.st_dev, stat.st_ino)
+        if inode not in by_inode:
+            if total and total + stat.st_size > max_bytes:
+                continue  # next run
+            total += stat.st_size
+            by_inode[inode] = (path, [])
+        by_inode[inode][1].append((kind, item_id, sha256))
+
+    def digest(path):
+        try:
+            return storage.sha256_file(path)
+        except OSError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=config.SCRUB_WORKERS, thread_name_prefix="tms-scrub") as pool:
+        digests = pool.map(digest, [path for path, _ in by_inode.values()])
+        for (path, rows), actual in zip(by_inode.values(), digests):
+            for kind, item_id, sha256 in rows:
+                status = "missing" if actual is None else "ok" if actual == sha256 else "corrupt"
+                checked.append((kind, item_id, sha256, status))
+            if actual is not None and any(sha256 != actual for _, _, sha256 in rows):
+                log.warning("Checksum mismatch for %s and %s other link(s)", path, len(rows) - 1)
+
+    with db.get_cursor() as cur:
+        for table, key_column, kind in (("files", "file_id", "files"), ("project_files", "project_file_id", "project_files")):
+            rows = [(item_id, sha256, status) for k, item_id, sha256, status in checked if k == kind]
+            if rows:
+                # Only if the content is still the one that was hashed
+                execute_values(cur, f"""
+                    UPDATE {table} t SET integrity_status = v.status, verified_at = NOW()
+                    FROM (VALUES %s) AS v(item_id, sha256, status)
+                    WHERE t.{key_column} = v.item_id AND t.sha256 = v.sha256;
+                """, rows)
+    if any(kind == "files" for kind, *_ in checked):
+        files.invalidate_listing()
+    counts = dict.fromkeys(STATUSES, 0)
+    for *_, status in checked:
+        counts[status] += 1
+    return counts
+
+
+# ==========================================================
+# --- ADMIN VIEW ---
+# ==========================================================
+def summary():
+    """{status: count} over live company and project files, plus orphans."""
+    with db.get_cursor() as cur:
+        cur.execute("""
+            SELECT integrity_status, COUNT(*) FROM (
+                SELECT integrity_status FROM files WHERE deleted_at IS NULL
+                UNION ALL
+                SELECT pf.integrity_status FROM project_files pf
+                JOIN projects p ON p.project_id = pf.project_id
+                WHERE pf.deleted_at IS NULL AND p.deleted_at IS NULL
+            ) s GROUP BY integrity_status;
+        """)
+        found = dict(cur.fetchall())
+        cur.execute("SELECT COUNT(*) FROM storage_orphans;")
+        orphans = cur.fetchone()[0]
+    counts = {status: found.get(status, 0) for status in STATUSES}
+    counts["orphaned"] = orphans
+    return counts
+
+
+def problems(limit=500):
+    """Live files that are missing or corrupt."""
+    with db.get_cursor(dict_rows=True) as cur:
+        cur.execute("""
+            (SELECT 'Company file' AS kind, file_name AS name, file_path AS location, integrity_status, verified_at
+             FROM files WHERE integrity_status <> 'ok' AND deleted_at IS NULL)
+            UNION ALL
+            (SELECT 'Project file', pf.file_name, p.name || ' / ' || pf.folder, pf.integrity_status, pf.verified_at
+             FROM project_files pf JOIN projects p ON p.project_id = pf.project_id
+             WHERE pf.integrity_status <> 'ok' AND pf.deleted_at IS NULL AND p.deleted_at IS NULL)
+            ORDER BY 4, 2
+            LIMIT %s;
+        """, (limit,))
+        return [dict(row) for row in cur.fetchall()]
+
+
+def orphans(limit=500):
+    """Files on disk with no row, as of the last check()."""
+    with db.get_cursor(dict_rows=True) as cur:
+        cur.execute("""
+            SELECT area, path, size_bytes, modified_at, found_at FROM storage_orphans
+            ORDER BY area, path LIMIT %s;
+        """, (limit,))
+        return [dict(row) for row in cur.fetchall()]
@@ -0,0 +1,343 @@
+# ==========================================================
+# --- BACKGROUND JOBS ---
+# A job queue in the jobs table (migrations/008). Pages enqueue
+# work and poll its status; worker.py claims jobs with
+# FOR UPDATE SKIP LOCKED, so any number of workers can share the
+# queue, and runs them in a process pool. Failed jobs are retried
+# with a growing delay up to max_attempts. Job kinds and their
+# functions are defined in tms/tasks.py; periodic kinds are enqueued
+# by the workers.
+# ==========================================================
+
+import logging
+import multiprocessing
+import os
+import select
+import signal
+import socket
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import psycopg2
+from psycopg2.extras import Json
+
+from tms import config, db, tasks
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "tms_jobs"
+MAX_DB_BACKOFF = 60  # seconds between reconnect attempts, at most
+STATUSES = ["queued", "running", "done", "failed"]
+
+
+# ==========================================================
+# --- QUEUE (used by the pages) ---
+# ==========================================================
+def enqueue(kind, payload=None, priority=0, dedupe_key=None, max_attempts=None, enqueued_by=None):
+    """Queue a job and return its id.
+
+    With ``dedupe_key``, a job of the same kind and key that is still
+    queued or running is reused instead of adding another.
+    """
+    with db.get_cursor() as cur:
+        cur.execute("""
+            INSERT INTO jobs (kind, payload, priority, dedupe_key, max_attempts, enqueued_by)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (kind, dedupe_key) WHERE dedupe_key IS NOT NULL AND status IN ('queued', 'running')
+            DO NOTHING
+            RETURNING job_id;
+        """, (kind, Json(payload or {}), priority, dedupe_key,
+              max_attempts or config.JOB_MAX_ATTEMPTS, enqueued_by))
+        row = cur.fetchone()
+        if row is None:
+            cur.execute(
+                "SELECT job_id FROM jobs WHERE kind = %s AND dedupe_key = %s AND status IN ('queued', 'running');",
+                (kind, dedupe_key)
+            )
+            row = cur.fetchone()
+        cur.execute("SELECT pg_notify(%s, %s);", (CHANNEL, kind))
+    return row[0]
+
+
+def statuses(job_ids):
+    """{job_id: status} for the given jobs."""
+    if not job_ids:
+        return {}
+    with db.get_cursor() as cur:
+        cur.execute("SELECT job_id, status FROM jobs WHERE job_id = ANY(%s);", (list(job_ids),))
+        return dict(cur.fetchall())
+
+
+def active(kind):
+    """Queued or running jobs of one kind, oldest first."""
+    with db.get_cursor(dict_rows=True) as cur:
+        cur.execute("""
+            SELECT job_id, payload, status, attempts, last_error FROM jobs
+            WHERE kind = %s AND status IN ('queued', 'running')
+            ORDER BY job_id;
+        """, (kind,))
+        return cur.fetchall()
+
+
+def counts():
+    """{status: number of jobs} including zero counts."""
+    with db.get_cursor() as cur:
+        cur.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status;")
+        found = dict(cur.fetchall())
+    return {status: found.get(status, 0) for status in STATUSES}
+
+
+def prune(retention_days=None):
+    """Delete done and failed jobs finished more than ``retention_days`` ago.
+
+    Runs JOB_PRUNE_BATCH_SIZE rows per transaction; returns the number deleted.
+    """
+    if retention_days is None:
+        retention_days = config.JOB_RETENTION_DAYS
+    deleted = 0
+    while True:
+        with db.get_cursor() as cur:
+            cur.execute("""
+                DELETE FROM jobs WHERE job_id IN (
+                    SELECT job_id FROM jobs
+                    WHERE status IN ('done', 'failed') AND finished_at < NOW() - make_interval(secs => %s)
+                    LIMIT %s
+                );
+            """, (float(retention_days) * 86400, config.JOB_PRUNE_BATCH_SIZE))
+            count = cur.rowcount
+        deleted += count
+        if count < config.JOB_PRUNE_BATCH_SIZE:
+            return deleted
+
+
+def recent(limit=100, status=None):
+    """Newest jobs first, optionally of one status (Admin Panel)."""
+    with db.get_cursor(dict_rows=True) as cur:
+        cur.execute("""
+            SELECT job_id, kind, payload, priority, status, attempts, max_attempts,
+                   worker, enqueued_by, last_error, created_at, started_at, finished_at
+            FROM jobs
+            WHERE %s IS NULL OR status = %s
+            ORDER BY job_id DESC
+            LIMIT %s;
+        """, (status, status, limit))
+        return cur.fetchall()
+
+
+def retry(job_id):
+    """Queue a failed job again with a fresh set of attempts."""
+    with db.get_cursor() as cur:
+        cur.execute("""
+            UPDATE jobs SET status = 'queued', attempts = 0, run_after = NOW(), last_error = NULL, finished_at = NULL
+            WHERE job_id = %s AND status = 'failed';
+        """, (job_id,))
+        retried = cur.rowcount == 1
+        if retried:
+            cur.execute("SELECT pg_notify(%s, 'retry');", (CHANNEL,))
+    return retried
+
+
+# ==========================================================
+# --- WORKER SIDE ---
+# ==========================================================
+def _claim(worker_name):
+    with db.get_cursor(dict_rows=True) as cur:
+        cur.execute("""
+            UPDATE jobs SET status = 'running',
+                            attempts = attempts + 1,
+                            started_at = NOW(),
+                            lease_expires_at = NOW() + make_interval(secs => %s),
+                            worker = %s
+            WHERE job_id = (
+                SELECT job_id FROM jobs
+                WHERE status = 'queued' AND run_after <= NOW()
+                ORDER BY priority DESC, run_after, job_id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING job_id, kind, payload, attempts, max_attempts;
+        """, (config.JOB_LEASE_SECONDS, worker_name))
+        return cur.fetchone()
+
+
+def _enqueue_due():
+    # One job per periodic kind (tasks.SCHEDULE) once the last one is
+    # old enough; the dedupe index stops two workers adding it twice
+    with db.get_cursor() as cur:
+        for kind, every in tasks.SCHEDULE.items():
+            cur.execute("""
+                INSERT INTO jobs (kind, dedupe_key, max_attempts, enqueued_by)
+                SELECT %s, 'schedule', %s, 'schedule'
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM jobs WHERE kind = %s AND created_at > NOW() - make_interval(secs => %s)
+                )
+                ON CONFLICT (kind, dedupe_key) WHERE dedupe_key IS NOT NULL AND status IN ('queued', 'running')
+                DO NOTHING;
+            """, (kind, config.JOB_MAX_ATTEMPTS, kind, every))
+
+
+def _renew_leases(job_ids):
+    if not job_ids:
+        return
+    with db.get_cursor() as cur:
+        cur.execute("""
+            UPDATE jobs SET lease_expires_at = NOW() + make_interval(secs => %s)
+            WHERE job_id = ANY(%s) AND status = 'running';
+        """, (config.JOB_LEASE_SECONDS, list(job_ids)))
+
+
+def _requeue_expired():
+    # Jobs whose worker stopped renewing the lease: run them again, or
+    # give up if that was their last attempt
+    with db.get_cursor() as cur:
+        cur.execute("""
+            UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                            last_error = 'worker stopped while running the job',
+                            finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE NOW() END,
+                            lease_expires_at = NULL
+            WHERE status = 'running' AND lease_expires_at < NOW();
+        """)
+        return cur.rowcount
+
+
+def _finish(job, result):
+    with db.get_cursor() as cur:
+        cur.execute("""
+            UPDATE jobs SET status = 'done', result = %s, finished_at = NOW(), lease_expires_at = NULL
+            WHERE job_id = %s;
+        """, (Json(result), job["job_id"]))
+
+
+def _fail(job, error):
+    retry_later = job["attempts"] < job["max_attempts"]
+    delay = config.JOB_RETRY_DELAY * 2 ** (job["attempts"] - 1)
+    with db.get_cursor() as cur:
+        cur.execute("""
+            UPDATE jobs SET status = %s,
+                            last_error = %s,
+                            run_after = NOW() + make_interval(secs => %s),
+                            finished_at = CASE WHEN %s THEN NULL ELSE NOW() END,
+                            lease_expires_at = NULL
+            WHERE job_id = %s;
+        """, ("queued" if retry_later else "failed", f"{type(error).__name__}: {error}",
+              delay, retry_later, job["job_id"]))
+    log.warning("Job %s (%s) failed on attempt %s/%s: %s",
+                job["job_id"], job["kind"], job["attempts"], job["max_attempts"], error)
+
+
+def _execute(kind, payload):
+    # Runs in a pool process
+    return tasks.run(kind, payload)
+
+
+def _init_child():
+    # Each pool process opens its own connections
+    db.close_pool()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _listen_connection():
+    conn = psycopg2.connect(**config.db_connect_kwargs())
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"LISTEN {CHANNEL};")
+    return conn
+
+
+def _wait_for_jobs(conn, timeout):
+    # Sleep until something is enqueued or the timeout passes
+    if select.select([conn], [], [], timeout) != ([], [], []):
+        conn.poll()
+        conn.notifies.clear()
+
+
+def _close_quietly(conn):
+    if conn is not None:
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+
+def run_worker(concurrency=None, stop=None):
+    """Claim and run jobs until ``stop`` is set (or SIGTERM/SIGINT).
+
+    While the database is unreachable the worker backs off (doubling
+    from JOB_POLL_INTERVAL up to MAX_DB_BACKOFF seconds) and then opens
+    a new LISTEN connection. A job whose result could not be recorded
+    is run again once its lease expires.
+    """
+    concurrency = max(1, concurrency or config.JOB_CONCURRENCY)
+    stop = stop or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda *_: stop.set())
+
+    worker_name = f"{socket.gethostname()}:{os.getpid()}"
+    context = multiprocessing.get_context("spawn")
+    pool = ProcessPoolExecutor(concurrency, mp_context=context, initializer=_init_child)
+    conn = None
+    db_failures = 0
+    running = {}  # future -> job
+    log.info("Worker %s started with %s process(es)", worker_name, concurrency)
+    try:
+        while not stop.is_set():
+            try:
+                if conn is None:
+                    conn = _listen_connection()
+                _requeue_expired()
+                _enqueue_due()
+                _renew_leases([job["job_id"] for job in running.values()])
+                if db_failures:
+                    log.info("Worker %s is connected to the database again", worker_name)
+                    db_failures = 0
+                while len(running) < concurrency and not stop.is_set():
+                    job = _claim(worker_name)
+                    if job is None:
+                        break
+                    log.info("Running job %s (%s), attempt %s", job["job_id"], job["kind"], job["attempts"])
+                    running[pool.submit(_execute, job["kind"], job["payload"])] = job
+
+                if not running:
+                    _wait_for_jobs(conn, config.JOB_POLL_INTERVAL)
+                    continue
+                done, _ = wait(running, timeout=config.JOB_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                finished = []  # (job, result, error)
+                for future in done:
+                    job = running.pop(future)
+                    try:
+                        finished.append((job, future.result(), None))
+                    except Exception as e:
+                        finished.append((job, None, e))
+                if any(isinstance(error, BrokenProcessPool) for _, _, error in finished):
+                    # A pool process died; the others were lost with it
+                    lost = BrokenProcessPool("worker process pool was restarted")
+                    finished.extend((job, None, lost) for job in running.values())
+                    running.clear()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = ProcessPoolExecutor(concurrency, mp_context=context, initializer=_init_child)
+                for job, result, error in finished:
+                    if error is None:
+                        _finish(job, result)
+                    else:
+                        _fail(job, error)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                db_failures += 1
+                delay = min(config.JOB_POLL_INTERVAL * 2 ** (db_failures - 1), MAX_DB_BACKOFF)
+                log.warning("Worker %s lost the database; retrying in %.0fs", worker_name, delay, exc_info=True)
+                _close_quietly(conn)
+                conn = None
+                stop.wait(delay)
+    finally:
+        log.info("Worker %s stopping; waiting for %s running job(s)", worker_name, len(running))
+        pool.shutdown(wait=True)
+        for future, job in running.items():
+            try:
+                _finish(job, future.result())
+            except Exception as e:
+                try:
+                    _fail(job, e)
+                except psycopg2.Error:
+                    log.warning("Could not record the result of job %s", job["job_id"], exc_info=True)
+        _close_quietly(conn)
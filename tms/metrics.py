@@ -0,0 +1,432 @@
+# ==========================================================
+# --- PERFORMANCE METRICS ---
+# In-memory histograms and counters for this process, cheap enough
+# to leave on (an observation is a bisect and a few additions under
+# a lock). What is recorded:
+#
+#   tms_script_run_seconds{page,kind}   wall time of every script run
+#   tms_script_run_queries{page}        database statements per run
+#   tms_db_query_seconds{statement}     every cursor.execute (tms/db.py)
+#   tms_fs_scan_seconds{area}           directory scans
+#   tms_file_read_bytes_total{source}   file contents read by the app
+#   tms_sent_bytes_total{channel}       bytes sent to browsers
+#   tms_startup_seconds{mark}           when this process reached a
+#                                       startup milestone
+#   tms_startup_phase_seconds{phase}    how long each warm-up step took
+#
+# Script runs are timed by install(), which wraps the function
+# Streamlit executes page code with; bytes sent are counted by
+# SentBytesMiddleware (server.py). The Admin Panel's "Performance"
+# tab shows p50/p95/p99 from the histograms, and GET /tms/metrics
+# serves them in the Prometheus text format. export() hands the raw
+# figures to tms/instances.py, so the Admin Panel can merge those of
+# every server process with merged_snapshot().
+# ==========================================================
+
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import lru_cache
+
+from tms import config
+
+log = logging.getLogger(__name__)
+
+TIME_BUCKETS = tuple(0.0005 * 2 ** i for i in range(18))  # 0.5 ms .. 65 s
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+QUANTILES = (0.5, 0.95, 0.99)
+
+HISTOGRAMS = {
+    "tms_script_run_seconds": ("Wall time of Streamlit script runs.", TIME_BUCKETS),
+    "tms_script_run_queries": ("Database statements executed per script run.", COUNT_BUCKETS),
+    "tms_db_query_seconds": ("Latency of database statements.", TIME_BUCKETS),
+    "tms_fs_scan_seconds": ("Duration of directory scans.", TIME_BUCKETS),
+}
+COUNTERS = {
+    "tms_file_read_bytes_total": "Bytes of file contents read by the app.",
+    "tms_sent_bytes_total": "Bytes sent to browsers.",
+}
+
+
+class Histogram:
+    """Counts per bucket (upper bounds ``buckets`` plus +Inf), sum and count."""
+
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimate of the q-quantile, interpolated inside its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                if i == len(self.buckets):
+                    return lower  # +Inf bucket: the largest known bound
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> Histogram
+_counters = {}  # (name, labels) -> number
+_started = time.time()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def observe(name, value, **labels):
+    if not config.METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(HISTOGRAMS[name][1])
+        histogram.observe(value)
+
+
+def inc(name, amount=1, **labels):
+    if not config.METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+@contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def reset():
+    global _started
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _started = time.time()
+
+
+# ==========================================================
+# --- DATABASE STATEMENTS ---
+# Labelled by verb and first table ("SELECT files"), so the number
+# of series stays small whatever the parameters are.
+# ==========================================================
+_VERB = re.compile(r"[\s(]*(SELECT|INSERT\s+INTO|UPDATE|DELETE\s+FROM|WITH|[A-Z]+)(?:\s+(\w+))?", re.I)
+_FROM = re.compile(r"\bFROM\s+(\w+)", re.I)
+_run = threading.local()
+
+
+@lru_cache(maxsize=1024)
+def _statement_label(head):
+    match = _VERB.match(head)
+    if not match:
+        return "other"
+    verb = " ".join(match.group(1).upper().split())
+    if verb in ("SELECT", "WITH"):
+        table = _FROM.search(head)
+        return f"{verb} {table.group(1)}" if table else verb
+    if verb in ("INSERT INTO", "UPDATE", "DELETE FROM") and match.group(2):
+        return f"{verb.split()[0]} {match.group(2)}"
+    return verb
+
+
+def statement_label(query):
+    if isinstance(query, bytes):
+        query = query[:2000].decode("utf-8", "replace")  # execute_values: values inlined
+    elif not isinstance(query, str):
+        query = str(query)
+    return _statement_label(query[:2000])
+
+
+def query_done(query, seconds):
+    """Called by tms/db.py after every statement."""
+    if not config.METRICS_ENABLED:
+        return
+    observe("tms_db_query_seconds", seconds, statement=statement_label(query))
+    if getattr(_run, "queries", None) is not None:
+        _run.queries += 1
+
+
+# ==========================================================
+# --- STARTUP ---
+# Marks are seconds since the process started, so interpreter and
+# Streamlit start-up count too: "loaded" when server.py ran, "ready"
+# when warm-up finished and the server began accepting traffic,
+# "first_render" when the first script run finished. Phases are the
+# durations of the warm-up steps (tms/warmup.py). Neither is
+# cleared by reset().
+# ==========================================================
+def _process_started():
+    # Linux only: start time of this process from /proc, else now
+    try:
+        with open("/proc/self/stat") as f:
+            ticks = int(f.read().rpartition(")")[2].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+PROCESS_STARTED = _process_started()
+_startup_marks = {}  # mark -> seconds since PROCESS_STARTED
+_startup_phases = {}  # phase -> seconds
+
+
+def startup_mark(name):
+    """Record that the process reached ``name`` now (first time only)."""
+    with _lock:
+        _startup_marks.setdefault(name, time.time() - PROCESS_STARTED)
+
+
+@contextmanager
+def startup_phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _startup_phases[name] = time.perf_counter() - start
+
+
+# ==========================================================
+# --- SCRIPT RUNS ---
+# ==========================================================
+_installed = False
+_page_names = {}  # page script hash -> page name
+
+
+def _page_name(ctx):
+    page_hash = ctx.page_script_hash
+    name = _page_names.get(page_hash)
+    if name is None:
+        info = ctx.pages_manager.get_pages().get(page_hash) or {}
+        name = _page_names[page_hash] = info.get("page_name") or "app"
+    return name
+
+
+def install():
+    """Time every script run of this process (once; app.py and server.py).
+
+    Wraps Streamlit's internal exec_func_with_error_handling; if a
+    Streamlit release moves it, runs are simply not timed.
+    """
+    global _installed
+    if _installed or not config.METRICS_ENABLED:
+        return
+    try:
+        from streamlit.runtime.scriptrunner import script_runner
+        run_script = script_runner.exec_func_with_error_handling
+    except (ImportError, AttributeError):
+        log.warning("Script run timing unavailable in this Streamlit version")
+        return
+
+    def timed_run(func, ctx, *args, **kwargs):
+        _run.queries = 0
+        start = time.perf_counter()
+        try:
+            return run_script(func, ctx, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            queries, _run.queries = _run.queries, None
+            try:
+                page = _page_name(ctx)
+                kind = "fragment" if ctx.fragment_ids_this_run else "full"
+            except Exception:
+                page, kind = "unknown", "full"
+            observe("tms_script_run_seconds", elapsed, page=page, kind=kind)
+            observe("tms_script_run_queries", queries, page=page)
+            if "first_render" not in _startup_marks:
+                startup_mark("first_render")
+
+    script_runner.exec_func_with_error_handling = timed_run
+    _installed = True
+
+
+# ==========================================================
+# --- BYTES SENT ---
+# ==========================================================
+class SentBytesMiddleware:
+    """ASGI middleware counting response and websocket bytes (server.py)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "websocket":
+            channel = "websocket"
+        elif scope["type"] == "http":
+            channel = "files" if scope["path"].startswith("/tms/") else "http"
+        else:
+            return await self.app(scope, receive, send)
+
+        async def counting_send(message):
+            kind = message["type"]
+            if kind == "websocket.send":
+                size = len(message.get("bytes") or message.get("text") or b"")
+            elif kind == "http.response.body":
+                size = len(message.get("body", b""))
+            else:
+                size = 0
+            if size:
+                inc("tms_sent_bytes_total", size, channel=channel)
+            await send(message)
+
+        await self.app(scope, receive, counting_send)
+
+
+# ==========================================================
+# --- REPORTING ---
+# ==========================================================
+def _process_io():
+    # Linux only: bytes this process made the kernel fetch from storage
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return {"read": int(fields["read_bytes"]), "written": int(fields["write_bytes"])}
+    except (OSError, KeyError, ValueError):
+        return {}
+
+
+def _summaries(histograms, counters):
+    return {
+        "histograms": [
+            {
+                "metric": name,
+                **dict(labels),
+                "count": h.count,
+                "mean": h.sum / h.count if h.count else None,
+                **{f"p{round(q * 100)}": h.quantile(q) for q in QUANTILES},
+            }
+            for (name, labels), h in sorted(histograms.items())
+        ],
+        "counters": [
+            {"metric": name, **dict(labels), "value": value}
+            for (name, labels), value in sorted(counters.items())
+        ],
+    }
+
+
+def snapshot():
+    """Histogram summaries and counter values, for the Admin Panel."""
+    with _lock:
+        summaries = _summaries(_histograms, _counters)
+        startup = {"started": PROCESS_STARTED, "marks": dict(_startup_marks), "phases": dict(_startup_phases)}
+    return {"since": _started, **summaries, "startup": startup, "process_io": _process_io()}
+
+
+def export():
+    """This process's raw figures as JSON-ready data, for merged_snapshot()."""
+    with _lock:
+        return {
+            "since": _started,
+            "histograms": [
+                [name, [list(pair) for pair in labels], list(h.counts), h.count, h.sum]
+                for (name, labels), h in _histograms.items()
+            ],
+            "counters": [[name, [list(pair) for pair in labels], value] for (name, labels), value in _counters.items()],
+            "startup": {"marks": dict(_startup_marks)},
+        }
+
+
+def merged_snapshot(exports):
+    """snapshot()'s summaries over several processes' export() results.
+
+    Bucket counts add up, so the quantiles are those of all processes'
+    observations together, not an average of per-process quantiles.
+    """
+    histograms, counters = {}, {}
+    for data in exports:
+        for name, labels, counts, count, total in data.get("histograms", []):
+            if name not in HISTOGRAMS:  # reported by a different release
+                continue
+            key = (name, tuple(tuple(pair) for pair in labels))
+            h = histograms.get(key)
+            if h is None:
+                h = histograms[key] = Histogram(HISTOGRAMS[name][1])
+            if len(counts) != len(h.counts):
+                continue
+            h.counts = [a + b for a, b in zip(h.counts, counts)]
+            h.count += count
+            h.sum += total
+        for name, labels, value in data.get("counters", []):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+    since = min((data["since"] for data in exports if "since" in data), default=_started)
+    return {"since": since, **_summaries(histograms, counters)}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        histograms = {key: (list(h.counts), h.count, h.sum) for key, h in _histograms.items()}
+        counters = dict(_counters)
+        marks, phases = dict(_startup_marks), dict(_startup_phases)
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for (metric, labels), (counts, count, total) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, n in zip([*buckets, "+Inf"], counts):
+                cumulative += n
+                le = bound if bound == "+Inf" else f"{bound:g}"
+                lines.append(f"{name}_bucket{_labels_text([*labels, ('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{_labels_text(labels)} {total:g}")
+            lines.append(f"{name}_count{_labels_text(labels)} {count}")
+    for name, help_text in COUNTERS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{name}{_labels_text(labels)} {value}")
+    lines += ["# HELP tms_startup_seconds Seconds from process start until each startup milestone.",
+              "# TYPE tms_startup_seconds gauge"]
+    lines += [f"tms_startup_seconds{_labels_text([('mark', mark)])} {seconds:g}" for mark, seconds in marks.items()]
+    lines += ["# HELP tms_startup_phase_seconds Duration of each warm-up step.",
+              "# TYPE tms_startup_phase_seconds gauge"]
+    lines += [f"tms_startup_phase_seconds{_labels_text([('phase', phase)])} {seconds:g}"
+              for phase, seconds in phases.items()]
+    io = _process_io()
+    if io:
+        lines += ["# HELP tms_process_disk_read_bytes Bytes this process read from storage.",
+                  "# TYPE tms_process_disk_read_bytes counter",
+                  f"tms_process_disk_read_bytes {io['read']}",
+                  "# HELP tms_process_disk_write_bytes Bytes this process wrote to storage.",
+                  "# TYPE tms_process_disk_write_bytes counter",
+                  f"tms_process_disk_write_bytes {io['written']}"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,64 @@
+# ==========================================================
+# --- SCHEMA & DATA MIGRATIONS ---
+# Files in migrations/ are applied once each, in name order:
+#   NNN_description.sql  -> executed as-is
+#   NNN_description.py   -> must define upgrade(cur)
+# Applied names are recorded in the schema_migrations table.
+# ==========================================================
+
+import importlib.util
+from pathlib import Path
+
+from tms import db
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+
+
+def _available():
+    return sorted(
+        p for p in MIGRATIONS_DIR.iterdir()
+        if p.suffix in (".sql", ".py") and p.name[:3].isdigit()
+    )
+
+
+def _run(path, cur):
+    if path.suffix == ".sql":
+        cur.execute(path.read_text(encoding="utf-8"))
+        return
+    spec = importlib.util.spec_from_file_location(f"tms_migration_{path.stem}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.upgrade(cur)
+
+
+def apply_pending(log=print):
+    """Apply every migration that has not run yet; returns the names applied.
+
+    Each migration runs in its own transaction, so a failure leaves the
+    earlier ones in place and can simply be re-run after fixing.
+    """
+    with db.get_cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                name TEXT PRIMARY KEY,
+                applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+            );
+        """)
+        cur.execute("SELECT name FROM schema_migrations;")
+        done = {row[0] for row in cur.fetchall()}
+
+    applied = []
+    for path in _available():
+        if path.name in done:
+            continue
+        log(f"Applying {path.name} ...")
+        with db.get_cursor() as cur:
+            # Serialise concurrent deploys running the same migration
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext('tms_schema_migrations'));")
+            cur.execute("SELECT 1 FROM schema_migrations WHERE name=%s;", (path.name,))
+            if cur.fetchone():
+                continue
+            _run(path, cur)
+            cur.execute("INSERT INTO schema_migrations (name) VALUES (%s);", (path.name,))
+        applied.append(path.name)
+    return applied
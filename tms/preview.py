@@ -0,0 +1,204 @@
+# ==========================================================
+# --- PDF PREVIEW ---
+# Page-by-page preview: only the page being looked at is rendered
+# (with PyMuPDF) and sent to the browser as an image. Rendered
+# pages are kept in PREVIEW_CACHE_DIR keyed by the file's SHA-256
+# and page number (the hash stored in the index when the caller has
+# it). The worker trims the cache to PREVIEW_CACHE_MAX_MB, least
+# recently viewed documents first. When the file endpoints are
+# mounted the whole document can also be opened by URL, which the
+# browser's PDF viewer fetches with range requests.
+# ==========================================================
+
+import base64
+import contextlib
+import functools
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import streamlit as st
+
+from tms import config, metrics, storage, web
+
+
+@functools.cache
+def _pymupdf():
+    # Imported with the first preview rather than with every page that imports this module
+    try:
+        import pymupdf
+    except ImportError:  # optional: without it only the full-document view is offered
+        return None
+    return pymupdf
+
+
+@st.cache_data(show_spinner=False, max_entries=10000)
+def _sha256(path_str, mtime_ns, size):
+    # mtime/size are part of the cache key so an overwritten file is re-hashed
+    return storage.sha256_file(path_str)
+
+
+def file_sha256(path):
+    stat = Path(path).stat()
+    return _sha256(str(path), stat.st_mtime_ns, stat.st_size)
+
+
+class PreviewError(Exception):
+    """Raised for a PDF that PyMuPDF cannot read (corrupt, encrypted ...)."""
+
+
+def _cache_dir(sha):
+    return config.PREVIEW_CACHE_DIR / sha[:2] / sha
+
+
+def unreadable_marker(sha):
+    """Left in the cache for a document that failed to render, with the reason."""
+    return _cache_dir(sha) / "unreadable.txt"
+
+
+@contextlib.contextmanager
+def _reading(sha):
+    # PyMuPDF reports damaged files as RuntimeError (FileDataError) or its
+    # own FzErrorBase, encrypted ones as ValueError
+    marker = unreadable_marker(sha)
+    if marker.exists():
+        raise PreviewError(marker.read_text())
+    errors = (RuntimeError, ValueError, getattr(getattr(_pymupdf(), "mupdf", None), "FzErrorBase", RuntimeError))
+    try:
+        yield _pymupdf()
+    except errors as e:
+        _atomic_write(marker, str(e).encode())
+        raise PreviewError(str(e)) from e
+
+
+def page_count(path, sha):
+    marker = _cache_dir(sha) / "pages.txt"
+    if marker.exists():
+        # The marker's mtime is the document's last view (see prune_cache)
+        os.utime(marker)
+        return int(marker.read_text())
+    with _reading(sha) as pymupdf, pymupdf.open(path) as doc:
+        count = doc.page_count
+    _atomic_write(marker, str(count).encode())
+    return count
+
+
+def render_page(path, sha, page_number, dpi=None):
+    """Return the PNG path for one page (1-based), rendering it on a cache miss.
+
+    Raises PreviewError if the document cannot be rendered.
+    """
+    dpi = dpi or config.PREVIEW_DPI
+    target = _cache_dir(sha) / f"{page_number}@{dpi}.png"
+    if not target.exists():
+        with _reading(sha) as pymupdf, pymupdf.open(path) as doc:
+            pixmap = doc[page_number - 1].get_pixmap(dpi=dpi)
+            _atomic_write(target, pixmap.tobytes("png"))
+    return target
+
+
+def _atomic_write(target, data):
+    # Two viewers may render the same page at once; rename keeps it whole
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=target.parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, target)
+
+
+def prune_cache(max_mb=None):
+    """Remove the least recently viewed documents' pages until the cache fits ``max_mb``.
+
+    Returns the number of documents removed and the bytes freed.
+    """
+    limit = (config.PREVIEW_CACHE_MAX_MB if max_mb is None else max_mb) * 1024 * 1024
+    documents = []  # (last viewed, bytes, directory)
+    total = 0
+    for directory in config.PREVIEW_CACHE_DIR.glob("*/*"):
+        try:
+            stats = [entry.stat() for entry in os.scandir(directory) if entry.is_file()]
+        except OSError:  # removed meanwhile
+            continue
+        size = sum(stat.st_size for stat in stats)
+        documents.append((max((stat.st_mtime for stat in stats), default=0), size, directory))
+        total += size
+    removed = freed = 0
+    for _, size, directory in sorted(documents):
+        if total - freed <= limit:
+            break
+        shutil.rmtree(directory, ignore_errors=True)
+        removed += 1
+        freed += size
+    return {"documents": removed, "bytes": freed}
+
+
+def _embed_full_document(path, url, height):
+    if web.SERVED:
+        st.markdown(
+            f'<iframe src="{url}" width="100%" height="{height}px" style="border:none;"></iframe>',
+            unsafe_allow_html=True
+        )
+    else:
+        # No file endpoint: inline the document (slow for large files)
+        with open(path, "rb") as f:
+            data = f.read()
+        metrics.inc("tms_file_read_bytes_total", len(data), source="preview")
+        b64_pdf = base64.b64encode(data).decode("utf-8")
+        st.markdown(
+            f'<iframe src="data:application/pdf;base64,{b64_pdf}" width="100%" height="{height}px" style="border:none;"></iframe>',
+            unsafe_allow_html=True
+        )
+
+
+def pdf_preview(path, url, key, height=800, sha256=None):
+    """Preview a PDF. ``url`` is its inline file endpoint (see tms/web.py).
+
+    Pass the file's ``sha256`` from the index to spare hashing it here.
+    """
+    if _pymupdf() is None:
+        _embed_full_document(path, url, height)
+        return
+
+    mode = st.radio(
+        "Preview mode",
+        ["📄 Page by page", "📚 Full document"],
+        horizontal=True,
+        key=f"{key}_mode",
+        label_visibility="collapsed",
+    )
+    if mode == "📚 Full document":
+        _embed_full_document(path, url, height)
+        return
+
+    try:
+        sha = sha256 or file_sha256(path)
+        total = page_count(path, sha)
+    except PreviewError as e:
+        st.warning(f"⚠️ This PDF cannot be previewed ({e}). Try the full document view or download it.")
+        return
+    except Exception as e:
+        st.error(f"⚠️ Could not open PDF: {e}")
+        return
+    if total == 0:
+        st.info("This PDF has no pages.")
+        return
+
+    col1, col2 = st.columns([1, 5])
+    with col1:
+        page_number = st.number_input("Page", min_value=1, max_value=total, value=1, step=1, key=f"{key}_page")
+    with col2:
+        st.caption(f"Page {page_number} of {total}")
+    try:
+        image = render_page(path, sha, int(page_number))
+    except PreviewError as e:
+        st.warning(f"⚠️ Page {page_number} cannot be previewed ({e}). Try the full document view or download it.")
+        return
+    if web.SERVED:
+        # From the shared preview cache, so any server process can send it
+        st.markdown(
+            f'<img src="{web.preview_page_url(sha, page_number, config.PREVIEW_DPI)}" style="width:100%;">',
+            unsafe_allow_html=True
+        )
+    else:
+        st.image(str(image), use_container_width=True)
@@ -0,0 +1,153 @@
+# ==========================================================
+# --- QUERY RESULT CACHE ---
+# Read queries on the files and users tables are cached across
+# sessions, keyed by function, arguments and the current version of
+# every table they read. Triggers (migrations/007) bump a table's
+# version in the writing transaction and NOTIFY all processes, so a
+# write makes older entries unreachable everywhere.
+#
+# Each process keeps the versions in memory, kept current by one
+# LISTEN connection: an idle rerun is served without touching the
+# database. While that connection is down, versions are read from
+# the table_versions table on every call instead.
+# ==========================================================
+
+import functools
+import logging
+import select
+import threading
+import time
+
+import psycopg2
+import streamlit as st
+
+from tms import config, db
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "tms_table_versions"
+_PING_INTERVAL = 30  # seconds without traffic before checking the connection
+_RETRY_DELAY = 5
+
+_versions = {}
+_versions_lock = threading.Lock()
+_live = threading.Event()
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _update(rows):
+    # Versions only move forward; a late notification cannot undo a newer read
+    with _versions_lock:
+        for table, version in rows:
+            if version > _versions.get(table, -1):
+                _versions[table] = version
+
+
+# ==========================================================
+# --- LISTENER ---
+# ==========================================================
+def _listen_once():
+    conn = psycopg2.connect(**config.db_connect_kwargs())
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {CHANNEL};")
+            # Read after LISTEN so nothing committed in between is missed
+            cur.execute("SELECT table_name, version FROM table_versions;")
+            _update(cur.fetchall())
+        _live.set()
+        while True:
+            if select.select([conn], [], [], _PING_INTERVAL) == ([], [], []):
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1;")
+            conn.poll()
+            rows = []
+            for notify in conn.notifies:
+                table, _, version = notify.payload.rpartition(":")
+                if version.isdigit():
+                    rows.append((table, int(version)))
+            conn.notifies.clear()
+            _update(rows)
+    finally:
+        _live.clear()
+        conn.close()
+
+
+def _listen_forever():
+    while True:
+        try:
+            _listen_once()
+        except Exception:
+            log.warning("Query cache listener disconnected; retrying in %ss", _RETRY_DELAY, exc_info=True)
+        time.sleep(_RETRY_DELAY)
+
+
+def start_listener(wait=2):
+    """Start the LISTEN thread once per process.
+
+    The call that starts it waits up to ``wait`` seconds for the
+    connection, so the first reads can already skip the database.
+    """
+    global _listener
+    with _listener_lock:
+        if _listener is not None and _listener.is_alive():
+            return
+        _listener = threading.Thread(target=_listen_forever, name="tms-querycache", daemon=True)
+        _listener.start()
+    _live.wait(wait)
+
+
+# ==========================================================
+# --- VERSIONS ---
+# ==========================================================
+def _read_versions(cur, tables):
+    cur.execute(
+        "SELECT table_name, version FROM table_versions WHERE table_name = ANY(%s);",
+        (list(tables),)
+    )
+    _update(cur.fetchall())
+
+
+def versions(tables):
+    """Current version of each table, from memory when the listener is up."""
+    if not _live.is_set():
+        with db.get_cursor() as cur:
+            _read_versions(cur, tables)
+    with _versions_lock:
+        return tuple(_versions.get(table, 0) for table in tables)
+
+
+def written(*tables):
+    """Call after committing a write so this process sees it immediately.
+
+    Other processes learn about it from the NOTIFY sent on commit.
+    """
+    with db.get_cursor() as cur:
+        _read_versions(cur, tables)
+
+
+# ==========================================================
+# --- CACHE ---
+# ==========================================================
+@st.cache_data(show_spinner=False, max_entries=config.QUERY_CACHE_MAX_ENTRIES)
+def _call(_func, name, table_versions, args, kwargs):
+    return _func(*args, **kwargs)
+
+
+def cached(*tables):
+    """Cache a read function until any of ``tables`` changes.
+
+    The function must only read ``tables`` (and data that changes
+    with them); its arguments must be hashable by st.cache_data.
+    """
+    def decorate(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start_listener()
+            return _call(func, name, versions(tables), args, kwargs)
+        wrapper.uncached = func
+        return wrapper
+    return decorate
@@ -0,0 +1,238 @@
+# ==========================================================
+# --- DOCUMENT SEARCH ---
+# Text is extracted from uploaded PDF/DOCX/XLSX/TXT/CSV files into
+# the document_text table (migrations/004), whose GIN-indexed
+# tsvector column answers ranked full-text queries. The worker's
+# index_documents job (every SEARCH_INDEX_INTERVAL seconds, and
+# after uploads) re-extracts only documents whose fingerprint
+# (content hash, or size:mtime for legacy company files) has changed.
+# ==========================================================
+
+import functools
+import html
+import importlib
+import logging
+from pathlib import Path
+
+import psycopg2
+
+from tms import config, db
+
+log = logging.getLogger(__name__)
+
+
+@functools.cache
+def _library(name):
+    # Imported on first extraction: the pages import this module only to
+    # search and to request indexing, which need none of these
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+# Markers put around matches by ts_headline; replaced after HTML-escaping
+_HIT_START = "[[[tms-hit]]]"
+_HIT_STOP = "[[[/tms-hit]]]"
+_HEADLINE_OPTIONS = f"MaxFragments=2, MinWords=6, MaxWords=24, FragmentDelimiter=\" … \", StartSel={_HIT_START}, StopSel={_HIT_STOP}"
+
+
+# ==========================================================
+# --- TEXT EXTRACTION ---
+# ==========================================================
+def _pdf_text(path, limit):
+    parts, size = [], 0
+    with _library("pymupdf").open(path) as doc:
+        for page in doc:
+            text = page.get_text()
+            parts.append(text)
+            size += len(text)
+            if size >= limit:
+                break
+    return "\n".join(parts)
+
+
+def _docx_text(path, limit):
+    document = _library("docx").Document(path)
+    parts = [p.text for p in document.paragraphs]
+    for table in document.tables:
+        for row in table.rows:
+            parts.append(" ".join(cell.text for cell in row.cells))
+    return "\n".join(parts)
+
+
+def _xlsx_text(path, limit):
+    parts, size = [], 0
+    workbook = _library("openpyxl").load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            parts.append(sheet.title)
+            for row in sheet.iter_rows(values_only=True):
+                line = " ".join(str(value) for value in row if value is not None)
+                if line:
+                    parts.append(line)
+                    size += len(line)
+                if size >= limit:
+                    return "\n".join(parts)
+    finally:
+        workbook.close()
+    return "\n".join(parts)
+
+
+def _plain_text(path, limit):
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return f.read(limit)
+
+
+def _extractor_for(suffix):
+    if suffix == ".pdf" and _library("pymupdf"):
+        return _pdf_text
+    if suffix == ".docx" and _library("docx"):
+        return _docx_text
+    if suffix == ".xlsx" and _library("openpyxl"):
+        return _xlsx_text
+    if suffix in (".txt", ".csv"):
+        return _plain_text
+    return None
+
+
+def extract_text(path):
+    """Plain text of a document, or '' for unsupported/unreadable files."""
+    path = Path(path)
+    extractor = _extractor_for(path.suffix.lower())
+    if extractor is None:
+        return ""
+    limit = config.SEARCH_MAX_TEXT_CHARS
+    try:
+        text = extractor(path, limit)
+    except Exception:
+        log.warning("Could not extract text from %s", path, exc_info=True)
+        return ""
+    # PostgreSQL text values cannot contain NUL characters
+    return text[:limit].replace("\x00", " ")
+
+
+# ==========================================================
+# --- INDEXING ---
+# ==========================================================
+def _store(cur, key_column, key, title, fingerprint, body):
+    # A pass running at the same time may have stored it already
+    cur.execute(f"""
+        INSERT INTO document_text ({key_column}, title, fingerprint, body)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT ({key_column}) DO UPDATE
+        SET title = EXCLUDED.title,
+            fingerprint = EXCLUDED.fingerprint,
+            body = EXCLUDED.body,
+            indexed_at = NOW()
+        WHERE document_text.fingerprint IS DISTINCT FROM EXCLUDED.fingerprint;
+    """, (key, title, fingerprint, body))
+
+
+def _pending(cur):
+    """(key_column, key, title, fingerprint, path) of each document to (re)index."""
+    pending = []
+    # Project files: the index already knows each file's hash
+    cur.execute("""
+        SELECT pf.project_file_id, pf.file_name, pf.folder, p.name, pf.sha256
+        FROM project_files pf
+        JOIN projects p ON p.project_id = pf.project_id
+        LEFT JOIN document_text d ON d.project_file_id = pf.project_file_id
+        WHERE pf.sha256 IS NOT NULL AND d.fingerprint IS DISTINCT FROM pf.sha256
+          AND pf.deleted_at IS NULL AND p.deleted_at IS NULL;
+    """)
+    for project_file_id, file_name, folder, project_name, sha256 in cur.fetchall():
+        path = config.PROJECTS_DIR / project_name / folder / file_name
+        pending.append(("project_file_id", project_file_id, file_name, sha256, path))
+
+    # Company files: content hash, or size and mtime for rows stored
+    # before the blob store existed
+    cur.execute("""
+        SELECT f.file_id, f.file_name, f.file_path, f.sha256, d.fingerprint
+        FROM files f
+        LEFT JOIN document_text d ON d.file_id = f.file_id
+        WHERE f.deleted_at IS NULL AND (f.sha256 IS NULL OR d.fingerprint IS DISTINCT FROM f.sha256);
+    """)
+    for file_id, file_name, file_path, sha256, indexed_fingerprint in cur.fetchall():
+        if sha256:
+            fingerprint = sha256
+        else:
+            try:
+                stat = Path(file_path).stat()
+            except OSError:
+                continue
+            fingerprint = f"{stat.st_size}:{stat.st_mtime_ns}"
+            if fingerprint == indexed_fingerprint:
+                continue
+        pending.append(("file_id", file_id, file_name, fingerprint, file_path))
+    return pending
+
+
+def sync():
+    """Index new and changed documents; returns how many were (re)indexed.
+
+    Text is extracted outside any transaction and each document is
+    stored in a short one of its own, so a long pass holds no
+    connection or locks while it reads files.
+    """
+    with db.get_cursor() as cur:
+        pending = _pending(cur)
+    count = 0
+    for key_column, key, title, fingerprint, path in pending:
+        body = extract_text(path)
+        try:
+            with db.get_cursor() as cur:
+                _store(cur, key_column, key, title, fingerprint, body)
+        except psycopg2.errors.ForeignKeyViolation:
+            continue  # purged from the trash meanwhile
+        count += 1
+    return count
+
+
+# ==========================================================
+# --- QUERIES ---
+# ==========================================================
+def search(query, limit=20):
+    """Ranked matches for a web-style query ("quoted phrase", -exclude, or).
+
+    Snippets are HTML-escaped with matches wrapped in <mark>.
+    """
+    with db.get_cursor(dict_rows=True) as cur:
+        # Rank on the index first; headlines only for the rows returned
+        cur.execute("""
+            WITH q AS (SELECT websearch_to_tsquery('english', %s) AS query),
+            hits AS (
+                SELECT d.document_id, ts_rank_cd(d.tsv, q.query) AS rank
+                FROM document_text d
+                CROSS JOIN q
+                LEFT JOIN files f ON f.file_id = d.file_id
+                LEFT JOIN project_files pf ON pf.project_file_id = d.project_file_id
+                LEFT JOIN projects p ON p.project_id = pf.project_id
+                WHERE d.tsv @@ q.query
+                  -- nothing from the trash
+                  AND f.deleted_at IS NULL AND pf.deleted_at IS NULL AND p.deleted_at IS NULL
+                ORDER BY rank DESC
+                LIMIT %s
+            )
+            SELECT d.title, d.file_id, f.file_path, p.name AS project_name, pf.folder,
+                   ts_headline('english', d.body, q.query, %s) AS snippet
+            FROM hits
+            JOIN document_text d ON d.document_id = hits.document_id
+            CROSS JOIN q
+            LEFT JOIN files f ON f.file_id = d.file_id
+            LEFT JOIN project_files pf ON pf.project_file_id = d.project_file_id
+            LEFT JOIN projects p ON p.project_id = pf.project_id
+            ORDER BY hits.rank DESC;
+        """, (query, limit, _HEADLINE_OPTIONS))
+        rows = cur.fetchall()
+
+    results = []
+    for row in rows:
+        result = dict(row)
+        result["snippet"] = (
+            html.escape(row["snippet"] or "")
+            .replace(_HIT_START, "<mark>")
+            .replace(_HIT_STOP, "</mark>")
+        )
+        results.append(result)
+    return results
@@ -0,0 +1,130 @@
+# ==========================================================
+# --- SESSIONS ACROSS SERVER PROCESSES ---
+# st.session_state lives in the server process the browser's
+# websocket reached. When that process goes away (deploy, scale
+# down, crash) the browser reconnects, behind a load balancer
+# possibly to another process, and starts with an empty session.
+# sync() runs first thing in app.py and the pages that keep state
+# (or need a login) and rebuilds it from what all processes share:
+#
+#   sign-in   the login cookie, signed with TMS_COOKIE_KEY (the same
+#             cookie the file endpoints in tms/web.py accept)
+#   view      the VIEW_STATE keys, saved to the session_views table
+#             whenever they change and restored into a new session
+#             if younger than SESSION_RESUME_SECONDS
+#
+# Everything else (filters, widget values) starts fresh, as after a
+# page reload.
+# ==========================================================
+
+import json
+import logging
+from datetime import datetime
+
+import jwt
+import psycopg2
+import streamlit as st
+from psycopg2.extras import Json
+
+from tms import config, db, users
+
+log = logging.getLogger(__name__)
+
+# Session state worth carrying over, by the pages that set it
+VIEW_STATE = [
+    "preview_file_id",      # File Manager
+    "last_viewed_file_id",
+    "files_selected",       # a set of file_ids, saved as a list
+    "view_file_path",       # Projects
+    "view_project_name",
+    "expand_project",
+    "project_order",
+]
+_SETS = {"files_selected"}
+_RESTORED = "_tms_view_restored"
+_SAVED = "_tms_view_saved"
+
+
+def cookie_username(token):
+    """The username in a valid, unexpired login cookie, else None."""
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, config.COOKIE_KEY, algorithms=["HS256"])
+    except jwt.PyJWTError:
+        return None
+    if payload.get("exp_date", 0) <= datetime.now().timestamp():
+        return None
+    return payload.get("username")
+
+
+def _restore_login():
+    # After "Logout" the request's cookie header still holds the old cookie
+    if st.session_state.get("authentication_status") or st.session_state.get("logout"):
+        return
+    username = cookie_username(st.context.cookies.get(config.COOKIE_NAME))
+    if not username:
+        return
+    user = users.find_user(username)
+    if user is None:  # deleted since the cookie was issued
+        return
+    st.session_state["name"] = user["name"]
+    st.session_state["username"] = user["name"]
+    st.session_state["authentication_status"] = True
+    st.session_state["user_role"] = user.get("role", "user")
+
+
+def _snapshot():
+    state = {}
+    for key in VIEW_STATE:
+        if key in st.session_state:
+            value = st.session_state[key]
+            state[key] = sorted(value) if key in _SETS else value
+    return json.dumps(state, sort_keys=True, default=str)
+
+
+def _restore_view(username):
+    with db.get_cursor() as cur:
+        cur.execute("""
+            SELECT state FROM session_views
+            WHERE username = %s AND updated_at > NOW() - make_interval(secs => %s);
+        """, (username, config.SESSION_RESUME_SECONDS))
+        row = cur.fetchone()
+    if row:
+        for key, value in row[0].items():
+            if key in VIEW_STATE and key not in st.session_state:
+                st.session_state[key] = set(value) if key in _SETS else value
+    st.session_state[_SAVED] = _snapshot()
+
+
+def _save_view(username):
+    snapshot = _snapshot()
+    if snapshot == st.session_state.get(_SAVED):
+        return
+    with db.get_cursor() as cur:
+        cur.execute("""
+            INSERT INTO session_views (username, state, updated_at) VALUES (%s, %s, NOW())
+            ON CONFLICT (username) DO UPDATE SET state = EXCLUDED.state, updated_at = NOW();
+        """, (username, Json(json.loads(snapshot))))
+    st.session_state[_SAVED] = snapshot
+
+
+def sync():
+    """Restore a new session from the shared state, or save the view of an existing one.
+
+    Call before the page reads st.session_state. The view saved is the
+    one the previous run (and this run's callbacks) left behind.
+    """
+    try:
+        _restore_login()
+        username = st.session_state.get("username")
+        if not st.session_state.get("authentication_status") or not username:
+            return
+        if _RESTORED not in st.session_state:
+            st.session_state[_RESTORED] = True
+            _restore_view(username)
+        else:
+            _save_view(username)
+    except psycopg2.Error:
+        # The page itself reports database trouble
+        log.warning("Could not sync the session with the database", exc_info=True)
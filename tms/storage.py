@@ -0,0 +1,238 @@
+# ==========================================================
+# --- FILE STORAGE ---
+# Content-addressed blob store. Each distinct file content is kept
+# once as BLOB_DIR/ab/cd/<sha256>; the paths users see (uploads/...
+# and projects/<name>/<folder>/...) are hard links to that blob, so
+# existing readers keep working while duplicates cost no extra disk.
+#
+# References are the sha256 columns of the files and project_files
+# tables; rows in the trash still count until they are purged. A blob
+# is freed by release() once nothing refers to it.
+# Uploads are streamed into BLOB_DIR/.incoming first (stage()) and
+# only renamed into place when the database row is written.
+# All functions that take ``cur`` run inside the caller's transaction.
+# ==========================================================
+
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from tms import config, metrics
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_file(path):
+    """SHA-256 hex digest of a file, read in HASH_CHUNK_SIZE pieces."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            size += len(chunk)
+    metrics.inc("tms_file_read_bytes_total", size, source="hash")
+    return digest.hexdigest()
+
+
+def blob_path(sha256):
+    return config.BLOB_DIR / sha256[:2] / sha256[2:4] / sha256
+
+
+def _lock_blob(cur, sha256, size):
+    # Registers the blob if new; the row lock serialises store/release
+    # of the same content across sessions and processes.
+    cur.execute("""
+        INSERT INTO blobs (sha256, size_bytes) VALUES (%s, %s)
+        ON CONFLICT (sha256) DO UPDATE SET size_bytes = EXCLUDED.size_bytes;
+    """, (sha256, size))
+
+
+def _link(source, dest):
+    """Make ``dest`` a hard link to ``source``, atomically replacing it.
+
+    Falls back to a copy when the two paths are on different filesystems.
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix=".tms-link-")
+    os.close(fd)
+    os.unlink(tmp)
+    try:
+        os.link(source, tmp)
+    except OSError:
+        shutil.copyfile(source, tmp)
+    os.replace(tmp, dest)
+
+
+def _same_file(a, b):
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
+
+
+def _link_new(source, dest):
+    """Hard-link ``source`` to ``dest`` without ever replacing an existing file.
+
+    If the name is taken, " (1)", " (2)", ... is added before the suffix.
+    Returns the path actually created.
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    candidate, n = dest, 0
+    while True:
+        try:
+            try:
+                os.link(source, candidate)
+            except OSError as e:
+                if isinstance(e, FileExistsError):
+                    raise
+                # Different filesystem: copy beside the target, then link that
+                fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix=".tms-link-")
+                os.close(fd)
+                try:
+                    shutil.copyfile(source, tmp)
+                    os.link(tmp, candidate)
+                finally:
+                    os.unlink(tmp)
+            return candidate
+        except FileExistsError:
+            n += 1
+            candidate = dest.with_name(f"{dest.stem} ({n}){dest.suffix}")
+
+
+def move_new(source, dest):
+    """Move a file to ``dest`` without replacing an existing file.
+
+    Renamed like _link_new() if the name is taken; returns the path used.
+    """
+    path = _link_new(source, dest)
+    os.unlink(source)
+    return path
+
+
+# ==========================================================
+# --- UPLOAD INGEST ---
+# ==========================================================
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds the size limit for its file type."""
+
+
+def max_upload_bytes(file_name):
+    return config.UPLOAD_MAX_BYTES.get(Path(file_name).suffix.lower(), config.UPLOAD_MAX_BYTES_DEFAULT)
+
+
+class StagedFile:
+    """An upload copied chunk by chunk into the blob store's incoming area.
+
+    SHA-256 and size are computed while copying, so memory use is bounded
+    by UPLOAD_CHUNK_SIZE. Call commit() inside the database transaction
+    that records the file; leaving the ``with`` block with an exception
+    (including a failed commit) removes everything commit() created.
+    """
+
+    def __init__(self, source, max_bytes):
+        self.size = 0
+        self.sha256 = None
+        self.path = None  # final reference path, set by commit()
+        self._created = []
+        incoming = config.BLOB_DIR / ".incoming"
+        incoming.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=incoming)
+        self._tmp = Path(tmp)
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in iter(lambda: source.read(config.UPLOAD_CHUNK_SIZE), b""):
+                    self.size += len(chunk)
+                    if self.size > max_bytes:
+                        raise UploadTooLarge(
+                            f"File is larger than the {max_bytes // (1024 * 1024)} MB limit for this file type."
+                        )
+                    digest.update(chunk)
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            self._tmp.unlink(missing_ok=True)
+            raise
+        self.sha256 = digest.hexdigest()
+
+    def commit(self, cur, dest):
+        """Publish the content and link it at ``dest`` (renamed if taken)."""
+        _lock_blob(cur, self.sha256, self.size)
+        blob = blob_path(self.sha256)
+        if not blob.exists():
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self._tmp, blob)  # atomic: the blob is complete or absent
+            self._created.append(blob)
+        self.path = _link_new(blob, dest)
+        self._created.append(self.path)
+        return self.path
+
+    def discard(self):
+        """Remove everything commit() created, after its transaction rolled back."""
+        for path in reversed(self._created):
+            path.unlink(missing_ok=True)
+        self._created.clear()
+        self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._tmp.unlink(missing_ok=True)  # already renamed, or a known duplicate
+        if exc_type is not None:
+            self.discard()
+        return False
+
+
+def stage(source, file_name):
+    """Copy an uploaded file-like object to disk; see StagedFile."""
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return StagedFile(source, max_upload_bytes(file_name))
+
+
+def adopt(cur, path, sha256):
+    """Bring an existing file under the blob store (dedupe in place).
+
+    If the content is already stored, ``path`` is replaced by a link to
+    the blob; otherwise the file itself becomes the blob.
+    """
+    _lock_blob(cur, sha256, path.stat().st_size)
+    blob = blob_path(sha256)
+    if _same_file(blob, path):
+        return
+    if blob.exists():
+        _link(blob, path)
+    else:
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(path, blob)
+        except OSError:
+            shutil.copyfile(path, blob)
+
+
+def release(cur, sha256):
+    """Free the blob if no file or project file refers to it any more.
+
+    Call after deleting (or re-pointing) the referencing row.
+    """
+    if not sha256:
+        return False
+    cur.execute("SELECT 1 FROM blobs WHERE sha256 = %s FOR UPDATE;", (sha256,))
+    if not cur.fetchone():
+        return False
+    cur.execute("""
+        SELECT EXISTS (SELECT 1 FROM files WHERE sha256 = %s)
+            OR EXISTS (SELECT 1 FROM project_files WHERE sha256 = %s);
+    """, (sha256, sha256))
+    if cur.fetchone()[0]:
+        return False
+    cur.execute("DELETE FROM blobs WHERE sha256 = %s;", (sha256,))
+    # Readers use the reference links, so removing the store's own link
+    # before commit is safe: a rollback just means the next store()
+    # recreates it.
+    blob_path(sha256).unlink(missing_ok=True)
+    return True
@@ -0,0 +1,68 @@
+# ==========================================================
+# --- JOB KINDS ---
+# Functions run by the background worker (tms/jobs.py). Each takes
+# the job payload as keyword arguments and returns a JSON-able
+# result. They run in a separate process, so they must not touch
+# st.session_state or any other Streamlit runtime state.
+#
+# A kind registered with ``every`` is also enqueued by the workers
+# themselves once its last job is that many seconds old.
+# ==========================================================
+
+from tms import config
+
+HANDLERS = {}
+SCHEDULE = {}  # kind -> seconds between runs
+
+
+def task(kind, every=None):
+    def register(func):
+        HANDLERS[kind] = func
+        if every:
+            SCHEDULE[kind] = every
+        return func
+    return register
+
+
+def run(kind, payload):
+    try:
+        handler = HANDLERS[kind]
+    except KeyError:
+        raise ValueError(f"Unknown job kind: {kind}") from None
+    return handler(**payload)
+
+
+@task("purge_trash", every=config.TRASH_PURGE_INTERVAL)
+def purge_trash(retention_days=None):
+    from tms import trash
+    return trash.purge(retention_days)
+
+
+@task("index_documents", every=config.SEARCH_INDEX_INTERVAL)
+def index_documents():
+    from tms import search
+    return {"indexed": search.sync()}
+
+
+@task("check_storage", every=config.INTEGRITY_CHECK_INTERVAL)
+def check_storage():
+    from tms import integrity
+    return integrity.check()
+
+
+@task("scrub_files", every=config.SCRUB_INTERVAL)
+def scrub_files(max_files=None):
+    from tms import integrity
+    return integrity.scrub(max_files)
+
+
+@task("prune_previews", every=config.PREVIEW_PRUNE_INTERVAL)
+def prune_previews(max_mb=None):
+    from tms import preview
+    return preview.prune_cache(max_mb)
+
+
+@task("prune_jobs", every=config.JOB_PRUNE_INTERVAL)
+def prune_jobs(retention_days=None):
+    from tms import jobs
+    return {"deleted": jobs.prune(retention_days)}
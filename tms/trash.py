@@ -0,0 +1,248 @@
+# ==========================================================
+# --- TRASH ---
+# Deletes are soft (migrations/009): the row gets deleted_at and
+# its file or directory is moved to
+#
+#     TRASH_DIR/<kind>/<row id>/<name>
+#
+# with kind one of "projects", "project_files", "files". Live reads
+# filter on deleted_at IS NULL; trashed rows keep their blobs alive
+# until purge() removes them after TRASH_RETENTION_DAYS. Because the
+# trash path follows from the row id, recover() can put back whatever
+# a crash left moved but not marked, and drop what was purged but not
+# yet removed from disk.
+# ==========================================================
+
+import logging
+import os
+import shutil
+from datetime import timedelta
+from pathlib import Path
+
+from tms import config, db, storage
+
+log = logging.getLogger(__name__)
+
+KINDS = ["projects", "project_files", "files"]
+
+
+def path(kind, item_id, name):
+    return config.TRASH_DIR / kind / str(int(item_id)) / name
+
+
+def _move(source, dest):
+    if source.is_dir():
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if dest.exists():
+            raise FileExistsError(f"{dest} already exists")
+        return Path(shutil.move(source, dest))
+    return storage.move_new(source, dest)
+
+
+def _remove_empty(directory):
+    try:
+        directory.rmdir()
+    except OSError:
+        pass
+
+
+class Moves:
+    """Moves made inside a ``with`` block, undone if the block raises.
+
+    Enter it outside the db.get_cursor() block that marks the rows, so
+    a failed commit also puts the files back.
+    """
+
+    def __init__(self):
+        self._done = []
+
+    def __call__(self, source, dest):
+        """Move ``source`` to ``dest``; returns the path actually used."""
+        source = Path(source)
+        dest = _move(source, Path(dest))
+        self._done.append((source, dest))
+        if source.parent.parent.parent == config.TRASH_DIR:
+            _remove_empty(source.parent)  # restored: drop the emptied id directory
+        return dest
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            for source, dest in reversed(self._done):
+                try:
+                    _move(dest, source)
+                except OSError:
+                    log.exception("Could not move %s back to %s", dest, source)
+        return False
+
+
+# ==========================================================
+# --- ADMIN VIEW ---
+# ==========================================================
+def list_items():
+    """Everything in the trash, most recently deleted first.
+
+    Project files of a trashed project are listed with the project only.
+    """
+    with db.get_cursor(dict_rows=True) as cur:
+        cur.execute("""
+            SELECT 'projects' AS kind, project_id AS item_id, name, '' AS location, deleted_at, deleted_by
+            FROM projects WHERE deleted_at IS NOT NULL
+            UNION ALL
+            SELECT 'project_files', pf.project_file_id, pf.file_name, p.name || ' / ' || pf.folder,
+                   pf.deleted_at, pf.deleted_by
+            FROM project_files pf
+            JOIN projects p ON p.project_id = pf.project_id
+            WHERE pf.deleted_at IS NOT NULL AND p.deleted_at IS NULL
+            UNION ALL
+            SELECT 'files', file_id, file_name, '', deleted_at, deleted_by
+            FROM files WHERE deleted_at IS NOT NULL
+            ORDER BY deleted_at DESC;
+        """)
+        rows = [dict(row) for row in cur.fetchall()]
+    retention = timedelta(days=config.TRASH_RETENTION_DAYS)
+    for row in rows:
+        row["purge_after"] = row["deleted_at"] + retention
+    return rows
+
+
+# ==========================================================
+# --- PURGE (background worker) ---
+# ==========================================================
+def _purge_batch(cur, retention_seconds):
+    cutoff = "NOW() - make_interval(secs => %s)"
+    limit = config.TRASH_PURGE_BATCH_SIZE
+    cur.execute(f"""
+        SELECT project_id FROM projects WHERE deleted_at <= {cutoff}
+        ORDER BY project_id LIMIT %s FOR UPDATE SKIP LOCKED;
+    """, (retention_seconds, limit))
+    project_ids = [row[0] for row in cur.fetchall()]
+    cur.execute("SELECT sha256 FROM project_files WHERE project_id = ANY(%s::int[]);", (project_ids,))
+    shas = {row[0] for row in cur.fetchall()}
+    cur.execute("DELETE FROM projects WHERE project_id = ANY(%s::int[]);", (project_ids,))
+
+    cur.execute(f"""
+        DELETE FROM project_files WHERE project_file_id IN (
+            SELECT project_file_id FROM project_files WHERE deleted_at <= {cutoff}
+            ORDER BY project_file_id LIMIT %s FOR UPDATE SKIP LOCKED
+        ) RETURNING project_file_id, sha256;
+    """, (retention_seconds, limit))
+    project_file_ids = []
+    for project_file_id, sha256 in cur.fetchall():
+        project_file_ids.append(project_file_id)
+        shas.add(sha256)
+
+    cur.execute(f"""
+        DELETE FROM files WHERE file_id IN (
+            SELECT file_id FROM files WHERE deleted_at <= {cutoff}
+            ORDER BY file_id LIMIT %s FOR UPDATE SKIP LOCKED
+        ) RETURNING file_id, sha256;
+    """, (retention_seconds, limit))
+    file_ids = []
+    for file_id, sha256 in cur.fetchall():
+        file_ids.append(file_id)
+        shas.add(sha256)
+
+    for sha256 in sorted(filter(None, shas)):  # fixed lock order
+        storage.release(cur, sha256)
+    return {"projects": project_ids, "project_files": project_file_ids, "files": file_ids}
+
+
+def purge(retention_days=None):
+    """Permanently remove trash older than ``retention_days``.
+
+    Rows are deleted (and unused blobs released) TRASH_PURGE_BATCH_SIZE
+    at a time; their trash directories are removed after each commit.
+    Returns the number of items purged per kind.
+    """
+    if retention_days is None:
+        retention_days = config.TRASH_RETENTION_DAYS
+    retention_seconds = float(retention_days) * 86400
+    totals = dict.fromkeys(KINDS, 0)
+    while True:
+        with db.get_cursor() as cur:
+            purged = _purge_batch(cur, retention_seconds)
+        for kind, item_ids in purged.items():
+            totals[kind] += len(item_ids)
+            for item_id in item_ids:
+                shutil.rmtree(config.TRASH_DIR / kind / str(item_id), ignore_errors=True)
+        if not any(purged.values()):
+            break
+    recover()
+    return totals
+
+
+# ==========================================================
+# --- CRASH RECOVERY ---
+# ==========================================================
+def _live_location(cur, kind, item_id):
+    """(deleted, original path) for a trash entry's row, or None if the row is gone.
+
+    Locks the row, so a delete or restore still in progress is waited for.
+    """
+    if kind == "projects":
+        cur.execute("SELECT deleted_at IS NOT NULL, name FROM projects WHERE project_id = %s FOR UPDATE;", (item_id,))
+        row = cur.fetchone()
+        return row and (row[0], config.PROJECTS_DIR / row[1])
+    if kind == "project_files":
+        cur.execute("""
+            SELECT pf.deleted_at IS NOT NULL OR p.deleted_at IS NOT NULL, p.name, pf.folder, pf.file_name
+            FROM project_files pf JOIN projects p ON p.project_id = pf.project_id
+            WHERE pf.project_file_id = %s FOR UPDATE OF pf;
+        """, (item_id,))
+        row = cur.fetchone()
+        return row and (row[0], config.PROJECTS_DIR / row[1] / row[2] / row[3])
+    cur.execute("SELECT deleted_at IS NOT NULL, file_path FROM files WHERE file_id = %s FOR UPDATE;", (item_id,))
+    row = cur.fetchone()
+    return row and (row[0], Path(row[1]))
+
+
+_TRASHED = {
+    "projects": "SELECT project_id FROM projects WHERE project_id = ANY(%s) AND deleted_at IS NOT NULL;",
+    "project_files": """
+        SELECT pf.project_file_id FROM project_files pf JOIN projects p ON p.project_id = pf.project_id
+        WHERE pf.project_file_id = ANY(%s) AND (pf.deleted_at IS NOT NULL OR p.deleted_at IS NOT NULL);
+    """,
+    "files": "SELECT file_id FROM files WHERE file_id = ANY(%s) AND deleted_at IS NOT NULL;",
+}
+
+
+def recover():
+    """Reconcile TRASH_DIR with the rows after an interrupted delete or purge.
+
+    Entries whose row is live again are moved back; entries whose row is
+    gone are removed. Returns the number of entries fixed.
+    """
+    fixed = 0
+    for kind in KINDS:
+        kind_dir = config.TRASH_DIR / kind
+        if not kind_dir.is_dir():
+            continue
+        item_ids = [int(entry.name) for entry in os.scandir(kind_dir) if entry.name.isdigit()]
+        if not item_ids:
+            continue
+        with db.get_cursor() as cur:
+            cur.execute(_TRASHED[kind], (item_ids,))
+            suspect = set(item_ids) - {row[0] for row in cur.fetchall()}
+        for item_id in sorted(suspect):
+            item_dir = config.TRASH_DIR / kind / str(item_id)
+            with db.get_cursor() as cur:
+                location = _live_location(cur, kind, item_id)
+                if location and location[0]:
+                    continue  # its delete committed while we looked
+                if not item_dir.exists():
+                    continue  # restored while we looked
+                try:
+                    if location:
+                        for child in list(item_dir.iterdir()):
+                            log.warning("Restoring %s left in the trash by an interrupted delete", child)
+                            _move(child, location[1])
+                        _remove_empty(item_dir)
+                    else:
+                        shutil.rmtree(item_dir)
+                    fixed += 1
+                except OSError:
+                    log.exception("Could not recover trash entry %s", item_dir)
+    return fixed
@@ -0,0 +1,109 @@
+# ==========================================================
+# --- STORAGE USAGE ---
+# Reads for the Admin Panel's usage dashboard. The numbers come from
+# summary tables kept up to date by triggers (migrations/011), so
+# each read touches a handful of rows however many files there are.
+# "Logical" bytes count every file row, trashed ones included until
+# they are purged; "on disk" bytes count each blob once.
+# ==========================================================
+
+from tms import db
+
+DIMENSIONS = ["area", "folder", "type", "uploader"]
+
+
+def format_bytes(size):
+    size = float(size or 0)
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if abs(size) < 1024 or unit == "TB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def totals():
+    """Logical and on-disk totals, dedupe savings and the size of the trash."""
+    with db.get_cursor() as cur:
+        cur.execute("""
+            SELECT dimension, key, file_count, total_bytes FROM storage_usage
+            WHERE dimension IN ('area', 'store');
+        """)
+        rows = {(dimension, key): (count, size) for dimension, key, count, size in cur.fetchall()}
+        # Trashed rows are few and indexed (migrations/009)
+        cur.execute("""
+            SELECT COALESCE(SUM(n), 0), COALESCE(SUM(size), 0) FROM (
+                SELECT SUM(u.file_count) AS n, SUM(u.total_bytes) AS size
+                FROM project_usage u JOIN projects p ON p.project_id = u.project_id
+                WHERE p.deleted_at IS NOT NULL
+                UNION ALL
+                SELECT COUNT(*), SUM(pf.size_bytes)
+                FROM project_files pf JOIN projects p ON p.project_id = pf.project_id
+                WHERE pf.deleted_at IS NOT NULL AND p.deleted_at IS NULL
+                UNION ALL
+                SELECT COUNT(*), SUM(size_bytes) FROM files WHERE deleted_at IS NOT NULL
+            ) trashed;
+        """)
+        trash_files, trash_bytes = cur.fetchone()
+
+    company = rows.get(("area", "company"), (0, 0))
+    projects = rows.get(("area", "projects"), (0, 0))
+    blobs = rows.get(("store", "blobs"), (0, 0))
+    logical = company[1] + projects[1]
+    return {
+        "files": company[0] + projects[0],
+        "logical_bytes": logical,
+        "company_bytes": company[1],
+        "project_bytes": projects[1],
+        "blobs": blobs[0],
+        "disk_bytes": blobs[1],
+        "dedupe_savings": max(logical - blobs[1], 0),
+        "trash_files": int(trash_files),
+        "trash_bytes": int(trash_bytes),
+    }
+
+
+def by_dimension(dimension, limit=20):
+    """Largest keys of one dimension (see DIMENSIONS), biggest first."""
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Unknown usage dimension {dimension!r}")
+    with db.get_cursor(dict_rows=True) as cur:
+        cur.execute("""
+            SELECT key, file_count, total_bytes FROM storage_usage
+            WHERE dimension = %s AND file_count > 0
+            ORDER BY total_bytes DESC, key
+            LIMIT %s;
+        """, (dimension, limit))
+        return [dict(row) for row in cur.fetchall()]
+
+
+def by_project(limit=20):
+    """Largest live projects with their bytes per folder."""
+    with db.get_cursor(dict_rows=True) as cur:
+        cur.execute("""
+            SELECT p.name AS project,
+                   SUM(u.file_count)::bigint AS file_count,
+                   SUM(u.total_bytes)::bigint AS total_bytes,
+                   jsonb_object_agg(u.folder, u.total_bytes) AS folders
+            FROM project_usage u
+            JOIN projects p ON p.project_id = u.project_id
+            WHERE p.deleted_at IS NULL
+            GROUP BY p.name
+            HAVING SUM(u.file_count) > 0
+            ORDER BY SUM(u.total_bytes) DESC, p.name
+            LIMIT %s;
+        """, (limit,))
+        return [dict(row) for row in cur.fetchall()]
+
+
+def growth(days=90):
+    """Cumulative bytes per day and area over the last ``days`` days."""
+    with db.get_cursor(dict_rows=True) as cur:
+        cur.execute("""
+            SELECT day, area, total_bytes FROM (
+                SELECT day, area,
+                       SUM(byte_delta) OVER (PARTITION BY area ORDER BY day)::bigint AS total_bytes
+                FROM storage_usage_daily
+            ) running
+            WHERE day > CURRENT_DATE - %s
+            ORDER BY day, area;
+        """, (days,))
+        return [dict(row) for row in cur.fetchall()]
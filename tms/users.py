@@ -0,0 +1,234 @@
+# ==========================================================
+# --- USER ACCOUNTS & LOGIN CREDENTIALS ---
+# Reads of the users table are cached and shared by every session
+# until the table changes (tms/querycache.py). Anything that writes
+# to it should call invalidate_credentials() after committing, so
+# this process sees the change at once.
+# ==========================================================
+
+import csv
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+from psycopg2.extras import execute_values
+
+from tms import config, db, querycache
+
+ROLES = ["user", "admin"]
+
+
+def is_bcrypt_hash(value):
+    return bool(value) and value.startswith("$2")
+
+
+def hash_password(plain_password):
+    """bcrypt hash at BCRYPT_ROUNDS; pages should go through tms/auth.py."""
+    return bcrypt.hashpw(plain_password.encode("utf-8"), bcrypt.gensalt(rounds=config.BCRYPT_ROUNDS)).decode("utf-8")
+
+
+def password_too_long(plain_password):
+    # bcrypt only uses (and the bcrypt package only accepts) 72 bytes
+    return len(plain_password.encode("utf-8")) > 72
+
+
+def hash_plaintext_passwords(cur):
+    """Hash every plain-text password_hash in place and return how many were fixed.
+
+    Runs inside the caller's transaction; rows are locked so two processes
+    doing this at the same time cannot hash the same password twice.
+    """
+    cur.execute("""
+        SELECT user_id, password_hash
+        FROM users
+        WHERE password_hash IS NOT NULL
+          AND password_hash <> ''
+          AND password_hash NOT LIKE '$2%'
+        FOR UPDATE;
+    """)
+    rows = cur.fetchall()
+    for user_id, plain_password in rows:
+        cur.execute(
+            "UPDATE users SET password_hash=%s WHERE user_id=%s;",
+            (hash_password(plain_password), user_id)
+        )
+    return len(rows)
+
+
+@querycache.cached("users")
+def load_credentials():
+    """Return the users table in streamlit-authenticator format.
+
+    Cached across sessions until the users table changes. If any
+    plain-text passwords are still in the table they are hashed and written
+    back once here, so later loads never pay for bcrypt.
+    """
+    with db.get_cursor(dict_rows=True) as cur:
+        cur.execute("SELECT username, password_hash, role FROM users;")
+        rows = cur.fetchall()
+        if any(not is_bcrypt_hash(row["password_hash"]) and row["password_hash"] for row in rows):
+            hash_plaintext_passwords(cur)
+            cur.execute("SELECT username, password_hash, role FROM users;")
+            rows = cur.fetchall()
+
+    credentials = {"usernames": {}}
+    for row in rows:
+        username = row["username"]
+        password = row["password_hash"] or ""
+        if not username or not is_bcrypt_hash(password):
+            continue
+        credentials["usernames"][username] = {
+            "name": username,  # fallback, since the table has no separate name column
+            "password": password,
+            "role": row["role"] or "user",
+        }
+    return credentials
+
+
+@querycache.cached("users")
+def _stored_usernames():
+    # lower-cased username -> username as stored (unique, migrations/013)
+    return {username.lower(): username for username in load_credentials()["usernames"]}
+
+
+def find_user(username):
+    """The credentials entry of ``username`` typed in any letter case, or None.
+
+    Its "name" is the username as stored.
+    """
+    stored = _stored_usernames().get((username or "").strip().lower())
+    if stored is None:
+        return None
+    return load_credentials()["usernames"].get(stored)
+
+
+@querycache.cached("users")
+def list_users():
+    """user_id, username, role and created_at of every user (Admin Panel)."""
+    with db.get_cursor(dict_rows=True) as cur:
+        cur.execute("SELECT user_id, username, role, created_at FROM users ORDER BY user_id;")
+        return cur.fetchall()
+
+
+def invalidate_credentials():
+    """Make this process's cached user reads reflect an add/update/delete."""
+    querycache.written("users")
+
+
+# ==========================================================
+# --- CSV IMPORT / EXPORT ---
+# Columns: username, password, role. A blank password keeps an
+# existing user's password (so an export can be edited and imported
+# again); a value starting with "$2" is taken as a bcrypt hash.
+# ==========================================================
+EXPORT_COLUMNS = ["user_id", "username", "role", "created_at"]
+
+
+def parse_csv(source):
+    """Validate a users CSV from a binary file object.
+
+    Returns (rows, failures): rows as {"line", "username", "password",
+    "role"} dicts, failures as (line, username, reason). Later rows for
+    a username already in the file are rejected.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(source, encoding="utf-8-sig", newline=""))
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+    if "username" not in reader.fieldnames:
+        return [], [(1, "", "the header row must have a username column")]
+
+    rows, failures, seen = [], [], set()
+    for record in reader:
+        line = reader.line_num
+        username = (record.get("username") or "").strip()
+        password = record.get("password") or ""
+        role = (record.get("role") or "").strip().lower() or "user"
+        if len(rows) >= config.USER_IMPORT_MAX_ROWS:
+            failures.append((line, username, f"more than {config.USER_IMPORT_MAX_ROWS} rows"))
+        elif not username:
+            failures.append((line, username, "username is empty"))
+        elif username.lower() in seen:
+            failures.append((line, username, "username appears earlier in the file"))
+        elif role not in ROLES:
+            failures.append((line, username, f"role must be one of {', '.join(ROLES)}"))
+        elif not is_bcrypt_hash(password) and password_too_long(password):
+            failures.append((line, username, "password is longer than 72 bytes"))
+        else:
+            seen.add(username.lower())
+            rows.append({"line": line, "username": username, "password": password, "role": role})
+    return rows, failures
+
+
+def _hash_all(passwords):
+    # One bcrypt hash per password, spread over a process pool; not
+    # worth starting one for a couple of passwords
+    workers = max(1, min(config.USER_IMPORT_WORKERS, len(passwords)))
+    if workers == 1:
+        return [hash_password(password) for password in passwords]
+    context = multiprocessing.get_context("spawn")  # the server process has threads
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        return list(pool.map(hash_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+def import_users(rows):
+    """Create or update the users in ``rows`` (from parse_csv) in one transaction.
+
+    Returns {"created": n, "updated": n, "failures": [(line, username, reason)]}.
+    """
+    failures = []
+    with db.get_cursor() as cur:
+        # Usernames are unique regardless of case (migrations/013)
+        cur.execute("SELECT lower(username) FROM users WHERE lower(username) = ANY(%s);",
+                    ([row["username"].lower() for row in rows],))
+        existing = {row[0] for row in cur.fetchall()}
+    accepted = []
+    for row in rows:
+        if not row["password"] and row["username"].lower() not in existing:
+            failures.append((row["line"], row["username"], "a new user needs a password"))
+        else:
+            accepted.append(row)
+
+    to_hash = [row for row in accepted if row["password"] and not is_bcrypt_hash(row["password"])]
+    for row, hashed in zip(to_hash, _hash_all([row["password"] for row in to_hash])):
+        row["password"] = hashed
+
+    created = updated = 0
+    if accepted:
+        with db.get_cursor() as cur:
+            results = execute_values(cur, """
+                INSERT INTO users (username, password_hash, role) VALUES %s
+                ON CONFLICT ((lower(username))) DO UPDATE
+                SET password_hash = COALESCE(EXCLUDED.password_hash, users.password_hash),
+                    role = EXCLUDED.role
+                RETURNING xmax = 0;
+            """, [(row["username"], row["password"] or None, row["role"]) for row in accepted],
+                page_size=len(accepted), fetch=True)
+        created = sum(1 for (inserted,) in results if inserted)
+        updated = len(results) - created
+        invalidate_credentials()
+    return {"created": created, "updated": updated, "failures": failures}
+
+
+def iter_csv():
+    """Yield the users table as CSV (EXPORT_COLUMNS), encoded, a batch at a time.
+
+    Rows come from a server-side cursor, so memory use does not grow
+    with the number of users. Password hashes are not exported.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    with db.get_connection() as conn, conn.cursor(name="tms_users_export") as cur:
+        cur.itersize = config.USER_EXPORT_FETCH_SIZE
+        cur.execute(f"SELECT {', '.join(EXPORT_COLUMNS)} FROM users ORDER BY user_id;")
+        while True:
+            rows = cur.fetchmany(config.USER_EXPORT_FETCH_SIZE)
+            for user_id, username, role, created_at in rows:
+                writer.writerow([user_id, username, role, created_at and created_at.isoformat(sep=" ", timespec="seconds")])
+            data = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            if data:
+                yield data.encode("utf-8")
+            if not rows:
+                break
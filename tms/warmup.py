@@ -0,0 +1,130 @@
+# ==========================================================
+# --- WARM-UP ---
+# Work every server process does once, done before it accepts
+# traffic (server.py runs warm_up() from the app's lifespan) instead
+# of inside the first visitor's page load after a deploy:
+#
+#   imports    libraries the first script runs import, including the
+#              ones Streamlit pulls in on first use (pandas/pyarrow
+#              when a component or dataframe is marshalled)
+#   database   the connection pool and the query cache listener
+#   index      the project index's first full pass (tms/catalog.py)
+#   scripts    app.py and pages/ compiled into Streamlit's cache
+#   caches     the users table and the File Manager's first page
+#
+# Libraries only some actions need (PyMuPDF, python-docx, openpyxl)
+# are imported by tms/preview.py and tms/search.py on first use.
+# Each step is timed as a startup phase (tms/metrics.py); one that
+# fails is logged and skipped, so an unreachable database still
+# leaves a server that starts and shows the pages' own errors.
+# ==========================================================
+
+import asyncio
+import importlib
+import logging
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from tms import catalog, config, db, files, instances, metrics, querycache, users
+
+log = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Imported by app.py and the pages, beyond what this module imports
+MODULES = [
+    "streamlit_authenticator",
+    "pandas",
+    "pyarrow",
+    "tms.auth",
+    "tms.bulk",
+    "tms.downloads",
+    "tms.export",
+    "tms.integrity",
+    "tms.jobs",
+    "tms.preview",
+    "tms.search",
+    "tms.trash",
+    "tms.usage",
+]
+
+
+def _imports():
+    for name in MODULES:
+        with metrics.startup_phase(f"import {name}"):
+            importlib.import_module(name)
+    # st.set_page_config(page_icon=...) checks the icon against a large
+    # emoji pattern that is imported and compiled on first use
+    try:
+        from streamlit import string_util
+        string_util.is_emoji("🔥")
+    except (ImportError, AttributeError):
+        pass
+
+
+def _database():
+    with db.get_cursor() as cur:
+        cur.execute("SELECT 1;")
+    querycache.start_listener(wait=config.WARMUP_TIMEOUT)
+
+
+def _index():
+    catalog.start_watcher(wait=config.WARMUP_TIMEOUT)
+
+
+def _scripts():
+    # Streamlit compiles a page the first time anyone opens it; like
+    # metrics.install(), this leans on an internal and skips quietly
+    # if a Streamlit release moves it
+    from streamlit.runtime import Runtime
+
+    if not Runtime.exists():  # not under a server (bench, AppTest)
+        return
+    script_cache = getattr(Runtime.instance(), "_script_cache", None)
+    if script_cache is None:
+        return
+    for path in [ROOT / "app.py", *sorted((ROOT / "pages").glob("*.py"))]:
+        script_cache.get_bytecode(str(path))
+
+
+def _caches():
+    users.load_credentials()
+    # Same arguments as the File Manager's unfiltered first page
+    files.list_files(files.PAGE_SIZES[0], after=None, name="", uploader="", date_from=None, date_to=None)
+
+
+STEPS = [
+    ("imports", _imports),
+    ("database", _database),
+    ("index", _index),
+    ("scripts", _scripts),
+    ("caches", _caches),
+]
+
+
+def warm_up():
+    """Run every step; returns the names of the steps that failed."""
+    failed = []
+    for name, step in STEPS:
+        try:
+            with metrics.startup_phase(name):
+                step()
+        except Exception:
+            log.warning("Warm-up step %s failed", name, exc_info=True)
+            failed.append(name)
+    return failed
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """st.App lifespan: warm up and register before serving; deregister and close the pool on shutdown."""
+    if config.WARMUP_ENABLED:
+        with metrics.startup_phase("warm_up"):
+            await asyncio.to_thread(warm_up)
+    metrics.startup_mark("ready")
+    instances.start()
+    try:
+        yield
+    finally:
+        await asyncio.to_thread(instances.deregister)
+        db.close_pool()
@@ -0,0 +1,218 @@
+# ==========================================================
+# --- FILE ENDPOINTS ---
+# HTTP routes mounted next to the Streamlit app by server.py.
+# Files are streamed from disk in DOWNLOAD_CHUNK_SIZE pieces
+# (with HTTP range support) instead of being pushed through the
+# websocket, and only when the browser actually requests them.
+# Every route requires the signed login cookie set by app.py, of a
+# user that still exists.
+# Nothing here is kept in the process, so with several server
+# processes any of them can answer any of these requests.
+# ==========================================================
+
+import hmac
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from tms import catalog, config, db, export, metrics, preview, sessions, users
+
+# True once server.py has mounted these routes in this process. When the
+# app is started with plain `streamlit run app.py` the pages fall back to
+# Streamlit's own (in-memory) download button.
+SERVED = False
+
+
+# ==========================================================
+# --- URL BUILDERS (used by the pages) ---
+# Relative URLs so they keep working behind a path prefix.
+# ==========================================================
+def company_file_url(file_id, inline=False):
+    return f"tms/files/{int(file_id)}" + ("?inline=1" if inline else "")
+
+
+def project_file_url(project_name, folder, file_name, inline=False):
+    url = f"tms/projects/{quote(project_name, safe='')}/{quote(folder, safe='')}/{quote(file_name, safe='')}"
+    return url + ("?inline=1" if inline else "")
+
+
+def project_export_url(project_name):
+    return f"tms/export/project/{quote(project_name, safe='')}"
+
+
+def files_export_url(file_ids):
+    return "tms/export/files?ids=" + ",".join(str(int(file_id)) for file_id in file_ids)
+
+
+def users_export_url():
+    return "tms/export/users.csv"
+
+
+def preview_page_url(sha, page_number, dpi):
+    return f"tms/preview/{sha}/{int(page_number)}@{int(dpi)}.png"
+
+
+# ==========================================================
+# --- REQUEST HELPERS ---
+# ==========================================================
+class _ChunkedFileResponse(FileResponse):
+    chunk_size = config.DOWNLOAD_CHUNK_SIZE
+
+
+def _cookie_user(token):
+    # Only users that still exist: a cookie outlives a deleted account
+    username = sessions.cookie_username(token)
+    return users.find_user(username) if username else None
+
+
+async def _logged_in_user(request):
+    """The credentials entry of the user whose login cookie came with ``request``, or None."""
+    token = request.cookies.get(config.COOKIE_NAME)
+    if not token:
+        return None
+    return await run_in_threadpool(_cookie_user, token)
+
+
+def _send_file(request, path, file_name):
+    disposition = "inline" if request.query_params.get("inline") else "attachment"
+    return _ChunkedFileResponse(
+        path,
+        filename=file_name,
+        content_disposition_type=disposition,
+    )
+
+
+def _send_zip(entries, file_name):
+    # Sync generator: Starlette iterates it in a worker thread
+    return StreamingResponse(
+        export.iter_zip(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename*=utf-8''{quote(file_name)}"},
+    )
+
+
+def _inside(path, root):
+    try:
+        path.resolve().relative_to(root.resolve())
+        return True
+    except ValueError:
+        return False
+
+
+def _lookup_company_file(file_id):
+    with db.get_cursor(dict_rows=True) as cur:
+        cur.execute("SELECT file_name, file_path FROM files WHERE file_id=%s AND deleted_at IS NULL;", (file_id,))
+        return cur.fetchone()
+
+
+# ==========================================================
+# --- ROUTES ---
+# ==========================================================
+async def company_file(request):
+    if not await _logged_in_user(request):
+        return PlainTextResponse("Please log in first.", status_code=401)
+    row = await run_in_threadpool(_lookup_company_file, request.path_params["file_id"])
+    if not row:
+        return PlainTextResponse("File not found.", status_code=404)
+    path = Path(row["file_path"])
+    if not _inside(path, config.UPLOAD_DIR) or not path.is_file():
+        return PlainTextResponse("File missing on disk.", status_code=404)
+    return _send_file(request, path, row["file_name"])
+
+
+async def project_file(request):
+    if not await _logged_in_user(request):
+        return PlainTextResponse("Please log in first.", status_code=401)
+    folder = request.path_params["folder"]
+    if folder not in config.PROJECT_FOLDERS:
+        return PlainTextResponse("File not found.", status_code=404)
+    path = config.PROJECTS_DIR / request.path_params["project"] / folder / request.path_params["name"]
+    if not _inside(path, config.PROJECTS_DIR) or not path.is_file():
+        return PlainTextResponse("File not found.", status_code=404)
+    return _send_file(request, path, path.name)
+
+
+async def preview_page(request):
+    # A page image rendered by tms/preview.py into the shared preview
+    # cache; named by content hash, so it never changes
+    if not await _logged_in_user(request):
+        return PlainTextResponse("Please log in first.", status_code=401)
+    sha, name = request.path_params["sha"], request.path_params["name"]
+    if not re.fullmatch(r"[0-9a-f]{64}", sha) or not re.fullmatch(r"\d+@\d+\.png", name):
+        return PlainTextResponse("Page not found.", status_code=404)
+    path = config.PREVIEW_CACHE_DIR / sha[:2] / sha / name
+    if not path.is_file():
+        if preview.unreadable_marker(sha).is_file():
+            return PlainTextResponse("This PDF cannot be previewed.", status_code=422)
+        return PlainTextResponse("Page not found.", status_code=404)
+    return FileResponse(path, media_type="image/png",
+                        headers={"Cache-Control": "private, max-age=31536000, immutable"})
+
+
+async def project_export(request):
+    if not await _logged_in_user(request):
+        return PlainTextResponse("Please log in first.", status_code=401)
+    project_name = request.path_params["project"]
+    if not catalog.valid_project_name(project_name):
+        return PlainTextResponse("Project not found.", status_code=404)
+    entries = await run_in_threadpool(export.project_entries, project_name)
+    entries = [(name, path) for name, path in entries if _inside(path, config.PROJECTS_DIR)]
+    if not entries:
+        return PlainTextResponse("Project not found or empty.", status_code=404)
+    return _send_zip(entries, f"{project_name}.zip")
+
+
+async def files_export(request):
+    if not await _logged_in_user(request):
+        return PlainTextResponse("Please log in first.", status_code=401)
+    try:
+        file_ids = [int(part) for part in request.query_params.get("ids", "").split(",") if part]
+    except ValueError:
+        return PlainTextResponse("Invalid file selection.", status_code=400)
+    entries = await run_in_threadpool(export.company_file_entries, file_ids) if file_ids else []
+    entries = [(name, path) for name, path in entries if _inside(path, config.UPLOAD_DIR)]
+    if not entries:
+        return PlainTextResponse("No files found.", status_code=404)
+    return _send_zip(entries, "files.zip")
+
+
+async def users_export(request):
+    user = await _logged_in_user(request)
+    if not user:
+        return PlainTextResponse("Please log in first.", status_code=401)
+    if user["role"] != "admin":
+        return PlainTextResponse("Admins only.", status_code=403)
+    return StreamingResponse(
+        users.iter_csv(),
+        media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=users.csv"},
+    )
+
+
+async def metrics_dump(request):
+    # Prometheus scrapes with the token; admins can open it in the browser
+    token = config.METRICS_TOKEN
+    if not (token and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}")):
+        user = await _logged_in_user(request)
+        if not user or user["role"] != "admin":
+            return PlainTextResponse("Not authorized.", status_code=401)
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+def routes():
+    """Routes for st.App(...); marks the endpoints as available."""
+    global SERVED
+    SERVED = True
+    return [
+        Route("/tms/files/{file_id:int}", company_file, methods=["GET", "HEAD"]),
+        Route("/tms/projects/{project}/{folder}/{name}", project_file, methods=["GET", "HEAD"]),
+        Route("/tms/preview/{sha}/{name}", preview_page, methods=["GET", "HEAD"]),
+        Route("/tms/export/project/{project}", project_export, methods=["GET"]),
+        Route("/tms/export/files", files_export, methods=["GET"]),
+        Route("/tms/export/users.csv", users_export, methods=["GET"]),
+        Route("/tms/metrics", metrics_dump, methods=["GET"]),
+    ]
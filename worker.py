@@ -0,0 +1,19 @@
+# ==========================================================
+# Thermoteq Management System (TMS)
+# Background job worker: runs queued jobs (tms/jobs.py) such as
+# trash purging and document indexing, outside the web process.
+# Usage: python worker.py [--concurrency N]
+# ==========================================================
+
+import argparse
+import logging
+
+from tms import config, jobs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run TMS background jobs.")
+    parser.add_argument("--concurrency", type=int, default=config.JOB_CONCURRENCY,
+                        help="jobs run at once, each in its own process")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    jobs.run_worker(concurrency=args.concurrency)